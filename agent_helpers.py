@@ -1,11 +1,24 @@
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Union
 
 # LangChain Core (se os helpers interagirem diretamente com componentes LangChain)
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableLambda
+from langgraph.config import get_stream_writer
+
+from cache_utils import ArmazenamentoLRU
+from contabilidade_tokens import medir_chamada_llm, marcar_resposta_do_cache # Tokens, latência e cache por chamada
 
 # Importar LLM de llm_models.py
 from llm_models import llm
+from prompts import PROMPTS, TEXTOS_PROMPTS # Prompts dos agentes, compilados na importação
 
 # Importar EstadoProcessual e mapa_tarefa_no_atual de graph_definition.py (será criado depois)
 # Para evitar dependência circular no momento da criação, vamos definir o tipo EstadoProcessual
@@ -14,14 +27,60 @@ from llm_models import llm
 # e 'EstadoProcessual' seria de graph_definition.py.
 
 from settings import (
+    LLM_CACHE_ATIVO,
+    LLM_CACHE_PATH,
+    LLM_CACHE_MAX_BYTES,
+    LLM_ANALISES_TIMEOUT_SEGUNDOS,
     ADVOGADO_AUTOR, # Necessário para helper_logica_inicial_no
     # (outras constantes de ator/etapa se o helper_logica_inicial_no precisar delas diretamente)
 )
 # Nota: mapa_tarefa_no_atual será passado como argumento para helper_logica_inicial_no
 # para evitar importação direta de graph_definition aqui e potencial ciclo.
 
-def criar_prompt_e_chain(template_string: str) -> Any: # Retorna uma LangChain Runnable
-    """Cria uma cadeia simples de prompt, LLM e parser de string."""
+# Cache de respostas do LLM (LLM_CACHE_ATIVO em settings.py), aberto na primeira chamada.
+_cache_respostas_llm: Union[ArmazenamentoLRU, None] = None
+_lock_cache_respostas_llm = threading.Lock()
+
+def _obter_cache_respostas_llm() -> ArmazenamentoLRU:
+    global _cache_respostas_llm
+    with _lock_cache_respostas_llm:
+        if _cache_respostas_llm is None:
+            _cache_respostas_llm = ArmazenamentoLRU(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, comprimir=True)
+        return _cache_respostas_llm
+
+def chave_resposta_llm(modelo_llm: Any, prompt_renderizado: str) -> str:
+    """Hash do nome do modelo, da temperatura e do prompt já preenchido."""
+    identificacao = json.dumps(
+        [getattr(modelo_llm, "model", type(modelo_llm).__name__), getattr(modelo_llm, "temperature", None), prompt_renderizado],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(identificacao.encode("utf-8")).hexdigest()
+
+def _invocar_llm_com_cache(prompt: PromptValue) -> str:
+    cache = _obter_cache_respostas_llm()
+    chave = chave_resposta_llm(llm, prompt.to_string())
+    resposta = cache.obter(chave)
+    if resposta is not None:
+        return resposta.decode("utf-8")
+    texto = StrOutputParser().invoke(llm.invoke(prompt))
+    cache.gravar(chave, texto.encode("utf-8"))
+    return texto
+
+async def _ainvocar_llm_com_cache(prompt: PromptValue) -> str:
+    cache = _obter_cache_respostas_llm() # Leituras do SQLite local não justificam uma thread
+    chave = chave_resposta_llm(llm, prompt.to_string())
+    resposta = cache.obter(chave)
+    if resposta is not None:
+        return resposta.decode("utf-8")
+    texto = StrOutputParser().invoke(await llm.ainvoke(prompt))
+    cache.gravar(chave, texto.encode("utf-8"))
+    return texto
+
+def estatisticas_cache_llm() -> Union[Dict[str, int], None]:
+    """Acertos/falhas e tamanho do cache de respostas do LLM (None se o cache estiver desligado)."""
+    return _obter_cache_respostas_llm().estatisticas() if LLM_CACHE_ATIVO else None
+
+def _verificar_llm() -> None:
     if not llm:
         # Esta é uma condição crítica. Se o LLM não estiver disponível,
         # a aplicação principal (Streamlit) deve ser notificada.
@@ -30,9 +89,208 @@ def criar_prompt_e_chain(template_string: str) -> Any: # Retorna uma LangChain R
             "LLM não inicializado. "
             "Verifique a configuração da GOOGLE_API_KEY em settings.py e llm_models.py."
         )
+
+def criar_prompt_e_chain(template_string: str) -> Any: # Retorna uma LangChain Runnable
+    """
+    Cria uma cadeia simples de prompt, LLM e parser de string.
+    Com LLM_CACHE_ATIVO, prompts já respondidos (mesmo modelo e temperatura) saem do cache em disco.
+    Para os prompts fixos dos agentes, prefira obter_chain (compilado uma vez, sem reinterpretar o template).
+    A cadeia aceita invoke/batch e ainvoke/abatch.
+    """
+    _verificar_llm()
     prompt = ChatPromptTemplate.from_template(template_string)
+    if LLM_CACHE_ATIVO:
+        return prompt | RunnableLambda(_invocar_llm_com_cache, afunc=_ainvocar_llm_com_cache)
     return prompt | llm | StrOutputParser()
 
+# Cadeias dos prompts registrados em prompts.py, criadas na primeira chamada de cada id.
+_chains_por_prompt: Dict[str, Any] = {}
+_lock_chains_por_prompt = threading.Lock()
+
+def _com_cache_por_entradas(id_prompt: str, chain: Any) -> Any:
+    """Envolve a cadeia com o cache de respostas, usando como chave o id do prompt, seu texto e as variáveis."""
+    def chave_de(entradas: Dict[str, Any]) -> str:
+        return chave_resposta_llm(llm, json.dumps(
+            [id_prompt, TEXTOS_PROMPTS[id_prompt], entradas], ensure_ascii=False, sort_keys=True, default=str
+        ))
+
+    # Geradores: a cadeia envolvida continua aceitando stream/astream (resposta do cache sai de uma vez;
+    # a do LLM, em trechos, e só é gravada se o fluxo chegar ao fim). invoke/ainvoke juntam os trechos.
+    def invocar(entradas: Dict[str, Any]) -> Iterator[str]:
+        cache, chave = _obter_cache_respostas_llm(), chave_de(entradas)
+        resposta = cache.obter(chave)
+        if resposta is not None:
+            marcar_resposta_do_cache()
+            yield resposta.decode("utf-8")
+            return
+        trechos = []
+        for trecho in chain.stream(entradas):
+            trechos.append(trecho)
+            yield trecho
+        cache.gravar(chave, "".join(trechos).encode("utf-8"))
+
+    async def ainvocar(entradas: Dict[str, Any]) -> AsyncIterator[str]:
+        cache, chave = _obter_cache_respostas_llm(), chave_de(entradas)
+        resposta = cache.obter(chave)
+        if resposta is not None:
+            marcar_resposta_do_cache()
+            yield resposta.decode("utf-8")
+            return
+        trechos = []
+        async for trecho in chain.astream(entradas):
+            trechos.append(trecho)
+            yield trecho
+        cache.gravar(chave, "".join(trechos).encode("utf-8"))
+    return RunnableLambda(invocar, afunc=ainvocar)
+
+def obter_chain(id_prompt: str) -> Any: # Retorna uma LangChain Runnable
+    """
+    Cadeia prompt -> LLM -> texto de um prompt registrado em prompts.py (PROMPT_*).
+
+    O template já vem compilado e a cadeia é montada uma vez por id. Os dados do caso são passados
+    como variáveis no invoke() (ou ainvoke/abatch), então chaves '{' '}' nesses textos não quebram o prompt.
+
+    Raises:
+        EnvironmentError: Se o LLM não estiver inicializado.
+        KeyError: Se o id não estiver registrado.
+    """
+    _verificar_llm()
+    with _lock_chains_por_prompt:
+        chain = _chains_por_prompt.get(id_prompt)
+        if chain is None:
+            chain = PROMPTS[id_prompt] | llm | StrOutputParser()
+            if LLM_CACHE_ATIVO:
+                chain = _com_cache_por_entradas(id_prompt, chain)
+            _chains_por_prompt[id_prompt] = chain
+    return chain
+
+def _escritor_eventos_do_passo() -> Callable[[Any], None]:
+    """Canal de eventos do passo do grafo em execução (stream_mode "custom"); fora do grafo, descarta os eventos."""
+    try:
+        return get_stream_writer()
+    except RuntimeError: # Chamado fora de um app.stream/invoke (ex: testes dos agentes isolados)
+        return lambda evento: None
+
+def _medir_prompt(id_prompt: str, entradas: Dict[str, Any], id_processo: str, no: Union[str, None], etapa: Union[str, None]):
+    chain = obter_chain(id_prompt) # Antes da medição: sem LLM configurado, nada é registrado
+    return chain, medir_chamada_llm(id_processo, no, etapa, id_prompt, PROMPTS[id_prompt].format(**entradas))
+
+def invocar_prompt(
+    id_prompt: str,
+    entradas: Dict[str, Any],
+    id_processo: str,
+    no: Union[str, None] = None,
+    etapa: Union[str, None] = None
+) -> str:
+    """
+    invoke() do prompt registrado 'id_prompt', com tokens, latência e uso do cache registrados
+    para o processo (ver contabilidade_tokens.py).
+
+    Raises:
+        EnvironmentError: Se o LLM não estiver inicializado.
+        OrcamentoTokensExcedidoError: Se a simulação já consumiu ORCAMENTO_TOKENS_POR_SIMULACAO.
+    """
+    chain, medicao_chamada = _medir_prompt(id_prompt, entradas, id_processo, no, etapa)
+    with medicao_chamada as medicao:
+        medicao.resposta = chain.invoke(entradas, config={"callbacks": [medicao]})
+    return medicao.resposta
+
+def gerar_documento_em_fluxo(id_prompt: str, entradas: Dict[str, Any], ator: str, etapa: str, id_processo: str) -> str:
+    """
+    Gera a peça do prompt registrado 'id_prompt' com stream(), publicando cada trecho no canal de eventos
+    do passo ({"ator", "etapa", "trecho"}) para a UI exibir o texto enquanto é produzido.
+    Mesma chamada ao LLM que invoke(), registrada como em invocar_prompt; retorna o texto completo.
+    """
+    escrever_evento = _escritor_eventos_do_passo()
+    chain, medicao_chamada = _medir_prompt(id_prompt, entradas, id_processo, ator, etapa)
+    trechos: List[str] = []
+    with medicao_chamada as medicao:
+        for trecho in chain.stream(entradas, config={"callbacks": [medicao]}):
+            trechos.append(trecho)
+            escrever_evento({"ator": ator, "etapa": etapa, "trecho": trecho})
+        medicao.resposta = "".join(trechos)
+    return medicao.resposta
+
+# Análises secundárias (ex: sentimento das peças): disparadas pelos agentes e executadas com
+# ainvoke em um event loop próprio, enquanto o grafo segue para os próximos nós. Um único loop
+# de longa duração: o cliente assíncrono do Gemini fica preso ao loop em que foi criado.
+_loop_analises: Union[asyncio.AbstractEventLoop, None] = None
+# Processos que nunca forem colhidos nem descartados saem pelos mais antigos (servidor de longa duração).
+_analises_pendentes: "OrderedDict[str, Dict[str, Future]]" = OrderedDict() # id_processo -> {campo do estado: futuro}
+_lock_analises = threading.Lock()
+_MAX_PROCESSOS_COM_ANALISES = 64
+
+def _obter_loop_analises() -> asyncio.AbstractEventLoop:
+    global _loop_analises
+    with _lock_analises:
+        if _loop_analises is None:
+            _loop_analises = asyncio.new_event_loop()
+            threading.Thread(target=_loop_analises.run_forever, name="analises-llm", daemon=True).start()
+        return _loop_analises
+
+async def _analisar(id_prompt: str, entradas: Dict[str, Any], id_processo: str, no: Union[str, None], etapa: Union[str, None]) -> str:
+    chain, medicao_chamada = _medir_prompt(id_prompt, entradas, id_processo, no, etapa)
+    with medicao_chamada as medicao: # Medida no loop das análises (o contexto da chamada é o da tarefa)
+        medicao.resposta = await chain.ainvoke(entradas, config={"callbacks": [medicao]})
+    return medicao.resposta
+
+def iniciar_analise_em_segundo_plano(
+    id_processo: str,
+    campo: str,
+    id_prompt: str,
+    entradas: Dict[str, Any],
+    no: Union[str, None] = None,
+    etapa: Union[str, None] = None
+) -> None:
+    """
+    Dispara o prompt registrado 'id_prompt' sem esperar a resposta.
+    O resultado vai para o campo 'campo' do estado quando colhido por coletar_analises_em_segundo_plano.
+    """
+    futuro = asyncio.run_coroutine_threadsafe(
+        _analisar(id_prompt, entradas, id_processo, no, etapa), _obter_loop_analises()
+    )
+    with _lock_analises:
+        _analises_pendentes.setdefault(id_processo, {})[campo] = futuro
+        _analises_pendentes.move_to_end(id_processo)
+        while len(_analises_pendentes) > _MAX_PROCESSOS_COM_ANALISES:
+            id_antigo, antigas = _analises_pendentes.popitem(last=False)
+            for futuro_antigo in antigas.values():
+                futuro_antigo.cancel()
+            print(f"AVISO [analises-{id_antigo}] Análises não colhidas descartadas ({len(antigas)}).")
+
+def coletar_analises_em_segundo_plano(
+    id_processo: str,
+    timeout_segundos: float = LLM_ANALISES_TIMEOUT_SEGUNDOS
+) -> Dict[str, str]:
+    """
+    Espera as análises disparadas para o processo e retorna {campo do estado: resultado}.
+    Análises que falharem (ou excederem o timeout) retornam "Erro na análise". Chamadas
+    seguintes, sem novas análises, retornam um dicionário vazio.
+    """
+    with _lock_analises:
+        pendentes = _analises_pendentes.pop(id_processo, {})
+    resultados: Dict[str, str] = {}
+    for campo, futuro in pendentes.items():
+        try:
+            resultados[campo] = futuro.result(timeout=timeout_segundos)
+            print(f"INFO [analises-{id_processo}] {campo}: {resultados[campo]}")
+        except Exception as e:
+            futuro.cancel()
+            print(f"ERRO [analises-{id_processo}] {campo}: {e!r}")
+            resultados[campo] = "Erro na análise"
+    return resultados
+
+def descartar_analises_em_segundo_plano(id_processo: str) -> None:
+    """
+    Cancela as análises ainda não colhidas do processo, sem esperá-las (simulação interrompida
+    por erro). Sem análises pendentes, não faz nada.
+    """
+    with _lock_analises:
+        pendentes = _analises_pendentes.pop(id_processo, {})
+    for campo, futuro in pendentes.items():
+        if futuro.cancel():
+            print(f"INFO [analises-{id_processo}] {campo}: cancelada.")
+
 def helper_logica_inicial_no(
     nome_ultimo_no: str | None,
     etapa_ultimo_no: str | None,
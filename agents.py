@@ -7,15 +7,32 @@ if TYPE_CHECKING:
 
 
 from agent_helpers import (
-    criar_prompt_e_chain,
+    invocar_prompt, # Prompts registrados (dados do caso entram como variáveis), com tokens e latência contabilizados
+    gerar_documento_em_fluxo, # Peças principais em stream, com os trechos publicados para a UI
+    iniciar_analise_em_segundo_plano, # Análises secundárias (sentimento) sem bloquear o grafo
+    coletar_analises_em_segundo_plano,
     helper_logica_inicial_no,
     formatar_lista_documentos_para_prompt
 )
+from prompts import (
+    PROMPT_PETICAO_INICIAL, PROMPT_SENTIMENTO_PETICAO_INICIAL, PROMPT_MANIFESTACAO_SEM_PROVAS_AUTOR,
+    PROMPT_DESPACHO_RECEBENDO_INICIAL, PROMPT_DECISAO_SANEAMENTO, PROMPT_SENTENCA,
+    PROMPT_CONTESTACAO, PROMPT_DOCUMENTOS_REU, PROMPT_SENTIMENTO_CONTESTACAO,
+    PROMPT_MANIFESTACAO_SEM_PROVAS_REU
+)
 from settings import (
     ADVOGADO_AUTOR, JUIZ, ADVOGADO_REU,
     ETAPA_PETICAO_INICIAL, ETAPA_DESPACHO_RECEBENDO_INICIAL, ETAPA_CONTESTACAO,
     ETAPA_DECISAO_SANEAMENTO, ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR,
-    ETAPA_MANIFESTACAO_SEM_PROVAS_REU, ETAPA_SENTENCA, ETAPA_FIM_PROCESSO
+    ETAPA_MANIFESTACAO_SEM_PROVAS_REU, ETAPA_SENTENCA, ETAPA_FIM_PROCESSO,
+    TIPOS_FONTE_POR_ATOR # Tipos de modelo aceitos na busca de modelo (etapas sem modelo mapeado)
+)
+from rag_utils import obter_modelo_da_etapa # Modelo completo da etapa (MODELOS_POR_ETAPA), sem busca
+from contabilidade_tokens import consumo_do_processo # Tokens/latência das chamadas ao LLM da simulação
+from historico_processual import ( # Resumos limitados dos atos; íntegra só das peças que cada prompt usa
+    item_historico,
+    documento_da_etapa,
+    formatar_historico_para_prompt
 )
 
 
@@ -47,27 +64,10 @@ def agente_advogado_autor(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str
     retriever = estado.get("retriever") # Get retriever from state
     id_processo = estado.get("id_processo", "ID_DESCONHECIDO")
     dados_formulario = estado.get("dados_formulario_entrada", {})
-    historico_formatado = "\n".join([
-        f"- Etapa: {item['etapa']}, Ator: {item['ator']}:\n  Doc (trecho): {str(item.get('documento',''))[:150]}..."
-        for item in estado.get("historico_completo", [])
-    ])
-    if not historico_formatado: historico_formatado = "Este é o primeiro ato do processo."
-
     if etapa_atual_do_no == ETAPA_PETICAO_INICIAL:
-        modelo_texto_guia = "Modelo de Petição Inicial não carregado (RAG não disponível ou falhou)."
-        if retriever:
-            try:
-                docs_modelo_pi = retriever.get_relevant_documents(
-                    query="modelo de petição inicial cível completa e bem estruturada",
-                )
-                if docs_modelo_pi:
-                    modelo_texto_guia = docs_modelo_pi[0].page_content
-                else:
-                    print(f"AVISO [{ADVOGADO_AUTOR}-{etapa_atual_do_no}]: Nenhum modelo de PI encontrado via RAG.")
-            except Exception as e_rag:
-                print(f"ERRO [{ADVOGADO_AUTOR}-{etapa_atual_do_no}]: Falha ao buscar modelo de PI via RAG: {e_rag}")
-        else:
-            print(f"ALERTA [{ADVOGADO_AUTOR}-{etapa_atual_do_no}]: Retriever não disponível no estado.")
+        modelo_texto_guia = obter_modelo_da_etapa(
+            ETAPA_PETICAO_INICIAL, retriever, TIPOS_FONTE_POR_ATOR[ADVOGADO_AUTOR]
+        ) or "Modelo de Petição Inicial não carregado (modelo ausente e RAG não disponível ou falhou)."
 
         qualificacao_autor_form = dados_formulario.get("qualificacao_autor", "Qualificação do Autor não fornecida.")
         qualificacao_reu_form = dados_formulario.get("qualificacao_reu", "Qualificação do Réu não fornecida.")
@@ -78,41 +78,25 @@ def agente_advogado_autor(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str
         documentos_autor_lista = dados_formulario.get("documentos_autor", [])
         documentos_autor_texto_formatado = formatar_lista_documentos_para_prompt(documentos_autor_lista, "Autor")
 
-        template_prompt_pi = f"""
-        Você é um Advogado do Autor experiente e está elaborando uma Petição Inicial completa, formal e persuasiva.
-        **Processo ID:** {id_processo}
-        **Dados Base Fornecidos para a Petição:**
-        Qualificação do Autor: {qualificacao_autor_form}
-        Qualificação do Réu: {qualificacao_reu_form}
-        Natureza da Ação: {natureza_acao_form}
-        Dos Fatos: {fatos_form}
-        Do Direito (Fundamentação Jurídica): {direito_form}
-        Dos Pedidos: {pedidos_form}
-        {documentos_autor_texto_formatado}
-        **Modelo/Guia Estrutural de Petição Inicial (RAG - use para formatação, completude e referências legais, mas priorize os dados fornecidos acima para o conteúdo do caso):**
-        {modelo_texto_guia}
-        **Instruções Adicionais:**
-        1. Redija a Petição Inicial completa e bem formatada, seguindo a praxe forense.
-        2. Certifique-se de que todos os elementos dos DADOS BASE (fatos, direito, pedidos, qualificações, natureza da ação) estejam integralmente e corretamente incorporados.
-        3. No corpo da petição (especialmente na narração dos fatos ou antes dos pedidos), faça menção aos principais documentos listados em "Documentos que acompanham esta petição (Autor)", indicando sua relevância para comprovar as alegações.
-        4. Conclua com os requerimentos de praxe (data, assinatura do advogado).
-        Petição Inicial:
-        """
-        chain_pi = criar_prompt_e_chain(template_prompt_pi)
-        documento_gerado = chain_pi.invoke({})
-
-        sentimento_pi_texto_gerado = "Não analisado" # Reset before analysis
+        documento_gerado = gerar_documento_em_fluxo(PROMPT_PETICAO_INICIAL, {
+            "id_processo": id_processo,
+            "qualificacao_autor": qualificacao_autor_form,
+            "qualificacao_reu": qualificacao_reu_form,
+            "natureza_acao": natureza_acao_form,
+            "fatos": fatos_form,
+            "fundamentacao_juridica": direito_form,
+            "pedidos": pedidos_form,
+            "documentos_autor": documentos_autor_texto_formatado,
+            "modelo_texto_guia": modelo_texto_guia,
+        }, ADVOGADO_AUTOR, etapa_atual_do_no, id_processo)
+
+        # Sentimento em segundo plano: o grafo segue para o juiz sem esperar (resultado colhido na sentença).
+        sentimento_pi_texto_gerado = "Em análise"
         try:
-            prompt_sentimento_pi = f"""
-            Analise o tom e o sentimento predominante do seguinte texto jurídico (Petição Inicial).
-            Responda com uma única palavra ou expressão curta que melhor descreva o sentimento (ex: Assertivo, Conciliatório, Agressivo, Neutro, Persuasivo, Formal, Emocional, Confiante, Defensivo, Indignado, Colaborativo).
-            Seja conciso.
-            Texto da Petição Inicial:
-            {documento_gerado[:3000]}
-            Sentimento Predominante:"""
-            chain_sentimento_pi = criar_prompt_e_chain(prompt_sentimento_pi)
-            sentimento_pi_texto_gerado = chain_sentimento_pi.invoke({})
-            print(f"INFO [{ADVOGADO_AUTOR}-{etapa_atual_do_no}] Sentimento da PI: {sentimento_pi_texto_gerado}")
+            iniciar_analise_em_segundo_plano(
+                id_processo, "sentimento_peticao_inicial", PROMPT_SENTIMENTO_PETICAO_INICIAL, {"texto": documento_gerado[:3000]},
+                no=ADVOGADO_AUTOR, etapa=etapa_atual_do_no
+            )
         except Exception as e_sent:
             print(f"ERRO [{ADVOGADO_AUTOR}-{etapa_atual_do_no}] ao analisar sentimento da PI: {e_sent}")
             sentimento_pi_texto_gerado = "Erro na análise"
@@ -121,34 +105,23 @@ def agente_advogado_autor(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str
     elif etapa_atual_do_no == ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR:
         decisao_saneamento_recebida = estado.get("documento_gerado_na_etapa_recente", "ERRO: Decisão de Saneamento não encontrada no estado.")
         pontos_controvertidos = estado.get("pontos_controvertidos_saneamento", "Pontos controvertidos não definidos na decisão de saneamento.")
-        historico_completo_formatado_para_prompt = "\n".join([f"### Documento da Etapa: {item['etapa']} (Ator: {item['ator']})\n{item['documento']}\n---" for item in estado.get("historico_completo", [])])
-
-        template_prompt_manifestacao_autor = f"""
-        Você é o Advogado do Autor. O Juiz proferiu a Decisão de Saneamento e intimou as partes para especificarem as provas que pretendem produzir, ou manifestarem desinteresse na produção de mais provas.
-        Seu cliente (Autor) informou que não possui mais provas a produzir e deseja o julgamento antecipado da lide, se o Réu também não tiver provas.
-        **Processo ID:** {id_processo}
-        **Decisão de Saneamento Recebida do Juiz:**
-        {decisao_saneamento_recebida}
-        **Pontos Controvertidos Fixados na Decisão de Saneamento:**
-        {pontos_controvertidos}
-        **Histórico Processual Anterior (para contexto):**
-        {historico_completo_formatado_para_prompt}
-        **Instruções:**
-        1. Redija uma petição de "Manifestação Sobre Provas (Autor)".
-        2. Na petição, declare que o Autor não tem outras provas a produzir, além daquelas já constantes nos autos (documentais).
-        3. Requeira o julgamento do processo no estado em que se encontra (julgamento antecipado do mérito), caso o Réu também não especifique provas a produzir ou se as provas especificadas por ele forem apenas documentais já apresentadas ou impertinentes.
-        4. Mantenha a formalidade e praxe forense. Conclua com data e assinatura do advogado.
-        Manifestação Sobre Provas (Autor):
-        """
-        chain_manifestacao_autor = criar_prompt_e_chain(template_prompt_manifestacao_autor)
-        documento_gerado = chain_manifestacao_autor.invoke({})
+        historico_resumido = formatar_historico_para_prompt(
+            estado.get("historico_completo", []), etapas_em_integra=(ETAPA_DECISAO_SANEAMENTO,)
+        )
+
+        documento_gerado = gerar_documento_em_fluxo(PROMPT_MANIFESTACAO_SEM_PROVAS_AUTOR, {
+            "id_processo": id_processo,
+            "decisao_saneamento": decisao_saneamento_recebida,
+            "pontos_controvertidos": pontos_controvertidos,
+            "historico": historico_resumido,
+        }, ADVOGADO_AUTOR, etapa_atual_do_no, id_processo)
         proximo_ator_logico = ADVOGADO_REU
     else:
         print(f"AVISO [{ADVOGADO_AUTOR}]: Lógica para etapa '{etapa_atual_do_no}' não implementada completamente.")
         documento_gerado = f"Conteúdo para {ADVOGADO_AUTOR} na etapa {etapa_atual_do_no}."
 
     print(f"INFO [{ADVOGADO_AUTOR}-{etapa_atual_do_no}] Documento Gerado (trecho): {documento_gerado[:250]}...")
-    novo_historico_item = {"etapa": etapa_atual_do_no, "ator": ADVOGADO_AUTOR, "documento": documento_gerado}
+    novo_historico_item = item_historico(etapa_atual_do_no, ADVOGADO_AUTOR, documento_gerado)
 
     # Retorna apenas os campos que este agente modifica ou que são essenciais para o próximo passo.
     # O LangGraph se encarrega de mesclar isso com o estado existente.
@@ -160,6 +133,7 @@ def agente_advogado_autor(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str
         "historico_completo": estado.get("historico_completo", []) + [novo_historico_item],
         "manifestacao_autor_sem_provas": estado.get("manifestacao_autor_sem_provas", False) or (etapa_atual_do_no == ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR),
         "sentimento_peticao_inicial": sentimento_pi_texto_gerado,
+        "consumo_llm": consumo_do_processo(id_processo),
     }
 
 def agente_juiz(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, str | None, str], str]) -> Dict[str, Any]:
@@ -185,45 +159,21 @@ def agente_juiz(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, s
     retriever = estado.get("retriever")
     id_processo = estado.get("id_processo", "ID_DESCONHECIDO")
     documento_da_parte_para_analise = estado.get("documento_gerado_na_etapa_recente", "Nenhuma peça recente para análise.")
-    historico_formatado = "\n".join([f"- Etapa: {item['etapa']}, Ator: {item['ator']}:\n  Doc: {str(item.get('documento',''))[:150]}..." for item in estado.get("historico_completo", [])])
-    if not historico_formatado: historico_formatado = "Histórico não disponível."
+    historico_completo = estado.get("historico_completo", [])
 
     if etapa_atual_do_no == ETAPA_DESPACHO_RECEBENDO_INICIAL:
-        modelo_texto_guia = "Modelo de Despacho não carregado."
-        if retriever:
-            try:
-                docs_modelo_despacho = retriever.get_relevant_documents(query="modelo de despacho judicial cível recebendo petição inicial e determinando citação")
-                if docs_modelo_despacho: modelo_texto_guia = docs_modelo_despacho[0].page_content
-            except Exception as e_rag: print(f"ERRO RAG [{JUIZ}-{etapa_atual_do_no}]: {e_rag}")
-        else: print(f"ALERTA [{JUIZ}-{etapa_atual_do_no}]: Retriever não disponível.")
-
-        template_prompt = f"""
-        Você é um Juiz de Direito. Analise a Petição Inicial apresentada e, se estiver em ordem, profira um despacho inicial determinando a citação do réu.
-        Considere os documentos que acompanham a inicial, conforme nela mencionados.
-        **Processo ID:** {id_processo}
-        **Petição Inicial apresentada pelo Autor (pode incluir menção a documentos anexos):**
-        {documento_da_parte_para_analise}
-        **Modelo/Guia de Despacho (use como referência para estrutura e formalidades):**
-        {modelo_texto_guia}
-        **Histórico Processual (se houver):**
-        {historico_formatado}
-        ---
-        Redija o Despacho Inicial. Se a petição estiver apta, defira a inicial e ordene a citação do réu para apresentar contestação no prazo legal.
-        Mencione brevemente o recebimento da inicial e dos documentos que a instruem, se relevante.
-        Despacho Inicial:
-        """
-        chain = criar_prompt_e_chain(template_prompt)
-        documento_gerado = chain.invoke({})
+        modelo_texto_guia = obter_modelo_da_etapa(ETAPA_DESPACHO_RECEBENDO_INICIAL, retriever, TIPOS_FONTE_POR_ATOR[JUIZ]) or "Modelo de Despacho não carregado."
+
+        documento_gerado = gerar_documento_em_fluxo(PROMPT_DESPACHO_RECEBENDO_INICIAL, {
+            "id_processo": id_processo,
+            "peticao_inicial": documento_da_parte_para_analise,
+            "modelo_texto_guia": modelo_texto_guia,
+            "historico": formatar_historico_para_prompt(historico_completo, etapas_em_integra=(ETAPA_PETICAO_INICIAL,)),
+        }, JUIZ, etapa_atual_do_no, id_processo)
         proximo_ator_logico = ADVOGADO_REU
 
     elif etapa_atual_do_no == ETAPA_DECISAO_SANEAMENTO:
-        modelo_texto_guia = "Modelo de Saneamento não carregado."
-        if retriever:
-            try:
-                docs_modelo_saneamento = retriever.get_relevant_documents(query="modelo de decisão de saneamento e organização do processo cível")
-                if docs_modelo_saneamento: modelo_texto_guia = docs_modelo_saneamento[0].page_content
-            except Exception as e_rag: print(f"ERRO RAG [{JUIZ}-{etapa_atual_do_no}]: {e_rag}")
-        else: print(f"ALERTA [{JUIZ}-{etapa_atual_do_no}]: Retriever não disponível.")
+        modelo_texto_guia = obter_modelo_da_etapa(ETAPA_DECISAO_SANEAMENTO, retriever, TIPOS_FONTE_POR_ATOR[JUIZ]) or "Modelo de Saneamento não carregado."
 
         documentos_autor_lista = estado.get("dados_formulario_entrada", {}).get("documentos_autor", [])
         documentos_autor_texto = formatar_lista_documentos_para_prompt(documentos_autor_lista, "Autor")
@@ -231,31 +181,14 @@ def agente_juiz(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, s
         documentos_reu_texto = formatar_lista_documentos_para_prompt(documentos_reu_lista, "Réu")
         # 'documento_da_parte_para_analise' aqui é a contestação.
 
-        template_prompt = f"""
-        Você é um Juiz de Direito. O processo está na fase de saneamento após a apresentação da contestação.
-        Analise a Petição Inicial (no histórico), a Contestação e os documentos juntados por ambas as partes.
-        **Processo ID:** {id_processo}
-        **Petição Inicial e Documentos do Autor (resumo/menção - conteúdo completo no histórico):**
-        {documentos_autor_texto}
-        **Contestação do Réu e Documentos do Réu (para análise):**
-        {documento_da_parte_para_analise} 
-        {documentos_reu_texto} 
-        **Modelo/Guia de Decisão de Saneamento (use como referência):**
-        {modelo_texto_guia}
-        **Histórico Processual Anterior:**
-        {historico_formatado}
-        ---
-        Tarefa: Redija a Decisão de Saneamento e Organização do Processo.
-        1. Verifique preliminares e condições da ação.
-        2. Delimite as questões de fato sobre as quais recairá a atividade probatória (PONTOS CONTROVERTIDOS).
-        3. Especifique os meios de prova admitidos.
-        4. Defina as questões de direito relevantes para a decisão do mérito.
-        5. Intime as partes para especificarem as provas que pretendem produzir, advertindo que audiência não está prevista neste MVP.
-        Certifique-se de que a decisão seja clara e objetiva.
-        Decisão de Saneamento:
-        """
-        chain = criar_prompt_e_chain(template_prompt)
-        documento_gerado = chain.invoke({})
+        documento_gerado = gerar_documento_em_fluxo(PROMPT_DECISAO_SANEAMENTO, {
+            "id_processo": id_processo,
+            "documentos_autor": documentos_autor_texto,
+            "contestacao": documento_da_parte_para_analise,
+            "documentos_reu": documentos_reu_texto,
+            "modelo_texto_guia": modelo_texto_guia,
+            "historico": formatar_historico_para_prompt(historico_completo, etapas_em_integra=(ETAPA_CONTESTACAO,)),
+        }, JUIZ, etapa_atual_do_no, id_processo)
         proximo_ator_logico = ADVOGADO_AUTOR
 
         try:
@@ -271,60 +204,41 @@ def agente_juiz(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, s
             pontos_controvertidos_definidos_nesta_etapa = "Erro na extração dos pontos controvertidos."
 
     elif etapa_atual_do_no == ETAPA_SENTENCA:
-        peticao_inicial_completa, contestacao_completa, decisao_saneamento_completa = "N/A", "N/A", "N/A"
-        manifestacao_autor_sem_provas_texto, manifestacao_reu_sem_provas_texto = "N/A", "N/A"
-        for item in estado.get("historico_completo", []):
-            if item['etapa'] == ETAPA_PETICAO_INICIAL: peticao_inicial_completa = item['documento']
-            elif item['etapa'] == ETAPA_CONTESTACAO: contestacao_completa = item['documento']
-            elif item['etapa'] == ETAPA_DECISAO_SANEAMENTO: decisao_saneamento_completa = item['documento']
-            elif item['etapa'] == ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR: manifestacao_autor_sem_provas_texto = item['documento']
-            elif item['etapa'] == ETAPA_MANIFESTACAO_SEM_PROVAS_REU: manifestacao_reu_sem_provas_texto = item['documento']
-
-        modelo_texto_guia = "Modelo de Sentença não carregado."
-        if retriever:
-            try:
-                docs_modelo_sentenca = retriever.get_relevant_documents(query="modelo de sentença cível completa de mérito")
-                if docs_modelo_sentenca: modelo_texto_guia = docs_modelo_sentenca[0].page_content
-            except Exception as e_rag: print(f"ERRO RAG [{JUIZ}-{etapa_atual_do_no}]: {e_rag}")
-        else: print(f"ALERTA [{JUIZ}-{etapa_atual_do_no}]: Retriever não disponível.")
+        # Peças usadas na íntegra; o restante do histórico entra como resumo.
+        etapas_em_integra_sentenca = (
+            ETAPA_PETICAO_INICIAL, ETAPA_CONTESTACAO, ETAPA_DECISAO_SANEAMENTO,
+            ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR, ETAPA_MANIFESTACAO_SEM_PROVAS_REU
+        )
+        peticao_inicial_completa, contestacao_completa, decisao_saneamento_completa, \
+            manifestacao_autor_sem_provas_texto, manifestacao_reu_sem_provas_texto = (
+                documento_da_etapa(historico_completo, etapa) for etapa in etapas_em_integra_sentenca
+            )
+
+        modelo_texto_guia = obter_modelo_da_etapa(ETAPA_SENTENCA, retriever, TIPOS_FONTE_POR_ATOR[JUIZ]) or "Modelo de Sentença não carregado."
         
         documentos_autor_lista_estado = estado.get("dados_formulario_entrada", {}).get("documentos_autor", [])
         documentos_autor_texto_formatado_estado = formatar_lista_documentos_para_prompt(documentos_autor_lista_estado, "Autor")
         documentos_reu_lista_estado = estado.get("documentos_juntados_pelo_reu", [])
         documentos_reu_texto_formatado_estado = formatar_lista_documentos_para_prompt(documentos_reu_lista_estado, "Réu")
 
-        template_prompt_sentenca = f"""
-        Você é um Juiz de Direito e deve proferir a Sentença neste processo.
-        As partes (Autor e Réu) manifestaram desinteresse na produção de outras provas, requerendo o julgamento antecipado da lide.
-        **Processo ID:** {id_processo}
-        **Peças Processuais Principais e Histórico Completo (para sua análise):**
-        Petição Inicial: {peticao_inicial_completa}
-        --- Documentos do Autor (listados na inicial ou formulário): {documentos_autor_texto_formatado_estado}
-        Contestação: {contestacao_completa}
-        --- Documentos do Réu (listados na contestação ou gerados): {documentos_reu_texto_formatado_estado}
-        Decisão de Saneamento (contém os pontos controvertidos): {decisao_saneamento_completa}
-        Manifestação do Autor sobre Provas: {manifestacao_autor_sem_provas_texto}
-        Manifestação do Réu sobre Provas: {manifestacao_reu_sem_provas_texto}
-        **Modelo/Guia de Sentença (use como referência para estrutura e formalidades):**
-        {modelo_texto_guia}
-        **Histórico Processual Completo Adicional (se necessário):**
-        {historico_formatado}
-        ---
-        **Instruções para a Sentença:**
-        1. Elabore um relatório conciso.
-        2. Apresente a fundamentação, analisando as questões de fato e de direito, examinando as provas (documentais) em relação aos pontos controvertidos.
-        3. Profira o dispositivo (procedente, parcialmente procedente ou improcedente).
-        4. Condene a parte vencida em custas e honorários (ex: 10%).
-        Sentença:
-        """
-        chain_sentenca = criar_prompt_e_chain(template_prompt_sentenca)
-        documento_gerado = chain_sentenca.invoke({})
+        documento_gerado = gerar_documento_em_fluxo(PROMPT_SENTENCA, {
+            "id_processo": id_processo,
+            "peticao_inicial": peticao_inicial_completa,
+            "documentos_autor": documentos_autor_texto_formatado_estado,
+            "contestacao": contestacao_completa,
+            "documentos_reu": documentos_reu_texto_formatado_estado,
+            "decisao_saneamento": decisao_saneamento_completa,
+            "manifestacao_autor": manifestacao_autor_sem_provas_texto,
+            "manifestacao_reu": manifestacao_reu_sem_provas_texto,
+            "modelo_texto_guia": modelo_texto_guia,
+            "historico": formatar_historico_para_prompt(historico_completo, etapas_em_integra=etapas_em_integra_sentenca),
+        }, JUIZ, etapa_atual_do_no, id_processo)
         proximo_ator_logico = ETAPA_FIM_PROCESSO
     else:
         print(f"AVISO [{JUIZ}]: Lógica para etapa '{etapa_atual_do_no}' não implementada.")
 
     print(f"INFO [{JUIZ}-{etapa_atual_do_no}] Documento Gerado (trecho): {documento_gerado[:250]}...")
-    novo_historico_item = {"etapa": etapa_atual_do_no, "ator": JUIZ, "documento": documento_gerado}
+    novo_historico_item = item_historico(etapa_atual_do_no, JUIZ, documento_gerado)
 
     return {
         "nome_do_ultimo_no_executado": JUIZ,
@@ -333,6 +247,9 @@ def agente_juiz(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, s
         "documento_gerado_na_etapa_recente": documento_gerado,
         "historico_completo": estado.get("historico_completo", []) + [novo_historico_item],
         "pontos_controvertidos_saneamento": pontos_controvertidos_definidos_nesta_etapa,
+        # Fim do processo: colhe as análises disparadas em segundo plano (sentimentos das peças)
+        **(coletar_analises_em_segundo_plano(id_processo) if proximo_ator_logico == ETAPA_FIM_PROCESSO else {}),
+        "consumo_llm": consumo_do_processo(id_processo), # Depois da coleta: inclui as análises colhidas
     }
 
 def agente_advogado_reu(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str | None, str | None, str], str]) -> Dict[str, Any]:
@@ -361,66 +278,43 @@ def agente_advogado_reu(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str |
     retriever = estado.get("retriever")
     id_processo = estado.get("id_processo", "ID_DESCONHECIDO")
     documento_relevante_anterior = estado.get("documento_gerado_na_etapa_recente", "Nenhum doc anterior informado.")
-    historico_formatado = "\n".join([f"- Etapa: {item['etapa']}, Ator: {item['ator']}:\n  Doc: {str(item.get('documento',''))[:150]}..." for item in estado.get("historico_completo", [])])
-    if not historico_formatado: historico_formatado = "Histórico não disponível."
+    historico_completo = estado.get("historico_completo", [])
 
 
     if etapa_atual_do_no == ETAPA_CONTESTACAO:
-        peticao_inicial_autor_texto_completo = "Petição Inicial do Autor não encontrada no histórico."
-        for item_hist in reversed(estado.get("historico_completo", [])): # Procura de trás para frente
-            if item_hist["etapa"] == ETAPA_PETICAO_INICIAL and item_hist["ator"] == ADVOGADO_AUTOR:
-                peticao_inicial_autor_texto_completo = item_hist["documento"]
-                break
+        peticao_inicial_autor_texto_completo = documento_da_etapa(
+            historico_completo, ETAPA_PETICAO_INICIAL, "Petição Inicial do Autor não encontrada no histórico."
+        )
         
-        modelo_texto_guia = "Modelo de Contestação não carregado."
-        if retriever:
-            try:
-                docs_modelo_contestacao = retriever.get_relevant_documents(query="modelo de contestação cível completa e bem fundamentada")
-                if docs_modelo_contestacao: modelo_texto_guia = docs_modelo_contestacao[0].page_content
-            except Exception as e_rag: print(f"ERRO RAG [{ADVOGADO_REU}-{etapa_atual_do_no}]: {e_rag}")
-        else: print(f"ALERTA [{ADVOGADO_REU}-{etapa_atual_do_no}]: Retriever não disponível.")
-
-        template_prompt_contestacao = f"""
-        Você é um Advogado do Réu experiente. Sua tarefa é elaborar uma Contestação completa e robusta.
-        **Processo ID:** {id_processo}
-        **Despacho Judicial Recebido (determinando a citação/contestação):**
-        {documento_relevante_anterior}
-        **Petição Inicial do Autor (que originou esta contestação e pode mencionar documentos juntados pelo Autor):**
-        {peticao_inicial_autor_texto_completo}
-        **Modelo/Guia de Contestação (RAG - use para estrutura, formalidades e teses defensivas comuns):**
-        {modelo_texto_guia}
-        **Histórico Processual Anterior:**
-        {historico_formatado}
-        ---
-        Instruções para a Contestação:
-        1. Analise cuidadosamente a Petição Inicial do Autor.
-        2. Apresente as defesas processuais (preliminares), se houver (ex: incompetência, inépcia da inicial).
-        3. No mérito, impugne especificamente os fatos narrados pelo Autor e os fundamentos jurídicos apresentados.
-        4. Apresente a versão dos fatos sob a ótica do Réu e a fundamentação jurídica que ampara sua defesa.
-        5. Formule os pedidos da contestação (ex: acolhimento das preliminares, improcedência dos pedidos do autor, condenação em custas e honorários).
-        6. A contestação deve ser bem estruturada.
-        Contestação:
-        """
-        chain_contestacao = criar_prompt_e_chain(template_prompt_contestacao)
-        documento_gerado_principal = chain_contestacao.invoke({})
+        modelo_texto_guia = obter_modelo_da_etapa(ETAPA_CONTESTACAO, retriever, TIPOS_FONTE_POR_ATOR[ADVOGADO_REU]) or "Modelo de Contestação não carregado."
+
+        documento_gerado_principal = gerar_documento_em_fluxo(PROMPT_CONTESTACAO, {
+            "id_processo": id_processo,
+            "despacho": documento_relevante_anterior,
+            "peticao_inicial": peticao_inicial_autor_texto_completo,
+            "modelo_texto_guia": modelo_texto_guia,
+            "historico": formatar_historico_para_prompt(historico_completo, etapas_em_integra=(ETAPA_PETICAO_INICIAL,)),
+        }, ADVOGADO_REU, etapa_atual_do_no, id_processo)
+
+        # Sentimento em segundo plano, em paralelo à lista de documentos (ambos só dependem da contestação).
+        sentimento_contestacao_texto_gerado = "Em análise"
+        try:
+            iniciar_analise_em_segundo_plano(
+                id_processo, "sentimento_contestacao", PROMPT_SENTIMENTO_CONTESTACAO, {"texto": documento_gerado_principal[:3000]},
+                no=ADVOGADO_REU, etapa=etapa_atual_do_no
+            )
+        except Exception as e_sent_cont:
+            print(f"ERRO [{ADVOGADO_REU}-{etapa_atual_do_no}] ao analisar sentimento da Contestação: {e_sent_cont}")
+            sentimento_contestacao_texto_gerado = "Erro na análise"
 
         # Gerar lista de documentos do Réu
         fatos_gerais_caso = estado.get("dados_formulario_entrada", {}).get("fatos", "Fatos do caso não disponíveis.")
         pi_resumo_para_prompt_docs = peticao_inicial_autor_texto_completo[:1000] + ("..." if len(peticao_inicial_autor_texto_completo) > 1000 else peticao_inicial_autor_texto_completo)
-        prompt_docs_reu_template = f"""
-        Com base na Petição Inicial do Autor, na Contestação do Réu recém-elaborada, e nos fatos gerais do caso, você deve listar de 2 a 4 documentos principais que o Réu provavelmente juntaria para dar suporte à sua defesa.
-        Para cada documento, forneça o tipo e uma descrição MUITO SUCINTA (1 frase, máximo 20 palavras).
-        Petição Inicial do Autor (Resumo): {pi_resumo_para_prompt_docs}
-        Contestação do Réu (Completa - elaborada para este caso): {documento_gerado_principal}
-        Fatos Gerais do Caso (fornecidos no início da simulação): {fatos_gerais_caso}
-        Sua resposta DEVE SER uma lista de strings, onde cada string representa um documento no formato: "Tipo do Documento: Descrição sucinta."
-        Exemplo:
-        Documento de Identidade do Réu: RG e CPF para qualificação.
-        Contrato de Locação: Cópia do contrato que estabelece obrigações.
-        Liste os documentos do Réu:
-        """
-        chain_docs_reu = criar_prompt_e_chain(prompt_docs_reu_template)
-        resposta_docs_reu_str = chain_docs_reu.invoke({})
+        resposta_docs_reu_str = invocar_prompt(PROMPT_DOCUMENTOS_REU, {
+            "peticao_inicial_resumo": pi_resumo_para_prompt_docs,
+            "contestacao": documento_gerado_principal,
+            "fatos": fatos_gerais_caso,
+        }, id_processo, ADVOGADO_REU, etapa_atual_do_no)
         
         parsed_docs_reu = []
         if resposta_docs_reu_str and resposta_docs_reu_str.strip():
@@ -440,53 +334,25 @@ def agente_advogado_reu(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str |
 
         documentos_reu_texto_para_anexar = formatar_lista_documentos_para_prompt(lista_documentos_juntados_pelo_reu_final, "Réu")
         documento_gerado_principal += f"\n\n---\n{documentos_reu_texto_para_anexar}"
-        
-        sentimento_contestacao_texto_gerado = "Não analisado" # Reset
-        try:
-            prompt_sentimento_contestacao = f"""
-            Analise o tom e o sentimento predominante do seguinte texto jurídico (Contestação).
-            Responda com uma única palavra ou expressão curta (ex: Assertivo, Conciliatório, Agressivo, Neutro).
-            Texto da Contestação:
-            {documento_gerado_principal[:3000]}
-            Sentimento Predominante:"""
-            chain_sentimento_contestacao = criar_prompt_e_chain(prompt_sentimento_contestacao)
-            sentimento_contestacao_texto_gerado = chain_sentimento_contestacao.invoke({})
-            print(f"INFO [{ADVOGADO_REU}-{etapa_atual_do_no}] Sentimento da Contestação: {sentimento_contestacao_texto_gerado}")
-        except Exception as e_sent_cont:
-            print(f"ERRO [{ADVOGADO_REU}-{etapa_atual_do_no}] ao analisar sentimento da Contestação: {e_sent_cont}")
-            sentimento_contestacao_texto_gerado = "Erro na análise"
         proximo_ator_logico = JUIZ
 
     elif etapa_atual_do_no == ETAPA_MANIFESTACAO_SEM_PROVAS_REU:
-        decisao_saneamento_juiz = "Decisão de Saneamento não encontrada no histórico."
-        for item_hist in reversed(estado.get("historico_completo", [])):
-            if item_hist["etapa"] == ETAPA_DECISAO_SANEAMENTO and item_hist["ator"] == JUIZ:
-                decisao_saneamento_juiz = item_hist["documento"]
-                break
+        decisao_saneamento_juiz = documento_da_etapa(
+            historico_completo, ETAPA_DECISAO_SANEAMENTO, "Decisão de Saneamento não encontrada no histórico."
+        )
         manifestacao_autor_recente = estado.get("documento_gerado_na_etapa_recente", "Manifestação do Autor não encontrada.")
         pontos_controvertidos = estado.get("pontos_controvertidos_saneamento", "Pontos controvertidos não definidos.")
-        historico_completo_formatado_para_prompt = "\n".join([f"### Documento da Etapa: {item['etapa']} (Ator: {item['ator']})\n{item['documento']}\n---" for item in estado.get("historico_completo", [])])
+        historico_resumido = formatar_historico_para_prompt(
+            historico_completo, etapas_em_integra=(ETAPA_DECISAO_SANEAMENTO, ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR)
+        )
         
-        template_prompt_manifestacao_reu = f"""
-        Você é o Advogado do Réu. O Juiz proferiu a Decisão de Saneamento e o Autor já se manifestou informando não ter mais provas a produzir.
-        Seu cliente (Réu) também informou que não possui mais provas a produzir e deseja o julgamento antecipado da lide.
-        **Processo ID:** {id_processo}
-        **Decisão de Saneamento do Juiz (para referência):**
-        {decisao_saneamento_juiz}
-        **Manifestação do Autor Recebida:**
-        {manifestacao_autor_recente}
-        **Pontos Controvertidos Fixados na Decisão de Saneamento:**
-        {pontos_controvertidos}
-        **Histórico Processual Anterior (para contexto):**
-        {historico_completo_formatado_para_prompt}
-        **Instruções:**
-        1. Redija uma petição de "Manifestação Sobre Provas (Réu)".
-        2. Na petição, declare que o Réu também não tem outras provas a produzir.
-        3. Requeira o julgamento do processo no estado em que se encontra.
-        Manifestação Sobre Provas (Réu):
-        """
-        chain_manifestacao_reu = criar_prompt_e_chain(template_prompt_manifestacao_reu)
-        documento_gerado_principal = chain_manifestacao_reu.invoke({})
+        documento_gerado_principal = gerar_documento_em_fluxo(PROMPT_MANIFESTACAO_SEM_PROVAS_REU, {
+            "id_processo": id_processo,
+            "decisao_saneamento": decisao_saneamento_juiz,
+            "manifestacao_autor": manifestacao_autor_recente,
+            "pontos_controvertidos": pontos_controvertidos,
+            "historico": historico_resumido,
+        }, ADVOGADO_REU, etapa_atual_do_no, id_processo)
         proximo_ator_logico = JUIZ
         # Mantém os documentos do réu que já estavam no estado (da contestação)
         lista_documentos_juntados_pelo_reu_final = estado.get("documentos_juntados_pelo_reu", [])
@@ -495,7 +361,7 @@ def agente_advogado_reu(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str |
         print(f"AVISO [{ADVOGADO_REU}]: Lógica para etapa '{etapa_atual_do_no}' não implementada.")
 
     print(f"INFO [{ADVOGADO_REU}-{etapa_atual_do_no}] Documento Gerado (trecho): {documento_gerado_principal[:250]}...")
-    novo_historico_item = {"etapa": etapa_atual_do_no, "ator": ADVOGADO_REU, "documento": documento_gerado_principal}
+    novo_historico_item = item_historico(etapa_atual_do_no, ADVOGADO_REU, documento_gerado_principal)
 
     return {
         "nome_do_ultimo_no_executado": ADVOGADO_REU,
@@ -506,6 +372,7 @@ def agente_advogado_reu(estado: EstadoProcessual, mapa_tarefas: Dict[Tuple[str |
         "manifestacao_reu_sem_provas": estado.get("manifestacao_reu_sem_provas", False) or (etapa_atual_do_no == ETAPA_MANIFESTACAO_SEM_PROVAS_REU),
         "documentos_juntados_pelo_reu": lista_documentos_juntados_pelo_reu_final,
         "sentimento_contestacao": sentimento_contestacao_texto_gerado,
+        "consumo_llm": consumo_do_processo(id_processo),
     }
 
 
@@ -543,12 +410,13 @@ if __name__ == '__main__':
         },
         "documentos_juntados_pelo_reu": None,
         "sentimento_peticao_inicial": None,
-        "sentimento_contestacao": None
+        "sentimento_contestacao": None,
+        "consumo_llm": None
     }
     print("\nTestando agente_advogado_autor (Petição Inicial - sem LLM real):")
     try:
         # Para um teste real, o LLM precisa estar configurado
-        # Aqui, a chamada a criar_prompt_e_chain pode falhar se o LLM não estiver ok
+        # Aqui, a chamada a obter_chain pode falhar se o LLM não estiver ok
         resultado_autor = agente_advogado_autor(estado_inicial_teste_autor, mapa_teste_agentes)
         print(f"  Resultado do agente_advogado_autor (etapa concluída): {resultado_autor.get('etapa_concluida_pelo_ultimo_no')}")
         print(f"  Próximo ator sugerido: {resultado_autor.get('proximo_ator_sugerido_pelo_ultimo_no')}")
@@ -0,0 +1,335 @@
+# benchmark_rag.py
+#
+# Benchmark da camada de recuperação (RAG) com corpora jurídicos sintéticos e embeddings locais
+# (sem rede, sem cota). Mede ingestão, construção do índice, tamanho em disco, tempo de abertura,
+# latência das consultas (percentis) e recall@k contra um conjunto de consultas rotuladas.
+#
+# Uso:
+#   python benchmark_rag.py                                  # 1k, 10k e 100k chunks
+#   python benchmark_rag.py --tamanhos 1000 5000 --saida relatorio.json
+#   python benchmark_rag.py --baseline relatorio_anterior.json   # sai com código 1 em caso de regressão
+#   python benchmark_rag.py --tipos-indice sq8 ivfpq             # também mede índices comprimidos vs. exato
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+# Sem tracing do LangSmith: o envio de traces distorceria a latência e exigiria rede.
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+from busca_lexical import IndiceBM25
+from compressao_vetorial import construir_indice_comprimido, medir_perda_recall, vetores_exatos
+from embeddings_utils import EmbeddingsHashLocal
+from index_storage import salvar_versao_indice, abrir_versao_indice
+from rag_utils import CamadaBusca, RetrieverDuasCamadas
+from settings import RETRIEVER_SEARCH_K, RETRIEVER_FETCH_K
+
+
+SECOES = {
+    "DOS FATOS": [
+        "O autor celebrou contrato com a ré e, desde então, vem sofrendo prejuízos decorrentes de {tema}.",
+        "Em diversas ocasiões o autor buscou a solução administrativa do problema de {tema}, sem sucesso.",
+        "A conduta da ré, relacionada a {tema}, causou transtornos que ultrapassam o mero aborrecimento.",
+    ],
+    "DO DIREITO": [
+        "A relação é de consumo, aplicando-se o Código de Defesa do Consumidor ao caso de {tema}.",
+        "Nos termos do art. 14 do CDC, o fornecedor responde objetivamente pelos danos de {tema}.",
+        "A jurisprudência do STJ reconhece o dever de indenizar em hipóteses de {tema}.",
+    ],
+    "DOS PEDIDOS": [
+        "Requer a condenação da ré ao pagamento de indenização por danos morais em razão de {tema}.",
+        "Requer a inversão do ônus da prova e a citação da ré para responder aos termos de {tema}.",
+        "Requer a procedência dos pedidos, com a declaração de inexistência do débito ligado a {tema}.",
+    ],
+    "RELATÓRIO": [
+        "Trata-se de ação de procedimento comum em que se discute {tema}.",
+        "Citada, a ré apresentou contestação negando a ocorrência de {tema}.",
+        "As partes foram intimadas a especificar provas quanto a {tema}.",
+    ],
+    "FUNDAMENTAÇÃO": [
+        "O feito comporta julgamento antecipado, nos termos do art. 355, I, do CPC, quanto a {tema}.",
+        "Restou comprovada a falha na prestação do serviço no que se refere a {tema}.",
+        "O quantum indenizatório deve observar a razoabilidade diante de {tema}.",
+    ],
+    "DISPOSITIVO": [
+        "Ante o exposto, JULGO PROCEDENTE o pedido para condenar a ré pelos danos de {tema}.",
+        "Condeno a ré ao pagamento das custas e honorários, fixados em 10% sobre a condenação por {tema}.",
+        "Publique-se. Registre-se. Intimem-se. Processo relativo a {tema}.",
+    ],
+}
+
+TEMAS = [
+    "negativação indevida", "cobrança abusiva", "atraso na entrega do imóvel", "negativa de cobertura do plano de saúde",
+    "cancelamento de voo", "vício do produto", "descontos indevidos em benefício previdenciário", "rescisão contratual",
+    "corte no fornecimento de energia", "fraude bancária", "extravio de bagagem", "cláusula abusiva em contrato de adesão",
+]
+
+# Como as consultas se referem a cada seção e tema, com outras palavras (as consultas nunca
+# repetem o texto dos chunks nem citam o nome da parte).
+PARAFRASES_SECOES = {
+    "DOS FATOS": ["fatos narrados pelo autor sobre {tema}", "o que aconteceu com o consumidor: {tema}"],
+    "DO DIREITO": ["fundamento jurídico no consumidor para {tema}", "responsabilidade do fornecedor por {tema}"],
+    "DOS PEDIDOS": ["o que o autor pede quanto a {tema}", "pedido de indenização moral por {tema}"],
+    "RELATÓRIO": ["resumo do processo que discute {tema}", "relatório do caso de {tema}"],
+    "FUNDAMENTAÇÃO": ["razões de decidir acerca de {tema}", "fundamentos do juiz sobre {tema}"],
+    "DISPOSITIVO": ["resultado do julgamento de {tema}", "parte final da sentença que condena por {tema}"],
+}
+PARAFRASES_TEMAS = {
+    "negativação indevida": ["nome negativado sem dívida", "inscrição irregular em cadastro de inadimplentes"],
+    "cobrança abusiva": ["cobranças excessivas", "valores cobrados de forma abusiva"],
+    "atraso na entrega do imóvel": ["imóvel entregue atrasado", "demora da construtora em entregar o apartamento"],
+    "negativa de cobertura do plano de saúde": ["plano de saúde que negou o procedimento", "recusa de cobertura do convênio"],
+    "cancelamento de voo": ["voo cancelado pela companhia aérea", "companhia que cancelou a viagem"],
+    "vício do produto": ["produto com defeito", "mercadoria viciada"],
+    "descontos indevidos em benefício previdenciário": ["descontos na aposentadoria do INSS", "desconto irregular no benefício"],
+    "rescisão contratual": ["rescindir o contrato", "fim do contrato entre as partes"],
+    "corte no fornecimento de energia": ["energia elétrica cortada", "suspensão do fornecimento de luz"],
+    "fraude bancária": ["golpe na conta do banco", "transações fraudulentas no banco"],
+    "extravio de bagagem": ["bagagem extraviada", "mala perdida na viagem"],
+    "cláusula abusiva em contrato de adesão": ["cláusulas abusivas do contrato", "contrato de adesão com cláusula ilegal"],
+}
+# Frases de ruído: cada chunk menciona também outro tema (como peças reais citam outros casos).
+RUIDO = [
+    "Registre-se que a parte já discutiu, em outro feito, questão de {tema}.",
+    "Não se confunde a hipótese com os precedentes sobre {tema}.",
+]
+
+_SILABAS = ["ba", "ce", "di", "fo", "gu", "la", "me", "ni", "po", "ru", "sa", "te", "vi", "xo", "za",
+            "bra", "cro", "dre", "fli", "gra", "pla", "tre", "vro", "nha", "lhe", "que", "gui", "cha", "rus", "tor"]
+
+
+def _gerar_nome(rng: random.Random) -> str:
+    return " ".join(
+        "".join(rng.choice(_SILABAS) for _ in range(rng.randint(2, 4))).capitalize()
+        for _ in range(2)
+    )
+
+def gerar_corpus(total_chunks: int, total_consultas: int, semente: int) -> Tuple[List[Document], List[Tuple[str, Set[str]]]]:
+    """
+    Gera 'total_chunks' chunks sintéticos (uma seção de peça/decisão cada) e consultas rotuladas.
+
+    Cada chunk traz duas frases da sua seção sobre o seu tema e uma frase de ruído sobre outro tema.
+    Cada consulta descreve uma combinação de seção e tema com outras palavras (PARAFRASES_*), sem
+    identificadores do chunk. Os relevantes são todos os chunks daquela seção e tema, de modo que o
+    recall mede a ordenação e não satura em 1.0.
+
+    Returns:
+        (chunks, [(consulta, ids dos chunks relevantes)])
+    """
+    rng = random.Random(semente)
+    chunks: List[Document] = []
+    relevantes: Dict[Tuple[str, str], Set[str]] = {}
+    for numero in range(total_chunks):
+        secao = rng.choice(list(SECOES))
+        tema = rng.choice(TEMAS)
+        outro_tema = rng.choice([t for t in TEMAS if t != tema])
+        frases = [frase.format(tema=tema) for frase in rng.sample(SECOES[secao], k=2)]
+        frases.insert(rng.randint(0, 2), rng.choice(RUIDO).format(tema=outro_tema))
+        processo = f"{rng.randint(0, 9999999):07d}-{rng.randint(0, 99):02d}.{rng.randint(2015, 2025)}.8.26.{rng.randint(1, 999):04d}"
+        nome = _gerar_nome(rng)
+        texto = f"{secao}\nProcesso nº {processo}. Parte: {nome}.\n" + " ".join(frases)
+        chunks.append(Document(
+            id=f"sintetico-{numero}",
+            page_content=texto,
+            metadata={"source_type": "sintetico", "secao": secao, "tema": tema, "parte": nome}
+        ))
+        relevantes.setdefault((secao, tema), set()).add(chunks[-1].id)
+    rotulos = sorted(relevantes)
+    consultas = []
+    for _ in range(min(total_consultas, len(chunks))):
+        secao, tema = rng.choice(rotulos)
+        consulta = rng.choice(PARAFRASES_SECOES[secao]).format(tema=rng.choice(PARAFRASES_TEMAS[tema]))
+        consultas.append((consulta, relevantes[(secao, tema)]))
+    return chunks, consultas
+
+def _tamanho_pasta(pasta: str) -> int:
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(pasta) for nome in nomes)
+
+def _percentis_ms(duracoes: List[float]) -> Dict[str, float]:
+    valores = np.array(duracoes) * 1000
+    return {f"p{p}": round(float(np.percentile(valores, p)), 3) for p in (50, 90, 95, 99)}
+
+def _avaliar(retriever: RetrieverDuasCamadas, consultas: List[Tuple[str, Set[str]]]) -> Dict[str, Any]:
+    """recall@k: fração dos k primeiros que é relevante (limitada pelo total de relevantes); MRR do primeiro relevante."""
+    duracoes, recalls, posicoes_reciprocas = [], [], []
+    for consulta, ids_relevantes in consultas:
+        inicio = time.perf_counter()
+        documentos = retriever.invoke(consulta)
+        duracoes.append(time.perf_counter() - inicio)
+        ids = [doc.id for doc in documentos][:retriever.k]
+        recalls.append(sum(1 for id_doc in ids if id_doc in ids_relevantes) / min(retriever.k, len(ids_relevantes)))
+        posicao = next((i for i, id_doc in enumerate(ids) if id_doc in ids_relevantes), None)
+        posicoes_reciprocas.append(0.0 if posicao is None else 1.0 / (posicao + 1))
+    return {
+        f"recall@{retriever.k}": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(posicoes_reciprocas)), 4),
+        "latencia_ms": _percentis_ms(duracoes),
+    }
+
+def executar_cenario(
+    total_chunks: int,
+    total_consultas: int,
+    k: int,
+    fetch_k: int,
+    semente: int,
+    tipos_indice: Tuple[str, ...] = ()
+) -> Dict[str, Any]:
+    """
+    Roda todas as medições para um corpus de 'total_chunks' chunks.
+    Para cada tipo em 'tipos_indice' ("sq8", "ivfpq"), mede também a busca vetorial com o índice
+    comprimido e a perda de recall em relação ao índice exato.
+    """
+    print(f"\n[BENCHMARK] Corpus com {total_chunks} chunks...")
+    chunks, consultas = gerar_corpus(total_chunks, total_consultas, semente)
+    embeddings_model = EmbeddingsHashLocal()
+    textos = [doc.page_content for doc in chunks]
+
+    inicio = time.perf_counter()
+    vetores = embeddings_model.embed_documents(textos)
+    tempo_embeddings = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vector_store = FAISS.from_embeddings(
+        list(zip(textos, vetores)), embeddings_model,
+        metadatas=[doc.metadata for doc in chunks], ids=[doc.id for doc in chunks]
+    )
+    tempo_faiss = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    indice_lexical = IndiceBM25.de_faiss(vector_store)
+    tempo_bm25 = time.perf_counter() - inicio
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        inicio = time.perf_counter()
+        salvar_versao_indice(pasta_tmp, vector_store)
+        tempo_gravacao = time.perf_counter() - inicio
+        tamanho_disco = _tamanho_pasta(pasta_tmp)
+        inicio = time.perf_counter()
+        indice_aberto = abrir_versao_indice(pasta_tmp, embeddings_model)
+        tempo_abertura = time.perf_counter() - inicio
+
+        resultados_busca = {}
+        for modo, hibrido in (("vetorial", False), ("hibrido", True)):
+            retriever = RetrieverDuasCamadas(
+                camada_modelos=CamadaBusca(indice_aberto, indice_lexical),
+                versao_indice_modelos=-total_chunks, # Não colide com as versões do índice real
+                embeddings_model=embeddings_model,
+                k=k,
+                fetch_k=fetch_k,
+                hibrido=hibrido
+            )
+            resultados_busca[modo] = _avaliar(retriever, consultas)
+            print(f"  {modo}: {resultados_busca[modo]}")
+
+        compressao = {}
+        for tipo in tipos_indice:
+            inicio = time.perf_counter()
+            indice_aberto.indice_comprimido = construir_indice_comprimido(vetores_exatos(indice_aberto.index), tipo, semente=semente)
+            compressao[tipo] = {
+                "segundos_treino": round(time.perf_counter() - inicio, 3),
+                **medir_perda_recall(indice_aberto.index, indice_aberto.indice_comprimido, semente=semente),
+            }
+            retriever = RetrieverDuasCamadas(
+                camada_modelos=CamadaBusca(indice_aberto, indice_lexical),
+                versao_indice_modelos=-total_chunks - len(compressao), # Cada tipo com sua própria memorização
+                embeddings_model=embeddings_model,
+                k=k,
+                fetch_k=fetch_k,
+                hibrido=False
+            )
+            resultados_busca[f"vetorial-{tipo}"] = _avaliar(retriever, consultas)
+            print(f"  vetorial-{tipo}: {resultados_busca[f'vetorial-{tipo}']}, compressão: {compressao[tipo]}")
+        indice_aberto.indice_comprimido = None
+        del indice_aberto, retriever # Libera os arquivos mapeados antes de apagar a pasta
+
+    relatorio = {
+        "chunks": total_chunks,
+        "consultas": len(consultas),
+        "dimensao": embeddings_model.dimensao,
+        "ingestao": {
+            "segundos_embeddings": round(tempo_embeddings, 3),
+            "chunks_por_segundo": round(total_chunks / tempo_embeddings, 1) if tempo_embeddings > 0 else None,
+        },
+        "construcao": {
+            "segundos_faiss": round(tempo_faiss, 3),
+            "segundos_bm25": round(tempo_bm25, 3),
+            "segundos_gravacao": round(tempo_gravacao, 3),
+            "segundos_abertura": round(tempo_abertura, 4),
+        },
+        "bytes_em_disco": tamanho_disco,
+        "busca": resultados_busca,
+        "compressao": compressao,
+    }
+    print(f"  ingestão: {relatorio['ingestao']}, construção: {relatorio['construcao']}, disco: {tamanho_disco / 1e6:.1f} MB")
+    return relatorio
+
+def comparar_com_baseline(
+    relatorio: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerancia_recall: float,
+    fator_latencia: float
+) -> List[str]:
+    """Compara recall e latência p95 com um relatório anterior e retorna as regressões encontradas."""
+    regressoes = []
+    cenarios_base = {cenario["chunks"]: cenario for cenario in baseline.get("cenarios", [])}
+    for cenario in relatorio["cenarios"]:
+        base = cenarios_base.get(cenario["chunks"])
+        if not base:
+            continue
+        for modo, metricas in cenario["busca"].items():
+            metricas_base = base["busca"].get(modo, {})
+            for nome, valor in metricas.items():
+                if nome.startswith("recall@") and nome in metricas_base and valor < metricas_base[nome] - tolerancia_recall:
+                    regressoes.append(f"{cenario['chunks']} chunks/{modo}: {nome} caiu de {metricas_base[nome]} para {valor}")
+            p95, p95_base = metricas["latencia_ms"]["p95"], metricas_base.get("latencia_ms", {}).get("p95")
+            if p95_base and p95 > p95_base * fator_latencia:
+                regressoes.append(f"{cenario['chunks']} chunks/{modo}: latência p95 subiu de {p95_base}ms para {p95}ms")
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark da recuperação (RAG) com embeddings locais.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Quantidades de chunks dos corpora")
+    parser.add_argument("--consultas", type=int, default=200, help="Consultas rotuladas por corpus")
+    parser.add_argument("--k", type=int, default=RETRIEVER_SEARCH_K)
+    parser.add_argument("--fetch-k", type=int, default=RETRIEVER_FETCH_K)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", default="relatorio_benchmark_rag.json", help="Arquivo JSON do relatório")
+    parser.add_argument("--baseline", help="Relatório anterior para detectar regressões")
+    parser.add_argument("--tolerancia-recall", type=float, default=0.02)
+    parser.add_argument("--fator-latencia", type=float, default=1.5, help="Aumento máximo aceito na latência p95")
+    parser.add_argument("--tipos-indice", nargs="*", default=[], choices=["sq8", "ivfpq"], help="Índices comprimidos a comparar com o exato")
+    args = parser.parse_args()
+
+    relatorio = {
+        "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "parametros": {"k": args.k, "fetch_k": args.fetch_k, "consultas": args.consultas, "semente": args.semente},
+        "cenarios": [
+            executar_cenario(tamanho, args.consultas, args.k, args.fetch_k, args.semente, tuple(args.tipos_indice))
+            for tamanho in args.tamanhos
+        ],
+    }
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"\n[BENCHMARK] Relatório gravado em '{args.saida}'.")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as arquivo:
+            regressoes = comparar_com_baseline(relatorio, json.load(arquivo), args.tolerancia_recall, args.fator_latencia)
+        if regressoes:
+            print("[BENCHMARK] Regressões encontradas:")
+            for regressao in regressoes:
+                print(f"  - {regressao}")
+            sys.exit(1)
+        print("[BENCHMARK] Nenhuma regressão em relação ao baseline.")
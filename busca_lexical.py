@@ -0,0 +1,152 @@
+# busca_lexical.py
+
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple, Union
+
+from langchain_community.vectorstores import FAISS
+
+from settings import BM25_K1, BM25_B, RRF_K
+
+# Palavras muito frequentes que não ajudam a distinguir um chunk de outro.
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "da", "das", "de", "do", "dos", "e", "em", "na", "nas",
+    "no", "nos", "o", "os", "ou", "para", "pela", "pelas", "pelo", "pelos", "por", "que",
+    "se", "sem", "um", "uma", "umas", "uns"
+}
+
+_PADRAO_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Normaliza (minúsculas, sem acentos) e divide o texto em termos.
+    Números são mantidos, para que buscas por artigos (ex: "art. 355") encontrem o trecho certo.
+    """
+    texto_normalizado = unicodedata.normalize("NFKD", texto.lower())
+    texto_normalizado = "".join(c for c in texto_normalizado if not unicodedata.combining(c))
+    return [
+        termo for termo in _PADRAO_TOKEN.findall(texto_normalizado)
+        if termo not in STOPWORDS and (len(termo) > 1 or termo.isdigit())
+    ]
+
+
+class IndiceBM25:
+    """
+    Índice invertido em memória com pontuação BM25, usado junto com o FAISS na busca híbrida.
+
+    As chaves dos documentos são os ids do docstore do FAISS, então um resultado lexical aponta
+    para o mesmo chunk que a busca vetorial. Buscas não chamam a API de embeddings.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {} # termo -> {id do chunk: frequência}
+        self._tamanhos: Dict[str, int] = {} # id do chunk -> quantidade de termos
+        self._termos_por_chunk: Dict[str, Tuple[str, ...]] = {} # Termos distintos (para remoção)
+        self._total_termos = 0
+
+    def __len__(self) -> int:
+        return len(self._tamanhos)
+
+    def adicionar(self, pares_id_texto: Iterable[Tuple[str, str]]) -> None:
+        """Indexa os textos (um id já indexado é substituído)."""
+        for id_chunk, texto in pares_id_texto:
+            if id_chunk in self._tamanhos:
+                self.remover([id_chunk])
+            frequencias = Counter(tokenizar(texto))
+            for termo, frequencia in frequencias.items():
+                self._postings.setdefault(termo, {})[id_chunk] = frequencia
+            tamanho = sum(frequencias.values())
+            self._tamanhos[id_chunk] = tamanho
+            self._termos_por_chunk[id_chunk] = tuple(frequencias)
+            self._total_termos += tamanho
+
+    def remover(self, ids_chunks: Iterable[str]) -> None:
+        for id_chunk in ids_chunks:
+            if id_chunk not in self._tamanhos:
+                continue
+            for termo in self._termos_por_chunk.pop(id_chunk):
+                postings = self._postings[termo]
+                del postings[id_chunk]
+                if not postings:
+                    del self._postings[termo]
+            self._total_termos -= self._tamanhos.pop(id_chunk)
+
+    def buscar(
+        self,
+        consulta: str,
+        k: int,
+        filtro: Union[Callable[[str], bool], None] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Retorna até k pares (id do chunk, pontuação BM25), do mais para o menos relevante.
+        Se 'filtro' for informado, só chunks cujo id passe no filtro concorrem às k posições.
+        """
+        if not self._tamanhos:
+            return []
+        total_docs = len(self._tamanhos)
+        tamanho_medio = self._total_termos / total_docs or 1.0
+        pontuacoes: Dict[str, float] = {}
+        for termo in set(tokenizar(consulta)):
+            postings = self._postings.get(termo)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for id_chunk, frequencia in postings.items():
+                normalizacao = self.k1 * (1 - self.b + self.b * self._tamanhos[id_chunk] / tamanho_medio)
+                pontuacoes[id_chunk] = pontuacoes.get(id_chunk, 0.0) + idf * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+        candidatos = pontuacoes.items() if filtro is None else [par for par in pontuacoes.items() if filtro(par[0])]
+        return heapq.nlargest(k, candidatos, key=lambda par: par[1])
+
+    def copiar(self) -> "IndiceBM25":
+        """Cópia independente (usada na atualização incremental, sem afetar buscas em andamento)."""
+        copia = IndiceBM25(self.k1, self.b)
+        copia._postings = {termo: dict(postings) for termo, postings in self._postings.items()}
+        copia._tamanhos = dict(self._tamanhos)
+        copia._termos_por_chunk = dict(self._termos_por_chunk)
+        copia._total_termos = self._total_termos
+        return copia
+
+    @classmethod
+    def de_faiss(cls, vector_store: FAISS) -> "IndiceBM25":
+        """Constrói o índice lexical a partir dos chunks do docstore de um vector store FAISS."""
+        indice = cls()
+        indice.adicionar(
+            (id_chunk, vector_store.docstore.search(id_chunk).page_content)
+            for id_chunk in vector_store.index_to_docstore_id.values()
+        )
+        return indice
+
+
+def fundir_por_rrf(rankings: List[List[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """
+    Funde rankings (listas de chaves, da mais para a menos relevante) por Reciprocal Rank Fusion.
+    Só usa as posições, então pontuações de naturezas diferentes (distância L2, BM25) combinam sem calibração.
+    """
+    pontuacoes: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for posicao, chave in enumerate(ranking):
+            pontuacoes[chave] = pontuacoes.get(chave, 0.0) + 1.0 / (k + posicao + 1)
+    return sorted(pontuacoes.items(), key=lambda par: par[1], reverse=True)
+
+
+if __name__ == '__main__':
+    print("--- Testando Busca Lexical ---")
+    indice = IndiceBM25()
+    indice.adicionar([
+        ("1", "DECISÃO DE SANEAMENTO. Fixo os pontos controvertidos e defiro a prova pericial."),
+        ("2", "Julgamento antecipado do mérito, nos termos do art. 355, I, do CPC."),
+        ("3", "CONTESTAÇÃO. O réu impugna os fatos narrados na petição inicial."),
+    ])
+    print(f"  Tokens: {tokenizar('Julgamento antecipado (art. 355 do CPC)')}")
+    print(f"  'saneamento': {indice.buscar('saneamento', 2)}")
+    print(f"  'art. 355': {indice.buscar('art. 355', 2)}")
+    assert indice.buscar("contestacao", 1)[0][0] == "3"
+    indice.remover(["3"])
+    assert indice.buscar("contestação", 1) == []
+    print(f"  RRF: {fundir_por_rrf([['a', 'b', 'c'], ['c', 'a']])}")
+    print("--- Fim dos Testes Busca Lexical ---")
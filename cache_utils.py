@@ -0,0 +1,202 @@
+# cache_utils.py
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Tuple, Union
+
+
+class ArmazenamentoLRU:
+    """
+    Armazenamento chave-valor persistente em um único arquivo SQLite, com despejo LRU por tamanho.
+
+    Pensado para caches locais (embeddings, textos extraídos, respostas de LLM): as chaves são
+    strings (normalmente hashes de conteúdo) e os valores são bytes opacos. Quando o total
+    armazenado ultrapassa 'max_bytes', as entradas acessadas há mais tempo são removidas.
+    Pode ser compartilhado entre threads; o modo WAL do SQLite permite vários processos lendo
+    o mesmo arquivo.
+
+    Leituras não escrevem no arquivo: os horários de acesso ficam em memória e são gravados em
+    lote (a cada ACESSOS_POR_LOTE acessos ou SEGUNDOS_ENTRE_GRAVACOES_ACESSO, junto de uma
+    gravação, e sempre antes de um despejo). O total de bytes é mantido em memória, lido do
+    arquivo na abertura e recontado só quando indica que o limite foi ultrapassado (o que
+    também corrige gravações de outros processos).
+    """
+
+    ACESSOS_POR_LOTE = 256
+    SEGUNDOS_ENTRE_GRAVACOES_ACESSO = 30.0
+
+    def __init__(self, caminho_arquivo: str, max_bytes: int, comprimir: bool = False):
+        """
+        Args:
+            caminho_arquivo: Caminho do arquivo SQLite (a pasta é criada se não existir).
+            max_bytes: Tamanho máximo (soma dos valores) antes do despejo LRU.
+            comprimir: Se True, os valores são comprimidos com zlib antes de gravar.
+        """
+        self.caminho_arquivo = caminho_arquivo
+        self.max_bytes = max_bytes
+        self.comprimir = comprimir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(caminho_arquivo)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho_arquivo, check_same_thread=False, timeout=30)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS entradas ("
+            " chave TEXT PRIMARY KEY,"
+            " valor BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL,"
+            " ultimo_acesso REAL NOT NULL)"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acesso ON entradas (ultimo_acesso)")
+        self._conexao.commit()
+        self._total_bytes = self._contar_bytes()
+        self._acessos_pendentes: Dict[str, float] = {} # chave -> horário do último acesso ainda não gravado
+        self._ultima_gravacao_acessos = time.monotonic()
+
+    def _contar_bytes(self) -> int:
+        return self._conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM entradas").fetchone()[0]
+
+    def _gravar_acessos_pendentes(self) -> None:
+        # Chamado com self._lock adquirido; o commit fica com quem chama.
+        if self._acessos_pendentes:
+            self._conexao.executemany(
+                "UPDATE entradas SET ultimo_acesso = ? WHERE chave = ?",
+                [(horario, chave) for chave, horario in self._acessos_pendentes.items()]
+            )
+            self._acessos_pendentes.clear()
+        self._ultima_gravacao_acessos = time.monotonic()
+
+    def gravar_acessos(self) -> None:
+        """Grava no arquivo os horários de acesso pendentes (ex: antes de encerrar o processo)."""
+        with self._lock:
+            self._gravar_acessos_pendentes()
+            self._conexao.commit()
+
+    def obter_varios(self, chaves: List[str]) -> List[Union[bytes, None]]:
+        """Retorna os valores na mesma ordem das chaves (None para as ausentes) e atualiza o LRU."""
+        if not chaves:
+            return []
+        encontrados: Dict[str, bytes] = {}
+        with self._lock:
+            chaves_unicas = list(dict.fromkeys(chaves))
+            # O SQLite limita a quantidade de parâmetros por consulta; buscamos em blocos.
+            for inicio in range(0, len(chaves_unicas), 500):
+                bloco = chaves_unicas[inicio:inicio + 500]
+                marcadores = ",".join("?" * len(bloco))
+                for chave, valor in self._conexao.execute(
+                    f"SELECT chave, valor FROM entradas WHERE chave IN ({marcadores})", bloco
+                ):
+                    encontrados[chave] = zlib.decompress(valor) if self.comprimir else valor
+            agora = time.time()
+            self._acessos_pendentes.update((chave, agora) for chave in encontrados)
+            if (len(self._acessos_pendentes) >= self.ACESSOS_POR_LOTE
+                    or time.monotonic() - self._ultima_gravacao_acessos >= self.SEGUNDOS_ENTRE_GRAVACOES_ACESSO):
+                self._gravar_acessos_pendentes()
+                self._conexao.commit()
+            resultado = [encontrados.get(chave) for chave in chaves]
+            acertos = sum(1 for valor in resultado if valor is not None)
+            self.hits += acertos
+            self.misses += len(resultado) - acertos
+        return resultado
+
+    def obter(self, chave: str) -> Union[bytes, None]:
+        return self.obter_varios([chave])[0]
+
+    def gravar_varios(self, pares: Iterable[Tuple[str, bytes]]) -> None:
+        """Grava (ou sobrescreve) os pares chave/valor e aplica o despejo LRU se necessário."""
+        agora = time.time()
+        linhas = []
+        for chave, valor in pares:
+            valor_gravado = zlib.compress(valor) if self.comprimir else valor
+            linhas.append((chave, sqlite3.Binary(valor_gravado), len(valor_gravado), agora))
+        if not linhas:
+            return
+        linhas = list({linha[0]: linha for linha in linhas}.values()) # Chave repetida: vale o último valor
+        with self._lock:
+            self._total_bytes += sum(linha[2] for linha in linhas) - self._tamanhos_existentes([linha[0] for linha in linhas])
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO entradas (chave, valor, tamanho, ultimo_acesso) VALUES (?, ?, ?, ?)",
+                linhas
+            )
+            for linha in linhas:
+                self._acessos_pendentes.pop(linha[0], None)
+            if time.monotonic() - self._ultima_gravacao_acessos >= self.SEGUNDOS_ENTRE_GRAVACOES_ACESSO:
+                self._gravar_acessos_pendentes()
+            self._despejar_se_necessario()
+            self._conexao.commit()
+
+    def gravar(self, chave: str, valor: bytes) -> None:
+        self.gravar_varios([(chave, valor)])
+
+    def remover(self, chave: str) -> None:
+        with self._lock:
+            self._total_bytes -= self._tamanhos_existentes([chave])
+            self._conexao.execute("DELETE FROM entradas WHERE chave = ?", (chave,))
+            self._acessos_pendentes.pop(chave, None)
+            self._conexao.commit()
+
+    def _tamanhos_existentes(self, chaves: List[str]) -> int:
+        # Chamado com self._lock adquirido: bytes já gravados para 'chaves' (busca pela chave primária).
+        total = 0
+        for inicio in range(0, len(chaves), 500):
+            bloco = chaves[inicio:inicio + 500]
+            total += self._conexao.execute(
+                f"SELECT COALESCE(SUM(tamanho), 0) FROM entradas WHERE chave IN ({','.join('?' * len(bloco))})", bloco
+            ).fetchone()[0]
+        return total
+
+    def _despejar_se_necessario(self) -> None:
+        # Chamado com self._lock adquirido.
+        if self._total_bytes <= self.max_bytes:
+            return
+        total = self._total_bytes = self._contar_bytes() # Recontagem (outros processos podem ter gravado)
+        if total <= self.max_bytes:
+            return
+        self._gravar_acessos_pendentes() # A ordem do LRU precisa dos acessos recentes
+        # Despeja até 90% do limite para não pagar o despejo a cada nova gravação.
+        alvo = int(self.max_bytes * 0.9)
+        removidas = 0
+        cursor = self._conexao.execute("SELECT chave, tamanho FROM entradas ORDER BY ultimo_acesso ASC")
+        chaves_para_remover = []
+        for chave, tamanho in cursor:
+            if total <= alvo:
+                break
+            chaves_para_remover.append((chave,))
+            total -= tamanho
+            removidas += 1
+        self._conexao.executemany("DELETE FROM entradas WHERE chave = ?", chaves_para_remover)
+        self._total_bytes = total
+        print(f"[CACHE] {removidas} entradas despejadas (LRU) de '{os.path.basename(self.caminho_arquivo)}'.")
+
+    def estatisticas(self) -> Dict[str, int]:
+        """Retorna contadores de acertos/falhas e o tamanho atual do armazenamento."""
+        with self._lock:
+            entradas, total = self._conexao.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM entradas"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entradas": entradas, "bytes": total}
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    print("--- Testando Cache Utils ---")
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        cache = ArmazenamentoLRU(os.path.join(pasta_tmp, "teste.sqlite3"), max_bytes=1000)
+        cache.gravar("a", b"x" * 400)
+        cache.gravar("b", b"y" * 400)
+        print(f"  Valor 'a' presente: {cache.obter('a') is not None}") # 'a' passa a ser o mais recente
+        cache.gravar("c", b"z" * 400) # Ultrapassa o limite: 'b' (menos recente) é despejado
+        assert cache.obter("b") is None and cache.obter("a") is not None
+        cache.gravar("c", b"z" * 100) # Sobrescrita: o total acompanha o novo tamanho
+        cache.remover("a")
+        assert cache._total_bytes == cache._contar_bytes() == 100
+        print(f"  Estatísticas: {cache.estatisticas()}")
+    print("--- Fim dos Testes Cache Utils ---")
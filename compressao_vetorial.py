@@ -0,0 +1,207 @@
+# compressao_vetorial.py
+
+import math
+import time
+from typing import Any, Dict, Tuple, Union
+
+import faiss
+import numpy as np
+
+from langchain_community.vectorstores import FAISS
+
+from settings import (
+    INDICE_MODELOS_TIPO,
+    INDICE_COMPRIMIDO_MIN_CHUNKS,
+    INDICE_TREINO_AMOSTRA,
+    INDICE_IVF_NPROBE,
+    INDICE_PQ_BYTES,
+    INDICE_RERANK_FATOR
+)
+
+# Um vector store comprimido continua com o índice exato em 'vector_store.index' (fonte da verdade:
+# atualizações incrementais, MMR e re-ranking) e ganha o atributo 'indice_comprimido', usado para
+# gerar os candidatos. Aberto do disco, o índice exato fica mapeado (mmap) e só as linhas dos
+# candidatos são lidas; a memória residente por processo é a do índice comprimido.
+TIPOS_INDICE = ("flat", "sq8", "ivfpq")
+
+
+def indice_comprimido_de(vector_store: FAISS) -> Union[faiss.Index, None]:
+    return getattr(vector_store, "indice_comprimido", None)
+
+def tipo_do_indice(indice: Union[faiss.Index, None]) -> str:
+    """'flat', 'sq8' ou 'ivfpq' (tipo do índice comprimido anexado, ou 'flat' se não houver)."""
+    if indice is None:
+        return "flat"
+    return "ivfpq" if faiss.try_extract_index_ivf(indice) is not None else "sq8"
+
+def vetores_exatos(indice_exato: faiss.Index) -> np.ndarray:
+    return indice_exato.reconstruct_n(0, indice_exato.ntotal)
+
+def _amostra_treino(vetores: np.ndarray, tamanho: int, semente: int) -> np.ndarray:
+    if len(vetores) <= tamanho:
+        return vetores
+    rng = np.random.default_rng(semente)
+    return vetores[np.sort(rng.choice(len(vetores), size=tamanho, replace=False))]
+
+def construir_indice_comprimido(
+    vetores: np.ndarray,
+    tipo: str,
+    amostra_treino: int = INDICE_TREINO_AMOSTRA,
+    semente: int = 42
+) -> faiss.Index:
+    """
+    Treina (em uma amostra de 'amostra_treino' vetores) e preenche um índice comprimido.
+
+    Args:
+        vetores: Matriz (n, d) com os vetores exatos, na ordem das linhas do índice exato.
+        tipo: "sq8" (quantização escalar de 8 bits) ou "ivfpq" (IVF + product quantization).
+        amostra_treino: Máximo de vetores usados no treino.
+        semente: Semente do sorteio da amostra (índices reprodutíveis).
+
+    Returns:
+        O índice comprimido, com as mesmas linhas do índice exato.
+    """
+    vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+    total, dimensao = vetores.shape
+    if tipo == "sq8":
+        indice = faiss.IndexScalarQuantizer(dimensao, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif tipo == "ivfpq":
+        bytes_pq = INDICE_PQ_BYTES if dimensao % INDICE_PQ_BYTES == 0 else math.gcd(dimensao, INDICE_PQ_BYTES)
+        # ~4*sqrt(n) listas, com pelo menos 39 vetores de treino por lista (recomendação do FAISS).
+        listas = max(1, min(int(4 * math.sqrt(total)), min(total, amostra_treino) // 39))
+        indice = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimensao), dimensao, listas, bytes_pq, 8)
+        indice.nprobe = min(INDICE_IVF_NPROBE, listas)
+    else:
+        raise ValueError(f"Tipo de índice comprimido desconhecido: '{tipo}'. Opções: {TIPOS_INDICE[1:]}.")
+    indice.train(_amostra_treino(vetores, amostra_treino, semente))
+    indice.add(vetores)
+    return indice
+
+def recomprimir(indice_anterior: faiss.Index, vetores: np.ndarray) -> faiss.Index:
+    """Recodifica 'vetores' com o treino de um índice comprimido existente (ex: após atualização incremental)."""
+    # Cópia via serialização: o índice anterior pode estar mapeado (somente leitura).
+    indice = faiss.deserialize_index(faiss.serialize_index(indice_anterior))
+    indice.reset()
+    indice.add(np.ascontiguousarray(vetores, dtype=np.float32))
+    return indice
+
+def _parametros_busca(indice: faiss.Index, seletor: Union[faiss.IDSelector, None]) -> Union[faiss.SearchParameters, None]:
+    indice_ivf = faiss.try_extract_index_ivf(indice)
+    if indice_ivf is not None: # Parâmetros explícitos substituem o nprobe do índice
+        return faiss.SearchParametersIVF(sel=seletor, nprobe=indice_ivf.nprobe)
+    return faiss.SearchParameters(sel=seletor) if seletor is not None else None
+
+def buscar_com_rerank(
+    indice_comprimido: faiss.Index,
+    indice_exato: faiss.Index,
+    consultas: np.ndarray,
+    k: int,
+    fator_rerank: int = INDICE_RERANK_FATOR,
+    linhas: Union[np.ndarray, None] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca no índice comprimido e, com 'fator_rerank' > 0, re-rankeia os k * fator candidatos pela
+    distância exata (vetores lidos do índice exato).
+
+    Args:
+        consultas: Matriz (n, d) float32, já normalizada se o vector store normaliza.
+        linhas: Se informado, só essas linhas concorrem (pré-filtro).
+
+    Returns:
+        (distâncias, linhas) no formato do faiss.Index.search (-1 onde não há resultado).
+    """
+    seletor = faiss.IDSelectorBatch(linhas) if linhas is not None else None
+    k_candidatos = k * fator_rerank if fator_rerank else k
+    distancias, indices = indice_comprimido.search(consultas, k_candidatos, params=_parametros_busca(indice_comprimido, seletor))
+    if not fator_rerank:
+        return distancias, indices
+    distancias_finais = np.full((len(consultas), k), np.inf, dtype=np.float32)
+    indices_finais = np.full((len(consultas), k), -1, dtype=np.int64)
+    for posicao, (consulta, candidatos) in enumerate(zip(consultas, indices)):
+        candidatos = candidatos[candidatos >= 0]
+        if len(candidatos) == 0:
+            continue
+        diferencas = indice_exato.reconstruct_batch(candidatos) - consulta
+        distancias_exatas = np.einsum("ij,ij->i", diferencas, diferencas) # L2 ao quadrado, como o FAISS
+        ordem = np.argsort(distancias_exatas)[:k]
+        distancias_finais[posicao, :len(ordem)] = distancias_exatas[ordem]
+        indices_finais[posicao, :len(ordem)] = candidatos[ordem]
+    return distancias_finais, indices_finais
+
+def medir_perda_recall(
+    indice_exato: faiss.Index,
+    indice_comprimido: faiss.Index,
+    k: int = 10,
+    total_consultas: int = 200,
+    fator_rerank: int = INDICE_RERANK_FATOR,
+    semente: int = 42
+) -> Dict[str, Any]:
+    """
+    Recall@k do índice comprimido (com e sem re-ranking) em relação à busca exata, e tamanhos em bytes.
+    As consultas são pontos médios de pares de vetores sorteados do próprio índice.
+    """
+    rng = np.random.default_rng(semente)
+    pares = rng.integers(0, indice_exato.ntotal, size=(total_consultas, 2))
+    consultas = (indice_exato.reconstruct_batch(pares[:, 0]) + indice_exato.reconstruct_batch(pares[:, 1])) / 2
+    _, exatos = indice_exato.search(consultas, k)
+
+    def recall(indices: np.ndarray) -> float:
+        return round(float(np.mean([len(set(a[a >= 0]) & set(e[e >= 0])) / k for a, e in zip(indices, exatos)])), 4)
+
+    _, aproximados = buscar_com_rerank(indice_comprimido, indice_exato, consultas, k, fator_rerank=0)
+    resultado = {
+        "tipo": tipo_do_indice(indice_comprimido),
+        "k": k,
+        "recall_sem_rerank": recall(aproximados[:, :k]),
+        "bytes_exato": indice_exato.ntotal * indice_exato.d * 4,
+        "bytes_comprimido": len(faiss.serialize_index(indice_comprimido)),
+    }
+    if fator_rerank:
+        _, re_rankeados = buscar_com_rerank(indice_comprimido, indice_exato, consultas, k, fator_rerank)
+        resultado["recall_com_rerank"] = recall(re_rankeados)
+    return resultado
+
+def anexar_indice_comprimido(
+    vector_store: FAISS,
+    tipo: str = INDICE_MODELOS_TIPO,
+    indice_anterior: Union[faiss.Index, None] = None
+) -> None:
+    """
+    Anexa ao vector store o índice comprimido do 'tipo' configurado (ou remove, para "flat" e
+    corpora com menos de INDICE_COMPRIMIDO_MIN_CHUNKS chunks). Não faz nada se já houver um do
+    mesmo tipo; com 'indice_anterior' do mesmo tipo, reaproveita o treino em vez de treinar de novo.
+    """
+    if tipo == "flat" or vector_store.index.ntotal < INDICE_COMPRIMIDO_MIN_CHUNKS:
+        vector_store.indice_comprimido = None
+        return
+    if tipo_do_indice(indice_comprimido_de(vector_store)) == tipo:
+        return
+    inicio = time.perf_counter()
+    vetores = vetores_exatos(vector_store.index)
+    if indice_anterior is not None and tipo_do_indice(indice_anterior) == tipo:
+        vector_store.indice_comprimido = recomprimir(indice_anterior, vetores)
+        print(f"[INDICE] Índice '{tipo}' recodificado ({len(vetores)} vetores) em {time.perf_counter() - inicio:.1f}s.")
+        return
+    indice = construir_indice_comprimido(vetores, tipo)
+    perda = medir_perda_recall(vector_store.index, indice)
+    print(f"[INDICE] Índice '{tipo}' treinado ({len(vetores)} vetores) em {time.perf_counter() - inicio:.1f}s: "
+          f"{perda['bytes_comprimido'] / 1e6:.1f} MB (exato: {perda['bytes_exato'] / 1e6:.1f} MB), "
+          f"recall@{perda['k']} vs. exato {perda['recall_sem_rerank']} sem re-ranking, {perda.get('recall_com_rerank')} com.")
+    vector_store.indice_comprimido = indice
+
+
+if __name__ == '__main__':
+    print("--- Testando Compressão Vetorial ---")
+    rng = np.random.default_rng(0)
+    centros = rng.normal(size=(50, 64)).astype(np.float32)
+    vetores = (centros[rng.integers(0, 50, 20_000)] + 0.3 * rng.normal(size=(20_000, 64))).astype(np.float32)
+    exato = faiss.IndexFlatL2(64)
+    exato.add(vetores)
+    for tipo in TIPOS_INDICE[1:]:
+        indice = construir_indice_comprimido(vetores, tipo, amostra_treino=12_000)
+        perda = medir_perda_recall(exato, indice)
+        print(f"  {tipo}: {perda}")
+        assert perda["recall_com_rerank"] >= perda["recall_sem_rerank"]
+        _, linhas = buscar_com_rerank(indice, exato, vetores[:1], 5, linhas=np.arange(0, 20_000, 2, dtype=np.int64))
+        assert all(linha % 2 == 0 for linha in linhas[0] if linha >= 0)
+    print("--- Fim dos Testes Compressão Vetorial ---")
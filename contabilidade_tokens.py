@@ -0,0 +1,237 @@
+# contabilidade_tokens.py
+#
+# Contabilidade das chamadas ao LLM por simulação: tokens de entrada e de saída, latência e uso do
+# cache de respostas de cada chamada, com o nó (ator), a etapa e o id do processo. Os registros são
+# agregados no estado final da simulação (campo 'consumo_llm') e podem ser exportados em CSV ou JSON.
+# Os tokens vêm do uso informado pela API quando disponível; senão (respostas do cache, modelos sem
+# metadados de uso) são contados com o tiktoken, uma aproximação do tokenizador do Gemini.
+
+import contextvars
+import csv
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Union
+
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from settings import (
+    TOKENS_CODIFICACAO_TIKTOKEN,
+    ORCAMENTO_TOKENS_POR_SIMULACAO
+)
+
+CAMPOS_REGISTRO = (
+    "horario", "id_processo", "no", "etapa", "prompt", "tokens_entrada", "tokens_saida",
+    "fonte_tokens", "segundos", "cache", "erro"
+)
+_MAX_PROCESSOS_REGISTRADOS = 256 # Processos mais antigos são descartados (servidor de longa duração)
+
+
+class OrcamentoTokensExcedidoError(RuntimeError):
+    """Levantado antes de uma chamada quando a simulação já consumiu ORCAMENTO_TOKENS_POR_SIMULACAO."""
+
+
+_codificador: Union[tiktoken.Encoding, None] = None
+_codificador_indisponivel = False
+_lock_codificador = threading.Lock()
+
+def contar_tokens(texto: str) -> int:
+    """Tokens do texto pelo tiktoken; sem o arquivo da codificação (ex: ambiente sem rede), ~4 caracteres por token."""
+    global _codificador, _codificador_indisponivel
+    with _lock_codificador:
+        if _codificador is None and not _codificador_indisponivel:
+            try:
+                _codificador = tiktoken.get_encoding(TOKENS_CODIFICACAO_TIKTOKEN)
+            except Exception as e: # O tiktoken baixa a codificação no primeiro uso
+                _codificador_indisponivel = True
+                print(f"[TOKENS] Codificação '{TOKENS_CODIFICACAO_TIKTOKEN}' indisponível ({type(e).__name__}); estimando 4 caracteres por token.")
+    if _codificador is None:
+        return (len(texto) + 3) // 4
+    return len(_codificador.encode(texto, disallowed_special=()))
+
+
+class MedicaoChamadaLLM(BaseCallbackHandler):
+    """
+    Uma chamada ao LLM em andamento. Passada como callback da cadeia (config={"callbacks": [medicao]}),
+    captura o uso de tokens informado pela API; quem chama preenche 'resposta' com o texto gerado.
+    """
+
+    def __init__(self, id_processo: str, no: Union[str, None], etapa: Union[str, None], id_prompt: str, prompt: str):
+        self.id_processo, self.no, self.etapa, self.id_prompt = id_processo, no, etapa, id_prompt
+        self.prompt = prompt
+        self.resposta = ""
+        self.do_cache = False
+        self.uso_api: Union[Dict[str, int], None] = None
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                uso = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+                if uso:
+                    self.uso_api = {"entrada": uso.get("input_tokens", 0), "saida": uso.get("output_tokens", 0)}
+
+    def registro(self, segundos: float, erro: Union[str, None]) -> Dict[str, Any]:
+        usar_api = self.uso_api is not None and not self.do_cache
+        tokens_entrada = self.uso_api["entrada"] if usar_api else contar_tokens(self.prompt)
+        tokens_saida = self.uso_api["saida"] if usar_api else contar_tokens(self.resposta)
+        return {
+            "horario": datetime.now().isoformat(timespec="seconds"),
+            "id_processo": self.id_processo,
+            "no": self.no,
+            "etapa": self.etapa,
+            "prompt": self.id_prompt,
+            "tokens_entrada": tokens_entrada,
+            "tokens_saida": tokens_saida,
+            "fonte_tokens": "api" if usar_api else ("tiktoken" if _codificador is not None else "estimativa"),
+            "segundos": round(segundos, 3),
+            "cache": self.do_cache,
+            "erro": erro,
+        }
+
+
+# Registros por processo e medição em andamento no contexto atual (o cache de respostas a marca).
+_registros_por_processo: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+_lock_registros = threading.Lock()
+_medicao_atual: contextvars.ContextVar = contextvars.ContextVar("medicao_chamada_llm", default=None)
+
+def marcar_resposta_do_cache() -> None:
+    """Chamada pelo cache de respostas: a chamada medida no contexto atual não foi ao LLM."""
+    medicao = _medicao_atual.get()
+    if medicao is not None:
+        medicao.do_cache = True
+
+def _registrar(registro: Dict[str, Any]) -> None:
+    with _lock_registros:
+        registros = _registros_por_processo.setdefault(registro["id_processo"], [])
+        registros.append(registro)
+        _registros_por_processo.move_to_end(registro["id_processo"])
+        while len(_registros_por_processo) > _MAX_PROCESSOS_REGISTRADOS:
+            _registros_por_processo.popitem(last=False)
+
+def reiniciar_consumo(id_processo: str) -> None:
+    """Descarta os registros do processo (chamada ao iniciar uma nova simulação com o mesmo id)."""
+    with _lock_registros:
+        _registros_por_processo.pop(id_processo, None)
+
+def tokens_consumidos(id_processo: str) -> int:
+    with _lock_registros:
+        return sum(r["tokens_entrada"] + r["tokens_saida"] for r in _registros_por_processo.get(id_processo, []))
+
+def verificar_orcamento(id_processo: str) -> None:
+    """Levanta OrcamentoTokensExcedidoError se o processo já atingiu o orçamento (0 = sem limite)."""
+    if ORCAMENTO_TOKENS_POR_SIMULACAO and tokens_consumidos(id_processo) >= ORCAMENTO_TOKENS_POR_SIMULACAO:
+        raise OrcamentoTokensExcedidoError(
+            f"Orçamento de {ORCAMENTO_TOKENS_POR_SIMULACAO} tokens da simulação '{id_processo}' esgotado "
+            f"({tokens_consumidos(id_processo)} consumidos)."
+        )
+
+@contextmanager
+def medir_chamada_llm(
+    id_processo: str,
+    no: Union[str, None],
+    etapa: Union[str, None],
+    id_prompt: str,
+    prompt: str
+) -> Iterator[MedicaoChamadaLLM]:
+    """
+    Mede uma chamada ao LLM e a registra ao sair do bloco (inclusive se falhar).
+    Verifica o orçamento de tokens antes da chamada.
+
+    Uso:
+        with medir_chamada_llm(id_processo, ator, etapa, id_prompt, prompt_renderizado) as medicao:
+            medicao.resposta = chain.invoke(entradas, config={"callbacks": [medicao]})
+    """
+    verificar_orcamento(id_processo)
+    medicao = MedicaoChamadaLLM(id_processo, no, etapa, id_prompt, prompt)
+    token_contexto = _medicao_atual.set(medicao)
+    inicio, erro = time.perf_counter(), None
+    try:
+        yield medicao
+    except BaseException as e:
+        erro = repr(e)[:300]
+        raise
+    finally:
+        _medicao_atual.reset(token_contexto)
+        _registrar(medicao.registro(time.perf_counter() - inicio, erro))
+
+def _agregar(registros: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "chamadas": len(registros),
+        "tokens_entrada": sum(r["tokens_entrada"] for r in registros),
+        "tokens_saida": sum(r["tokens_saida"] for r in registros),
+        "segundos": round(sum(r["segundos"] for r in registros), 3),
+        "respostas_do_cache": sum(1 for r in registros if r["cache"]),
+        "erros": sum(1 for r in registros if r["erro"]),
+    }
+
+def consumo_do_processo(id_processo: str) -> Dict[str, Any]:
+    """
+    Consumo do LLM na simulação: totais, agregados por nó e etapa (ordem de maior consumo de tokens)
+    e por prompt, e os registros de cada chamada.
+    """
+    with _lock_registros:
+        registros = list(_registros_por_processo.get(id_processo, []))
+    grupos: Dict[tuple, List[Dict[str, Any]]] = {}
+    for registro in registros:
+        grupos.setdefault((registro["no"], registro["etapa"]), []).append(registro)
+    por_no_etapa = [{"no": no, "etapa": etapa, **_agregar(grupo)} for (no, etapa), grupo in grupos.items()]
+    por_no_etapa.sort(key=lambda linha: linha["tokens_entrada"] + linha["tokens_saida"], reverse=True)
+    por_prompt: Dict[str, List[Dict[str, Any]]] = {}
+    for registro in registros:
+        por_prompt.setdefault(registro["prompt"], []).append(registro)
+    return {
+        "id_processo": id_processo,
+        "orcamento_tokens": ORCAMENTO_TOKENS_POR_SIMULACAO or None,
+        "totais": _agregar(registros),
+        "por_no_etapa": por_no_etapa,
+        "por_prompt": {id_prompt: _agregar(grupo) for id_prompt, grupo in por_prompt.items()},
+        "registros": registros,
+    }
+
+def consumo_em_csv(consumo: Dict[str, Any]) -> str:
+    """Registros de cada chamada em CSV (uma linha por chamada)."""
+    saida = io.StringIO()
+    escritor = csv.DictWriter(saida, fieldnames=CAMPOS_REGISTRO)
+    escritor.writeheader()
+    escritor.writerows(consumo.get("registros", []))
+    return saida.getvalue()
+
+def exportar_consumo(consumo: Dict[str, Any], caminho: str) -> None:
+    """Grava o consumo em 'caminho': CSV com os registros (.csv) ou JSON completo (qualquer outra extensão)."""
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        if caminho.lower().endswith(".csv"):
+            arquivo.write(consumo_em_csv(consumo))
+        else:
+            json.dump(consumo, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    print("--- Testando Contabilidade de Tokens ---")
+    for no, etapa, segundos in (("juiz", "SENTENCA", 0.02), ("advogado_autor", "PETICAO_INICIAL", 0.01)):
+        with medir_chamada_llm("proc_teste", no, etapa, "prompt_teste", "Redija a peça. " * 200) as medicao:
+            time.sleep(segundos)
+            medicao.resposta = "Texto gerado. " * 50
+    with medir_chamada_llm("proc_teste", "juiz", "SENTENCA", "prompt_teste", "Redija a peça. " * 200) as medicao:
+        marcar_resposta_do_cache()
+        medicao.resposta = "Texto gerado. " * 50
+    try:
+        with medir_chamada_llm("proc_teste", "juiz", "SENTENCA", "prompt_teste", "x"):
+            raise TimeoutError("teste")
+    except TimeoutError:
+        pass
+    consumo = consumo_do_processo("proc_teste")
+    print(f"  Totais: {consumo['totais']}")
+    for linha in consumo["por_no_etapa"]:
+        print(f"  {linha}")
+    assert consumo["totais"]["chamadas"] == 4 and consumo["totais"]["respostas_do_cache"] == 1 and consumo["totais"]["erros"] == 1
+    assert consumo["por_no_etapa"][0]["etapa"] == "SENTENCA"
+    assert consumo_em_csv(consumo).count("\n") == 5
+    reiniciar_consumo("proc_teste")
+    assert consumo_do_processo("proc_teste")["totais"]["chamadas"] == 0 and tokens_consumidos("proc_teste") == 0
+    print("--- Fim dos Testes Contabilidade de Tokens ---")
@@ -0,0 +1,143 @@
+# divisor_secoes.py
+
+import re
+import unicodedata
+from typing import List, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from settings import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_SECAO_MAX_CARACTERES,
+    CHUNK_SECAO_MIN_CARACTERES
+)
+
+# Títulos de seção das peças e decisões (comparados sem acentos, em maiúsculas, pelo início da linha).
+TITULOS_SECOES = (
+    "DOS FATOS", "DO FATO", "DOS FUNDAMENTOS", "DO DIREITO", "DA FUNDAMENTACAO", "FUNDAMENTACAO",
+    "DOS PEDIDOS", "DO PEDIDO", "DOS REQUERIMENTOS", "DAS PROVAS", "DO VALOR DA CAUSA",
+    "RELATORIO", "DISPOSITIVO", "PRELIMINAR", "DAS PRELIMINARES", "DO MERITO", "MERITO",
+    "SINTESE", "DA TUTELA"
+)
+SECAO_PREAMBULO = "PREÂMBULO" # Texto antes do primeiro título (endereçamento, qualificação, nome da peça)
+
+# Numeração de seção: "I - ", "II. ", "3) ", "IV.2 - " etc.
+_PADRAO_NUMERACAO = re.compile(r"^(?:[IVXLCDM]+|\d+)(?:\.\d+)*\s*(?:[-–—.)]\s*)+")
+_MAX_CARACTERES_TITULO = 100
+
+
+def _sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+def identificar_titulo_secao(linha: str) -> Union[str, None]:
+    """
+    Retorna o nome da seção se a linha for um título de seção, ou None.
+
+    Uma linha é título se, sem a numeração, começar por um dos TITULOS_SECOES (ex: "Dos Fatos:",
+    "I - RELATÓRIO") ou se for numerada e estiver toda em maiúsculas (ex: "II. DA REALIDADE DOS
+    FATOS"). Subtítulos numerados em caixa mista ("II.3. Dos Danos Morais") ficam dentro da seção.
+    """
+    linha = linha.strip()
+    if not linha or len(linha) > _MAX_CARACTERES_TITULO:
+        return None
+    numeracao = _PADRAO_NUMERACAO.match(linha)
+    titulo = linha[numeracao.end():] if numeracao else linha
+    titulo = titulo.strip().rstrip(":.").strip()
+    if not titulo:
+        return None
+    titulo_normalizado = _sem_acentos(titulo).upper()
+    if any(titulo_normalizado == t or titulo_normalizado.startswith(t + " ") for t in TITULOS_SECOES):
+        return titulo.upper()
+    letras = [c for c in titulo if c.isalpha()]
+    if numeracao and len(letras) >= 4 and all(c.isupper() for c in letras):
+        return titulo
+    return None
+
+
+class DivisorSecoesJuridicas:
+    """
+    Divide peças e decisões pelas seções processuais (DOS FATOS, DO DIREITO, DOS PEDIDOS,
+    RELATÓRIO, FUNDAMENTAÇÃO, DISPOSITIVO...), gerando um chunk por seção, sem sobreposição.
+
+    Seções maiores que 'max_caracteres' são subdivididas em parágrafos, e cada parte repete o
+    título da seção; seções menores que 'min_caracteres' são unidas à anterior (ou, se forem a
+    primeira, à seguinte). Documentos sem nenhum título reconhecido são divididos pelo
+    RecursiveCharacterTextSplitter, como antes.
+    Metadados adicionados: 'secao', 'indice_secao' e, para seções subdivididas, 'parte_secao'.
+    """
+
+    def __init__(
+        self,
+        max_caracteres: int = CHUNK_SECAO_MAX_CARACTERES,
+        min_caracteres: int = CHUNK_SECAO_MIN_CARACTERES
+    ):
+        self.max_caracteres = max_caracteres
+        self.min_caracteres = min_caracteres
+        self._divisor_secoes_longas = RecursiveCharacterTextSplitter(
+            chunk_size=max_caracteres, chunk_overlap=0, separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        self._divisor_sem_secoes = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    def _separar_secoes(self, texto: str) -> List[Tuple[str, str]]:
+        secoes: List[Tuple[str, List[str]]] = [(SECAO_PREAMBULO, [])]
+        for linha in texto.splitlines():
+            titulo = identificar_titulo_secao(linha)
+            if titulo:
+                secoes.append((titulo, [linha.strip()]))
+            else:
+                secoes[-1][1].append(linha)
+        resultado = []
+        prefixo = "" # Primeira seção curta demais (ex: só o nome da peça): vai para o início da seguinte
+        for titulo, linhas in secoes:
+            conteudo = "\n".join(linhas).strip()
+            if not conteudo:
+                continue
+            if prefixo:
+                conteudo, prefixo = f"{prefixo}\n\n{conteudo}", ""
+            if not resultado and len(conteudo) < self.min_caracteres:
+                prefixo = conteudo
+            elif resultado and len(conteudo) < self.min_caracteres and len(resultado[-1][1]) + len(conteudo) <= self.max_caracteres:
+                resultado[-1] = (resultado[-1][0], f"{resultado[-1][1]}\n\n{conteudo}")
+            else:
+                resultado.append((titulo, conteudo))
+        if prefixo: # Documento inteiro menor que o mínimo
+            resultado.append((SECAO_PREAMBULO, prefixo))
+        return resultado
+
+    def split_documents(self, documentos: List[Document]) -> List[Document]:
+        chunks: List[Document] = []
+        for documento in documentos:
+            secoes = self._separar_secoes(documento.page_content)
+            if not any(titulo != SECAO_PREAMBULO for titulo, _ in secoes):
+                chunks.extend(self._divisor_sem_secoes.split_documents([documento]))
+                continue
+            for indice_secao, (titulo, conteudo) in enumerate(secoes):
+                metadados = {**documento.metadata, "secao": titulo, "indice_secao": indice_secao}
+                if len(conteudo) <= self.max_caracteres:
+                    chunks.append(Document(page_content=conteudo, metadata=metadados))
+                    continue
+                partes = self._divisor_secoes_longas.split_text(conteudo)
+                for numero_parte, parte in enumerate(partes, start=1):
+                    if numero_parte > 1 and titulo != SECAO_PREAMBULO:
+                        parte = f"{titulo} (continuação)\n{parte}"
+                    chunks.append(Document(page_content=parte, metadata={**metadados, "parte_secao": numero_parte}))
+        return chunks
+
+
+if __name__ == '__main__':
+    print("--- Testando Divisor de Seções ---")
+    texto_teste = (
+        "EXCELENTÍSSIMO SENHOR DOUTOR JUIZ DE DIREITO\nAÇÃO DE INDENIZAÇÃO\n"
+        "I. DOS FATOS\nO autor contratou o réu.\nII.1. Do Atraso\nO réu atrasou a entrega.\n"
+        "II - DO DIREITO\nAplica-se o art. 389 do Código Civil.\n"
+        "III. DOS PEDIDOS\nRequer a procedência.\nIV. DO VALOR DA CAUSA\nR$ 10.000,00."
+    )
+    divisor = DivisorSecoesJuridicas(max_caracteres=200, min_caracteres=30)
+    for chunk in divisor.split_documents([Document(page_content=texto_teste, metadata={"file_name": "teste.docx"})]):
+        print(f"  [{chunk.metadata['indice_secao']}] {chunk.metadata['secao']}: {chunk.page_content[:60]!r}")
+    assert identificar_titulo_secao("I - RELATÓRIO") == "RELATÓRIO"
+    assert identificar_titulo_secao("Dos Fatos:") == "DOS FATOS"
+    assert identificar_titulo_secao("II.3. Da Não Configuração de Danos Morais") is None
+    print("--- Fim dos Testes Divisor de Seções ---")
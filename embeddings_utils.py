@@ -0,0 +1,409 @@
+# embeddings_utils.py
+
+import hashlib
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from busca_lexical import tokenizar
+from cache_utils import ArmazenamentoLRU
+from limites_api import BaldeDeTokens
+from settings import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    EMBEDDING_LOCAL_DIMENSAO,
+    EMBEDDING_LOCAL_NGRAMAS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_LOTE_MAX_TEXTOS,
+    EMBEDDING_LOTE_MAX_CARACTERES,
+    EMBEDDING_MAX_CONCORRENCIA,
+    EMBEDDING_REQUISICOES_POR_MINUTO,
+    EMBEDDING_MAX_TENTATIVAS,
+    GOOGLE_API_KEY
+)
+
+
+class AgendadorEmbeddings(Embeddings):
+    """
+    Envia os textos ao modelo de embeddings em lotes, com concorrência limitada e taxa controlada.
+
+    Os textos são agrupados em lotes de até EMBEDDING_LOTE_MAX_TEXTOS textos e
+    EMBEDDING_LOTE_MAX_CARACTERES caracteres; até EMBEDDING_MAX_CONCORRENCIA lotes rodam em
+    paralelo, sempre respeitando o balde de requisições por minuto. Um lote que falhar (ex: erro
+    de cota) é repetido sozinho, com backoff exponencial, sem derrubar os demais.
+    """
+
+    def __init__(
+        self,
+        embeddings_base: Embeddings,
+        max_textos_lote: int = EMBEDDING_LOTE_MAX_TEXTOS,
+        max_caracteres_lote: int = EMBEDDING_LOTE_MAX_CARACTERES,
+        max_concorrencia: int = EMBEDDING_MAX_CONCORRENCIA,
+        requisicoes_por_minuto: int = EMBEDDING_REQUISICOES_POR_MINUTO,
+        max_tentativas: int = EMBEDDING_MAX_TENTATIVAS
+    ):
+        self.embeddings_base = embeddings_base
+        self.max_textos_lote = max_textos_lote
+        self.max_caracteres_lote = max_caracteres_lote
+        self.max_concorrencia = max_concorrencia
+        self.max_tentativas = max_tentativas
+        self.balde = BaldeDeTokens(requisicoes_por_minuto / 60.0, capacidade=max_concorrencia)
+        self.ultimas_metricas: Dict[str, Any] = {} # Métricas da última chamada concluída (para logs/benchmarks)
+        self._lock_metricas = threading.Lock()
+
+    def _montar_lotes(self, textos: List[str]) -> List[List[int]]:
+        """Agrupa os índices dos textos em lotes respeitando os limites de quantidade e tamanho."""
+        lotes: List[List[int]] = []
+        lote_atual: List[int] = []
+        caracteres_lote = 0
+        for indice, texto in enumerate(textos):
+            if lote_atual and (len(lote_atual) >= self.max_textos_lote or caracteres_lote + len(texto) > self.max_caracteres_lote):
+                lotes.append(lote_atual)
+                lote_atual, caracteres_lote = [], 0
+            lote_atual.append(indice)
+            caracteres_lote += len(texto)
+        if lote_atual:
+            lotes.append(lote_atual)
+        return lotes
+
+    def _com_novas_tentativas(self, funcao, descricao: str, metricas: Union[Dict[str, Any], None] = None):
+        """
+        Executa 'funcao' respeitando o balde; em caso de erro, repete com backoff exponencial + jitter.
+        As novas tentativas são contadas em 'metricas' (as da chamada em andamento), se informado.
+        """
+        for tentativa in range(1, self.max_tentativas + 1):
+            self.balde.consumir()
+            try:
+                return funcao()
+            except Exception as e:
+                if tentativa == self.max_tentativas:
+                    raise
+                espera = min(60.0, 2 ** (tentativa - 1)) * (0.5 + random.random())
+                print(f"[EMBEDDINGS] Falha em {descricao} (tentativa {tentativa}/{self.max_tentativas}): {e}. Nova tentativa em {espera:.1f}s.")
+                if metricas is not None:
+                    with self._lock_metricas:
+                        metricas["novas_tentativas"] += 1
+                time.sleep(espera)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        inicio = time.perf_counter()
+        lotes = self._montar_lotes(texts)
+        # Métricas desta chamada: o agendador é compartilhado por indexador, ingestão e simulações.
+        metricas: Dict[str, Any] = {"chunks": len(texts), "lotes": len(lotes), "novas_tentativas": 0}
+
+        def embedar_lote(numero_lote: int, indices: List[int]) -> List[List[float]]:
+            textos_lote = [texts[i] for i in indices]
+            return self._com_novas_tentativas(
+                lambda: self.embeddings_base.embed_documents(textos_lote),
+                f"lote {numero_lote + 1}/{len(lotes)}",
+                metricas
+            )
+
+        resultado: List[Union[List[float], None]] = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(self.max_concorrencia, len(lotes))) as executor:
+            futuros = [(indices, executor.submit(embedar_lote, n, indices)) for n, indices in enumerate(lotes)]
+            erros = []
+            for indices, futuro in futuros:
+                try:
+                    for indice, vetor in zip(indices, futuro.result()):
+                        resultado[indice] = vetor
+                except Exception as e:
+                    erros.append(e)
+        if erros:
+            raise RuntimeError(f"{len(erros)} de {len(lotes)} lote(s) de embeddings falharam após {self.max_tentativas} tentativas: {erros[0]}")
+
+        duracao = time.perf_counter() - inicio
+        metricas.update({
+            "segundos": round(duracao, 3),
+            "chunks_por_segundo": round(len(texts) / duracao, 1) if duracao > 0 else None
+        })
+        with self._lock_metricas:
+            self.ultimas_metricas = metricas
+        print(f"[EMBEDDINGS] {len(texts)} chunk(s) em {len(lotes)} lote(s) em {duracao:.2f}s "
+              f"({metricas['chunks_por_segundo']} chunks/s, {metricas['novas_tentativas']} nova(s) tentativa(s)).")
+        return resultado
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._com_novas_tentativas(lambda: self.embeddings_base.embed_query(text), "embedding da consulta")
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    Envolve um modelo de embeddings com um cache persistente endereçado por conteúdo.
+
+    A chave de cada vetor é o hash SHA-256 do nome do modelo + texto do chunk, de modo que
+    modelos (.docx) que não mudaram nunca são enviados novamente à API. Apenas os textos
+    ausentes do cache são repassados ao modelo base, em uma única chamada.
+    """
+
+    def __init__(
+        self,
+        embeddings_base: Embeddings,
+        nome_modelo: str,
+        armazenamento: ArmazenamentoLRU,
+        tamanho_fatia: int = EMBEDDING_LOTE_MAX_TEXTOS * EMBEDDING_MAX_CONCORRENCIA
+    ):
+        self.embeddings_base = embeddings_base
+        self.nome_modelo = nome_modelo
+        self.armazenamento = armazenamento
+        self.tamanho_fatia = tamanho_fatia
+
+    def _chave(self, texto: str, tipo: str = "documento") -> str:
+        # Chunks mantêm a chave original (modelo + texto); consultas ganham um prefixo próprio.
+        prefixo = self.nome_modelo if tipo == "documento" else f"{self.nome_modelo}\x00{tipo}"
+        return hashlib.sha256(f"{prefixo}\x00{texto}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        chaves = [self._chave(texto) for texto in texts]
+        valores = self.armazenamento.obter_varios(chaves)
+
+        # Textos repetidos no mesmo lote são embedados uma única vez.
+        pendentes = {}
+        for chave, texto, valor in zip(chaves, texts, valores):
+            if valor is None and chave not in pendentes:
+                pendentes[chave] = texto
+
+        # Os pendentes são enviados em fatias e gravados a cada fatia: se a API falhar no meio,
+        # o que já foi embedado fica no cache e a próxima tentativa continua de onde parou.
+        novos_vetores = {}
+        chaves_pendentes = list(pendentes.keys())
+        for inicio in range(0, len(chaves_pendentes), self.tamanho_fatia):
+            fatia = chaves_pendentes[inicio:inicio + self.tamanho_fatia]
+            vetores = self.embeddings_base.embed_documents([pendentes[chave] for chave in fatia])
+            self.armazenamento.gravar_varios(
+                (chave, np.asarray(vetor, dtype=np.float32).tobytes())
+                for chave, vetor in zip(fatia, vetores)
+            )
+            novos_vetores.update(zip(fatia, vetores))
+        reaproveitados = sum(1 for valor in valores if valor is not None)
+        print(f"[EMBEDDINGS] {reaproveitados} chunk(s) reaproveitados do cache, {len(pendentes)} embedado(s) via API.")
+
+        resultado = []
+        for chave, valor in zip(chaves, valores):
+            if valor is not None:
+                resultado.append(np.frombuffer(valor, dtype=np.float32).tolist())
+            else:
+                resultado.append(list(novos_vetores[chave]))
+        return resultado
+
+    def _vetor_consulta(self, chave: str, text: str) -> List[float]:
+        valor = self.armazenamento.obter(chave)
+        if valor is not None:
+            return np.frombuffer(valor, dtype=np.float32).tolist()
+        vetor = list(self.embeddings_base.embed_query(text))
+        self.armazenamento.gravar(chave, np.asarray(vetor, dtype=np.float32).tobytes())
+        return vetor
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeda uma consulta. As consultas fixas pré-computadas (CONSULTAS_MODELOS_RAG) vêm da memória
+        do processo; as demais (ex: consultas do caso) passam pelo cache em disco, que tem limite de tamanho.
+        """
+        chave = self._chave(text, tipo="consulta")
+        vetor = _vetores_consultas.get(chave)
+        if vetor is not None:
+            return vetor
+        return self._vetor_consulta(chave, text)
+
+    def pre_computar_consultas(self, consultas: List[str]) -> None:
+        """Garante que os vetores das consultas informadas estejam na memória do processo."""
+        for consulta in consultas:
+            chave = self._chave(consulta, tipo="consulta")
+            if chave not in _vetores_consultas:
+                _vetores_consultas[chave] = self._vetor_consulta(chave, consulta)
+
+
+class EmbeddingsHashLocal(Embeddings):
+    """
+    Embeddings locais, determinísticos e sem rede: cada palavra (normalizada como na busca
+    lexical) e seus n-gramas de caracteres são projetados por hash (crc32) em um vetor de
+    dimensão fixa, com sinal também derivado do hash; o vetor final é normalizado (L2).
+
+    A qualidade semântica é bem inferior à do Gemini, mas palavras com o mesmo radical
+    ("contestação"/"contestar") compartilham n-gramas e ficam próximas. Serve para rodar o RAG
+    sem GOOGLE_API_KEY, em CI e em benchmarks de recuperação em escala, sem gastar cota.
+    """
+
+    def __init__(self, dimensao: int = EMBEDDING_LOCAL_DIMENSAO, ngramas: Tuple[int, int] = EMBEDDING_LOCAL_NGRAMAS):
+        self.dimensao = dimensao
+        self.ngramas = ngramas
+        self.nome_modelo = f"local-hash-d{dimensao}-n{ngramas[0]}-{ngramas[1]}"
+        # Projeção de cada palavra já vista (o vocabulário é pequeno perto do número de chunks).
+        self._projecoes: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _projetar_palavra(self, palavra: str) -> Tuple[np.ndarray, np.ndarray]:
+        projecao = self._projecoes.get(palavra)
+        if projecao is not None:
+            return projecao
+        marcada = f"<{palavra}>"
+        caracteristicas = [palavra] + [
+            marcada[i:i + n]
+            for n in range(self.ngramas[0], self.ngramas[1] + 1)
+            for i in range(len(marcada) - n + 1)
+        ]
+        hashes = np.array([zlib.crc32(c.encode("utf-8")) for c in caracteristicas], dtype=np.uint64)
+        indices = (hashes % self.dimensao).astype(np.int64)
+        sinais = np.where((hashes >> np.uint64(31)) & np.uint64(1), -1.0, 1.0)
+        projecao = (indices, sinais)
+        with self._lock:
+            if len(self._projecoes) > 500_000: # Limite de memória para corpora muito grandes
+                self._projecoes.clear()
+            self._projecoes[palavra] = projecao
+        return projecao
+
+    def _embedar(self, texto: str) -> List[float]:
+        frequencias = Counter(tokenizar(texto))
+        if not frequencias:
+            return [0.0] * self.dimensao
+        todos_indices, todos_pesos = [], []
+        for palavra, frequencia in frequencias.items():
+            indices, sinais = self._projetar_palavra(palavra)
+            todos_indices.append(indices)
+            todos_pesos.append(sinais * (1.0 + np.log(frequencia))) # TF sublinear
+        vetor = np.bincount(np.concatenate(todos_indices), weights=np.concatenate(todos_pesos), minlength=self.dimensao)
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma > 0 else vetor).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embedar(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embedar(text)
+
+    def pre_computar_consultas(self, consultas: List[str]) -> None:
+        # Embedar localmente é mais barato que consultar um cache; nada a pré-computar.
+        pass
+
+
+# Vetores das consultas fixas pré-computadas neste processo (chave inclui o nome do modelo).
+# Só pre_computar_consultas grava aqui: consultas avulsas não crescem a memória do servidor.
+_vetores_consultas: Dict[str, List[float]] = {}
+
+_modelo_embeddings: Union[Embeddings, None] = None
+_armazenamento_embeddings: Union[ArmazenamentoLRU, None] = None
+_lock_instancias = threading.Lock()
+
+def obter_armazenamento_embeddings() -> ArmazenamentoLRU:
+    """Retorna o cache de embeddings do processo (aberto na primeira chamada)."""
+    global _armazenamento_embeddings
+    with _lock_instancias:
+        if _armazenamento_embeddings is None:
+            _armazenamento_embeddings = ArmazenamentoLRU(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+        return _armazenamento_embeddings
+
+def _criar_backend_google() -> Union[Embeddings, None]:
+    """
+    Embeddings do Google envolvidos pelo cache persistente e pelo agendador de lotes
+    (cache -> agendador -> API). O agendador é único para que todas as sessões compartilhem
+    o mesmo limite de taxa.
+    """
+    global _modelo_embeddings
+    if not GOOGLE_API_KEY:
+        print("ERRO EMBEDDINGS: GOOGLE_API_KEY não configurada. Não é possível criar embeddings "
+              "(para rodar sem rede, defina EMBEDDING_BACKEND=local).")
+        return None
+    with _lock_instancias:
+        if _modelo_embeddings is None:
+            embeddings_google = GoogleGenerativeAIEmbeddings(
+                model=EMBEDDING_MODEL_NAME,
+                task_type="retrieval_document",
+                google_api_key=GOOGLE_API_KEY
+            )
+            _modelo_embeddings = AgendadorEmbeddings(embeddings_google)
+    return EmbeddingsComCache(_modelo_embeddings, EMBEDDING_MODEL_NAME, obter_armazenamento_embeddings())
+
+_embeddings_locais: Union[EmbeddingsHashLocal, None] = None
+
+def _criar_backend_local() -> Embeddings:
+    # Sem cache em disco nem agendador: calcular o vetor é mais rápido que ler do SQLite.
+    global _embeddings_locais
+    with _lock_instancias:
+        if _embeddings_locais is None:
+            _embeddings_locais = EmbeddingsHashLocal()
+        return _embeddings_locais
+
+# Backends disponíveis para EMBEDDING_BACKEND (settings.py).
+BACKENDS_EMBEDDINGS: Dict[str, Callable[[], Union[Embeddings, None]]] = {
+    "google": _criar_backend_google,
+    "local": _criar_backend_local,
+}
+
+def obter_modelo_embeddings(backend: str = EMBEDDING_BACKEND) -> Union[Embeddings, None]:
+    """
+    Retorna o modelo de embeddings do processo para o backend configurado.
+
+    Args:
+        backend: Nome do backend (ver BACKENDS_EMBEDDINGS); padrão EMBEDDING_BACKEND.
+
+    Returns:
+        Uma instância de Embeddings ou None se o backend não estiver disponível
+        (ex: "google" sem GOOGLE_API_KEY).
+    """
+    criar_backend = BACKENDS_EMBEDDINGS.get(backend)
+    if criar_backend is None:
+        print(f"ERRO EMBEDDINGS: Backend '{backend}' desconhecido. Opções: {list(BACKENDS_EMBEDDINGS)}.")
+        return None
+    return criar_backend()
+
+def identificador_embeddings(embeddings_model: Embeddings) -> str:
+    """Identifica o modelo de embeddings (índices construídos com modelos diferentes não se misturam)."""
+    return getattr(embeddings_model, "nome_modelo", type(embeddings_model).__name__)
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    print("--- Testando Embeddings Utils ---")
+
+    class _EmbeddingsContador(Embeddings):
+        """Modelo falso que conta quantos textos foram embedados."""
+        def __init__(self):
+            self.chamadas = 0
+        def embed_documents(self, texts):
+            self.chamadas += len(texts)
+            return [[float(len(t)), 1.0] for t in texts]
+        def embed_query(self, text):
+            return [float(len(text)), 1.0]
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        base = _EmbeddingsContador()
+        cache = ArmazenamentoLRU(os.path.join(pasta_tmp, "emb.sqlite3"), max_bytes=10_000)
+        modelo = EmbeddingsComCache(base, "modelo-teste", cache)
+        modelo.embed_documents(["petição", "sentença", "petição"])
+        modelo.embed_documents(["petição", "sentença", "contestação"])
+        print(f"  Textos enviados ao modelo base: {base.chamadas} (esperado 3)")
+        assert base.chamadas == 3
+
+    class _EmbeddingsInstavel(_EmbeddingsContador):
+        """Modelo falso que falha na primeira chamada (simula erro de cota)."""
+        def embed_documents(self, texts):
+            if self.chamadas == 0:
+                self.chamadas += 1
+                raise RuntimeError("429 Resource has been exhausted")
+            return super().embed_documents(texts)
+
+    agendador = AgendadorEmbeddings(_EmbeddingsInstavel(), max_textos_lote=4, max_concorrencia=2, requisicoes_por_minuto=6000)
+    vetores = agendador.embed_documents([f"chunk {i}" for i in range(10)])
+    print(f"  Agendador: {len(vetores)} vetores, métricas: {agendador.ultimas_metricas}")
+    assert len(vetores) == 10 and all(v is not None for v in vetores)
+
+    local = EmbeddingsHashLocal()
+    v_contestacao, v_contestar, v_sentenca = np.array(local.embed_documents(["contestação", "contestar", "sentença"]))
+    print(f"  Local: sim(contestação, contestar)={v_contestacao @ v_contestar:.2f}, "
+          f"sim(contestação, sentença)={v_contestacao @ v_sentenca:.2f}")
+    assert local.embed_query("contestação") == EmbeddingsHashLocal().embed_query("contestação") # Determinístico
+    assert v_contestacao @ v_contestar > v_contestacao @ v_sentenca
+    print("--- Fim dos Testes Embeddings Utils ---")
@@ -31,7 +31,7 @@ class EstadoProcessual(TypedDict):
     proximo_ator_sugerido_pelo_ultimo_no: Union[str, None]
 
     documento_gerado_na_etapa_recente: Union[str, None]
-    historico_completo: List[Dict[str, str]]
+    historico_completo: List[Dict[str, str]] # {"etapa", "ator", "documento", "resumo"} (ver historico_processual.py)
 
     pontos_controvertidos_saneamento: Union[str, None]
     manifestacao_autor_sem_provas: bool
@@ -47,6 +47,9 @@ class EstadoProcessual(TypedDict):
     sentimento_peticao_inicial: Union[str, None]
     sentimento_contestacao: Union[str, None]
 
+    # Tokens, latência e uso do cache das chamadas ao LLM, por nó e etapa (ver contabilidade_tokens.py)
+    consumo_llm: Union[Dict[str, Any], None]
+
 # --- Mapa de Fluxo Processual (Rito Ordinário) ---
 # Chave: (ultimo_ator, etapa_concluida_pelo_ultimo_ator, ator_atual_designado_pelo_router)
 # Valor: etapa_a_ser_executada_pelo_ator_atual
@@ -160,7 +163,8 @@ if __name__ == '__main__':
         #     },
         #     documentos_juntados_pelo_reu=None,
         #     sentimento_peticao_inicial=None,
-        #     sentimento_contestacao=None
+        #     sentimento_contestacao=None,
+        #     consumo_llm=None
         # )
         # for event in app.stream(input=estado_inicial_teste, config={"recursion_limit": 15}):
         #     for key, value in event.items():
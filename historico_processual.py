@@ -0,0 +1,150 @@
+# historico_processual.py
+#
+# Histórico do processo para os prompts. Cada ato entra no histórico com um resumo extrativo de
+# tamanho limitado, calculado uma única vez quando o ato é produzido (sem chamada ao LLM). Os prompts
+# recebem o histórico como esses resumos, dentro de um orçamento de caracteres, e a íntegra apenas
+# das peças de que precisam (passadas em variáveis próprias e excluídas do resumo). Assim o tamanho
+# dos prompts deixa de crescer com a soma de todas as peças anteriores.
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from divisor_secoes import identificar_titulo_secao
+from settings import RESUMO_ATO_MAX_CARACTERES, HISTORICO_PROMPT_MAX_CARACTERES
+
+# Seções que concentram o que foi pedido ou decidido no ato (comparadas sem acentos, em maiúsculas).
+SECOES_DECISIVAS = ("PEDIDO", "REQUERIMENTO", "DISPOSITIVO", "PONTOS CONTROVERTIDOS", "CONCLUSAO")
+_MARCADOR_PONTOS_CONTROVERTIDOS = re.compile(r"PONTOS CONTROVERTIDOS\s*:", re.IGNORECASE)
+_MAX_CARACTERES_ABERTURA = 200 # Início do preâmbulo (endereçamento / nome da peça)
+
+
+def _sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+def _compactar(texto: str) -> str:
+    return re.sub(r"\s+", " ", texto).strip()
+
+def _truncar(texto: str, max_caracteres: int) -> str:
+    if len(texto) <= max_caracteres:
+        return texto
+    corte = texto.rfind(" ", 0, max_caracteres - 3)
+    return texto[:corte if corte > max_caracteres // 2 else max_caracteres - 3].rstrip(" ,;:") + "..."
+
+def _secoes(documento: str) -> List[Tuple[Union[str, None], str]]:
+    """(título, conteúdo) das seções do documento; o trecho antes do primeiro título vem com título None."""
+    secoes: List[Tuple[Union[str, None], List[str]]] = [(None, [])]
+    for linha in documento.splitlines():
+        titulo = identificar_titulo_secao(linha)
+        if titulo:
+            secoes.append((titulo, []))
+        else:
+            secoes[-1][1].append(linha)
+    return [(titulo, _compactar("\n".join(linhas))) for titulo, linhas in secoes]
+
+def resumir_ato(documento: str, max_caracteres: int = RESUMO_ATO_MAX_CARACTERES) -> str:
+    """
+    Resumo extrativo de uma peça ou decisão, com no máximo 'max_caracteres' caracteres.
+
+    Mantém a abertura do documento e as seções decisivas (pedidos, requerimentos, dispositivo,
+    pontos controvertidos). Sem seções decisivas, usa o início e o fim do texto.
+    """
+    documento = documento or ""
+    if len(_compactar(documento)) <= max_caracteres:
+        return _compactar(documento)
+    secoes = _secoes(documento)
+    abertura = _truncar(secoes[0][1] or _compactar(documento), _MAX_CARACTERES_ABERTURA)
+    decisivas, demais = [], []
+    for titulo, conteudo in secoes[1:]:
+        if conteudo:
+            decisiva = any(marca in _sem_acentos(titulo).upper() for marca in SECOES_DECISIVAS)
+            (decisivas if decisiva else demais).append(f"{titulo}: {conteudo}")
+    marcador = _MARCADOR_PONTOS_CONTROVERTIDOS.search(documento)
+    if marcador and not any("PONTOS CONTROVERTIDOS" in trecho.upper() for trecho in decisivas):
+        fim = documento.find("\n\n", marcador.end())
+        decisivas.append(f"PONTOS CONTROVERTIDOS: {_compactar(documento[marcador.end():fim if fim != -1 else None])}")
+    if not decisivas: # Sem títulos reconhecidos: início e fim (onde ficam pedidos e dispositivo)
+        texto = _compactar(documento)
+        metade = (max_caracteres - 5) // 2
+        return f"{_truncar(texto, metade)} [...] {texto[-metade:].lstrip()}"
+    restante = max_caracteres - len(abertura) - 7
+    corpo = " | ".join(_truncar(trecho, max(restante // len(decisivas), 80)) for trecho in decisivas)
+    # O que sobrar do limite vai para o início das demais seções (fatos, fundamentos...), na ordem do documento
+    sobra = restante - len(corpo) - 3 * len(demais)
+    if demais and sobra // len(demais) >= 60:
+        corpo = " | ".join([_truncar(trecho, sobra // len(demais)) for trecho in demais] + [corpo])
+    return _truncar(f"{abertura} [...] {corpo}", max_caracteres)
+
+def item_historico(etapa: str, ator: str, documento: str) -> Dict[str, str]:
+    """Item do 'historico_completo' com o resumo do ato já calculado."""
+    return {"etapa": etapa, "ator": ator, "documento": documento, "resumo": resumir_ato(documento)}
+
+def documento_da_etapa(historico: List[Dict[str, Any]], etapa: str, padrao: str = "N/A") -> str:
+    """Íntegra do ato mais recente da etapa no histórico (ou 'padrao')."""
+    for item in reversed(historico):
+        if item.get("etapa") == etapa:
+            return item.get("documento", padrao)
+    return padrao
+
+def formatar_historico_para_prompt(
+    historico: List[Dict[str, Any]],
+    etapas_em_integra: Iterable[str] = (),
+    max_caracteres: int = HISTORICO_PROMPT_MAX_CARACTERES,
+    sem_historico: str = "Histórico não disponível."
+) -> str:
+    """
+    Histórico em ordem cronológica, com o resumo de cada ato, em no máximo 'max_caracteres' caracteres.
+
+    Atos de 'etapas_em_integra' (já incluídos por inteiro no prompt) aparecem só como referência.
+    Os atos entram do mais recente para o mais antigo: com resumo enquanto couber, depois só com
+    etapa e ator; os mais antigos que nem assim couberem viram uma única linha "N ato(s) anterior(es)".
+    """
+    etapas_em_integra = set(etapas_em_integra)
+    linhas: List[str] = []
+    usados, esgotado = 0, False
+    reserva = len(f"- {len(historico)} ato(s) anterior(es) omitido(s).") + 1 # Linha que agrupa os mais antigos
+    for posicao, item in enumerate(reversed(historico)):
+        limite = max_caracteres - (reserva if posicao < len(historico) - 1 else 0)
+        separador = 1 if linhas else 0
+        cabecalho = f"- Etapa: {item.get('etapa')}, Ator: {item.get('ator')}"
+        if item.get("etapa") in etapas_em_integra:
+            linha = f"{cabecalho} (íntegra incluída acima)"
+        else:
+            linha = None
+            if not esgotado:
+                resumo = item.get("resumo") or resumir_ato(str(item.get("documento", "")))
+                linha = f"{cabecalho}:\n  Resumo: {resumo}"
+                if usados + separador + len(linha) > limite:
+                    esgotado, linha = True, None # Daqui para trás, só etapa e ator
+            linha = linha or f"{cabecalho} (resumo omitido)"
+        if usados + separador + len(linha) > limite:
+            linhas.append(f"- {len(historico) - posicao} ato(s) anterior(es) omitido(s).")
+            break
+        usados += separador + len(linha)
+        linhas.append(linha)
+    return "\n".join(reversed(linhas)) if linhas else sem_historico
+
+if __name__ == '__main__':
+    print("--- Testando Histórico Processual ---")
+    peticao = (
+        "EXCELENTÍSSIMO SENHOR DOUTOR JUIZ DE DIREITO\nAÇÃO DE INDENIZAÇÃO\n"
+        "I. DOS FATOS\n" + "O autor contratou o réu e houve atraso. " * 60 + "\n"
+        "II - DO DIREITO\n" + "Aplica-se o art. 389 do Código Civil. " * 40 + "\n"
+        "III. DOS PEDIDOS\nRequer a condenação do réu ao pagamento de R$ 10.000,00 e custas.\n"
+    )
+    saneamento = "DECISÃO DE SANEAMENTO\n" + "Partes legítimas. " * 100 + "\n\nPONTOS CONTROVERTIDOS: o atraso e o dano.\n\nIntimem-se."
+    resumo = resumir_ato(peticao)
+    print(f"  Petição ({len(peticao)} caracteres) -> resumo ({len(resumo)}): {resumo}")
+    assert len(resumo) <= RESUMO_ATO_MAX_CARACTERES and "DOS PEDIDOS" in resumo
+    assert "o atraso e o dano" in resumir_ato(saneamento)
+
+    historico = [item_historico(f"ETAPA_{i}", "juiz", peticao) for i in range(60)]
+    texto = formatar_historico_para_prompt(historico, etapas_em_integra=("ETAPA_59",))
+    print(f"  60 atos ({sum(len(i['documento']) for i in historico)} caracteres) -> histórico do prompt com {len(texto)} caracteres")
+    assert len(texto) <= HISTORICO_PROMPT_MAX_CARACTERES
+    assert texto.splitlines()[-1] == "- Etapa: ETAPA_59, Ator: juiz (íntegra incluída acima)" and "Resumo:" in texto
+    assert "(resumo omitido)" in texto and texto.startswith("- ") and "ato(s) anterior(es) omitido(s)." in texto.splitlines()[0]
+    for total in (1, 5, 200, 2000):
+        assert len(formatar_historico_para_prompt([item_historico(f"E{i}", "juiz", peticao) for i in range(total)])) <= HISTORICO_PROMPT_MAX_CARACTERES
+    assert documento_da_etapa(historico, "ETAPA_3") == peticao
+    print("--- Fim dos Testes Histórico Processual ---")
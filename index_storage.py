@@ -0,0 +1,553 @@
+# index_storage.py
+
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Union
+
+import faiss
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+try: # Travas de arquivo: fcntl no Linux/macOS, msvcrt no Windows
+    import fcntl
+    msvcrt = None
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from compressao_vetorial import indice_comprimido_de, tipo_do_indice
+from settings import (
+    FAISS_INDEX_PATH,
+    INDICE_CASO_TTL_SEGUNDOS,
+    INDICE_VERSOES_MANTIDAS
+)
+
+# Layout em disco (cada namespace é independente):
+#   FAISS_INDEX_PATH/modelos/           -> índice compartilhado dos modelos
+#   FAISS_INDEX_PATH/casos/<id>/        -> índice de cada processo
+#     .lock                             -> trava de escrita do namespace
+#     ATUAL                             -> ponteiro (JSON) para a versão publicada
+#     versoes/<versao>/                 -> versões imutáveis, no formato abaixo
+# Uma versão só fica visível depois de gravada por completo (escrita em pasta temporária,
+# rename e troca atômica do ponteiro), então leitores nunca veem um índice pela metade.
+#
+# Formato de cada versão (sem pickle):
+#   index.faiss    -> índice nativo do FAISS, aberto por mmap (sem cópia; as páginas ficam no
+#                     cache do sistema e são compartilhadas entre processos)
+#   chunks.jsonl   -> um registro JSON por chunk ({id, page_content, metadata}), na ordem do índice
+#   offsets.npy    -> posição (em bytes) de cada registro em chunks.jsonl, também por mmap
+#   ids.json       -> id do docstore de cada linha do índice
+#   formato.json   -> versão do formato, total de chunks, dimensão e estratégia de distância
+#   index_comprimido.faiss -> (opcional) índice comprimido usado na geração de candidatos,
+#                     também por mmap (ver compressao_vetorial.py)
+# O texto e os metadados de um chunk só são lidos quando ele é retornado por uma busca.
+#
+# Pacote pré-construído (fora dos namespaces, ex: incluído na imagem do container):
+#   <pasta do pacote>/  -> uma versão no formato acima + manifesto.json (quem construiu o índice
+#                          e a partir de quê), verificado por quem carrega o pacote
+
+NAMESPACE_MODELOS = "modelos"
+PASTA_CASOS = os.path.join(FAISS_INDEX_PATH, "casos")
+ARQUIVO_PONTEIRO = "ATUAL"
+ARQUIVO_TRAVA = ".lock"
+FORMATO_VERSAO = "mmap-v1"
+ARQUIVO_MANIFESTO = "manifesto.json"
+TERMO_LAPIDE = "~removido-" # Namespaces sendo apagados ('~' não aparece em nomes sanitizados)
+
+
+def caminho_namespace_modelos() -> str:
+    return os.path.join(FAISS_INDEX_PATH, NAMESPACE_MODELOS)
+
+def caminho_namespace_caso(id_processo: str) -> str:
+    """Pasta do índice de um processo (o id é sanitizado para uso como nome de pasta)."""
+    nome_seguro = re.sub(r"[^A-Za-z0-9_.-]", "_", id_processo) or "processo_sem_id"
+    return os.path.join(PASTA_CASOS, nome_seguro)
+
+def _travar(arquivo, bloquear: bool) -> bool:
+    try:
+        if fcntl:
+            flags = fcntl.LOCK_EX if bloquear else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(arquivo.fileno(), flags)
+        else:
+            arquivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not bloquear:
+                        raise
+                    time.sleep(0.1)
+        return True
+    except OSError:
+        return False
+
+def _destravar(arquivo) -> None:
+    if fcntl:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+    else:
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _ainda_no_caminho(arquivo, caminho_trava: str) -> bool:
+    try:
+        return os.path.samestat(os.fstat(arquivo.fileno()), os.stat(caminho_trava))
+    except OSError:
+        return False
+
+@contextmanager
+def trava_arquivo(caminho_trava: str, bloquear: bool = True) -> Iterator[bool]:
+    """
+    Trava exclusiva entre processos baseada em arquivo.
+
+    Se o arquivo da trava for movido ou removido enquanto se espera por ela (namespace removido
+    por coletar_indices_expirados), a trava obtida não vale mais: tenta-se de novo no arquivo atual.
+
+    Args:
+        caminho_trava: Arquivo usado como trava (criado se não existir).
+        bloquear: Se False, não espera pela trava; o valor produzido indica se ela foi obtida.
+
+    Yields:
+        True se a trava foi adquirida.
+    """
+    while True:
+        os.makedirs(os.path.dirname(caminho_trava), exist_ok=True)
+        arquivo = open(caminho_trava, "a+b")
+        adquirida = _travar(arquivo, bloquear)
+        if adquirida and not _ainda_no_caminho(arquivo, caminho_trava):
+            _destravar(arquivo)
+            arquivo.close()
+            continue
+        break
+    try:
+        yield adquirida
+    finally:
+        if adquirida:
+            _destravar(arquivo)
+        arquivo.close()
+
+class DocstoreMapeado(Docstore):
+    """
+    Docstore somente leitura sobre chunks.jsonl + offsets.npy (mapeados em memória).
+    Cada chunk é decodificado sob demanda, em search(); nada é carregado na abertura além dos ids.
+
+    close() libera o arquivo e o mmap (também usável como context manager). Um retriever que
+    ainda segure a versão fechada reabre o arquivo na próxima busca, se a pasta ainda existir.
+    """
+
+    def __init__(self, pasta_versao: str, ids: List[str]):
+        self._pasta_versao = pasta_versao
+        self._arquivo = None
+        self._mapa: Union[mmap.mmap, bytes, None] = None
+        self._lock = threading.Lock()
+        self._offsets = np.load(os.path.join(pasta_versao, "offsets.npy"), mmap_mode="r")
+        self._linha_por_id: Dict[str, int] = {id_chunk: linha for linha, id_chunk in enumerate(ids)}
+        self._abrir()
+        _docstores_abertos.add(self)
+
+    def _abrir(self) -> None:
+        # Chamado na criação ou com self._lock adquirido.
+        if not self._linha_por_id:
+            self._mapa = b""
+            return
+        self._arquivo = open(os.path.join(self._pasta_versao, "chunks.jsonl"), "rb")
+        self._mapa = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def pasta_versao(self) -> str:
+        return self._pasta_versao
+
+    def close(self) -> None:
+        """Fecha o mmap e o arquivo de chunks (pode ser chamado mais de uma vez)."""
+        with self._lock:
+            if isinstance(self._mapa, mmap.mmap):
+                self._mapa.close()
+            self._mapa = None
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+    def __enter__(self) -> "DocstoreMapeado":
+        return self
+
+    def __exit__(self, *_excecao) -> None:
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._linha_por_id)
+
+    def search(self, search: str) -> Union[str, Document]:
+        linha = self._linha_por_id.get(search)
+        if linha is None:
+            return f"ID {search} not found." # Mesmo contrato do InMemoryDocstore
+        with self._lock:
+            if self._mapa is None:
+                self._abrir()
+            dados = self._mapa[int(self._offsets[linha]):int(self._offsets[linha + 1])]
+        registro = json.loads(dados)
+        return Document(id=registro["id"], page_content=registro["page_content"], metadata=registro["metadata"])
+
+# Docstores abertos neste processo, para fechá-los antes de apagar a pasta da versão.
+_docstores_abertos: "weakref.WeakSet[DocstoreMapeado]" = weakref.WeakSet()
+
+def fechar_indice(vector_store: Union[FAISS, None]) -> None:
+    """Libera os arquivos de chunks de um índice aberto por abrir_versao_indice (outros índices são ignorados)."""
+    if vector_store is not None and isinstance(vector_store.docstore, DocstoreMapeado):
+        vector_store.docstore.close()
+
+def fechar_versoes_abertas(pasta: str) -> int:
+    """
+    Fecha os docstores deste processo abertos sobre versões dentro de 'pasta' (ex: um namespace
+    prestes a ser removido; no Windows, arquivos abertos impedem renomear ou apagar a pasta).
+
+    Returns:
+        Quantidade de docstores fechados.
+    """
+    prefixo = os.path.abspath(pasta) + os.sep
+    fechados = 0
+    for docstore in list(_docstores_abertos):
+        if os.path.abspath(docstore.pasta_versao).startswith(prefixo):
+            docstore.close()
+            fechados += 1
+    return fechados
+
+
+def salvar_versao_indice(pasta_versao: str, vector_store: FAISS) -> None:
+    """Grava 'vector_store' em 'pasta_versao' no formato mapeável (ver topo do módulo)."""
+    os.makedirs(pasta_versao, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(pasta_versao, "index.faiss"))
+    ids = [vector_store.index_to_docstore_id[linha] for linha in range(vector_store.index.ntotal)]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with open(os.path.join(pasta_versao, "chunks.jsonl"), "wb") as arquivo:
+        for linha, id_chunk in enumerate(ids):
+            doc = vector_store.docstore.search(id_chunk)
+            registro = json.dumps(
+                {"id": id_chunk, "page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False
+            ).encode("utf-8") + b"\n"
+            arquivo.write(registro)
+            offsets[linha + 1] = offsets[linha] + len(registro)
+    np.save(os.path.join(pasta_versao, "offsets.npy"), offsets)
+    with open(os.path.join(pasta_versao, "ids.json"), "w", encoding="utf-8") as arquivo:
+        json.dump(ids, arquivo)
+    indice_comprimido = indice_comprimido_de(vector_store)
+    if indice_comprimido is not None:
+        faiss.write_index(indice_comprimido, os.path.join(pasta_versao, "index_comprimido.faiss"))
+    with open(os.path.join(pasta_versao, "formato.json"), "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "formato": FORMATO_VERSAO,
+            "total": len(ids),
+            "dimensao": vector_store.index.d,
+            "distancia": vector_store.distance_strategy.value,
+            "normalizar_l2": vector_store._normalize_L2,
+            "comprimido": tipo_do_indice(indice_comprimido)
+        }, arquivo)
+
+def abrir_versao_indice(pasta_versao: str, embeddings_model: Embeddings) -> FAISS:
+    """
+    Abre uma versão gravada por salvar_versao_indice sem copiar vetores nem chunks para a memória.
+    O índice retornado é somente leitura; para alterá-lo, use copiar_indice.
+    """
+    with open(os.path.join(pasta_versao, "formato.json"), "r", encoding="utf-8") as arquivo:
+        formato = json.load(arquivo)
+    if formato.get("formato") != FORMATO_VERSAO:
+        raise ValueError(f"Formato de índice não suportado: {formato.get('formato')}")
+    index = faiss.read_index(os.path.join(pasta_versao, "index.faiss"), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    with open(os.path.join(pasta_versao, "ids.json"), "r", encoding="utf-8") as arquivo:
+        ids: List[str] = json.load(arquivo)
+    if len(ids) != index.ntotal or len(ids) != formato.get("total"):
+        raise ValueError(f"Versão inconsistente em '{pasta_versao}' ({len(ids)} chunks, {index.ntotal} vetores).")
+    vector_store = FAISS(
+        embedding_function=embeddings_model,
+        index=index,
+        docstore=DocstoreMapeado(pasta_versao, ids),
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=formato.get("normalizar_l2", False),
+        distance_strategy=DistanceStrategy(formato.get("distancia", DistanceStrategy.EUCLIDEAN_DISTANCE.value))
+    )
+    if formato.get("comprimido", "flat") != "flat":
+        vector_store.indice_comprimido = faiss.read_index(
+            os.path.join(pasta_versao, "index_comprimido.faiss"), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        )
+    return vector_store
+
+def copiar_indice(vector_store: FAISS, embeddings_model: Embeddings) -> FAISS:
+    """
+    Cópia em memória e alterável de um índice (ex: aberto por mmap), para atualizações incrementais.
+    O índice comprimido não é copiado: depois de alterar a cópia, recodifique-o (ver compressao_vetorial).
+    """
+    documentos = {
+        id_chunk: vector_store.docstore.search(id_chunk)
+        for id_chunk in vector_store.index_to_docstore_id.values()
+    }
+    return FAISS(
+        embedding_function=embeddings_model,
+        index=faiss.clone_index(vector_store.index),
+        docstore=InMemoryDocstore(documentos),
+        index_to_docstore_id=dict(vector_store.index_to_docstore_id),
+        normalize_L2=vector_store._normalize_L2,
+        distance_strategy=vector_store.distance_strategy
+    )
+
+def salvar_pacote_indice(pasta_pacote: str, vector_store: FAISS, manifesto: dict) -> None:
+    """
+    Grava 'vector_store' e seu manifesto como pacote em 'pasta_pacote', substituindo o anterior.
+    O pacote é montado em uma pasta temporária e só então trocado pelo anterior.
+    """
+    pasta_pacote = os.path.abspath(pasta_pacote)
+    pasta_tmp = f"{pasta_pacote}.{uuid.uuid4().hex[:8]}.tmp"
+    salvar_versao_indice(pasta_tmp, vector_store)
+    with open(os.path.join(pasta_tmp, ARQUIVO_MANIFESTO), "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+    pasta_antiga = None
+    if os.path.exists(pasta_pacote):
+        pasta_antiga = f"{pasta_pacote}.{uuid.uuid4().hex[:8]}.old"
+        os.rename(pasta_pacote, pasta_antiga)
+    os.rename(pasta_tmp, pasta_pacote)
+    if pasta_antiga:
+        shutil.rmtree(pasta_antiga, ignore_errors=True)
+
+def ler_manifesto_pacote(pasta_pacote: str) -> Union[dict, None]:
+    """Manifesto do pacote ou None se a pasta não contiver um pacote."""
+    try:
+        with open(os.path.join(pasta_pacote, ARQUIVO_MANIFESTO), "r", encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+def _ler_ponteiro(pasta_namespace: str) -> Union[dict, None]:
+    try:
+        with open(os.path.join(pasta_namespace, ARQUIVO_PONTEIRO), "r", encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+def carregar_indice(
+    pasta_namespace: str,
+    embeddings_model: Embeddings,
+    etiqueta_esperada: Union[str, None] = None
+) -> Union[FAISS, None]:
+    """
+    Carrega a versão publicada de um namespace, sem trava (versões publicadas são imutáveis).
+
+    Args:
+        pasta_namespace: Pasta do namespace (ver caminho_namespace_*).
+        embeddings_model: Modelo de embeddings associado ao índice.
+        etiqueta_esperada: Se informada, só carrega se a versão publicada tiver a mesma etiqueta
+                           (ex: hash do conteúdo do caso), evitando servir um índice desatualizado.
+
+    Returns:
+        O vector store FAISS ou None se não houver versão válida.
+    """
+    ponteiro = _ler_ponteiro(pasta_namespace)
+    if not ponteiro:
+        return None
+    if etiqueta_esperada is not None and ponteiro.get("etiqueta") != etiqueta_esperada:
+        return None
+    pasta_versao = os.path.join(pasta_namespace, "versoes", ponteiro.get("versao", ""))
+    try:
+        # Versões antigas (index.pkl) não têm formato.json: são recusadas aqui e reconstruídas.
+        vector_store = abrir_versao_indice(pasta_versao, embeddings_model)
+    except Exception as e:
+        print(f"[INDICE] Falha ao carregar versão '{ponteiro.get('versao')}' de '{pasta_namespace}': {e}")
+        return None
+    # Marca o uso para o coletor de índices expirados (TTL).
+    try:
+        os.utime(os.path.join(pasta_namespace, ARQUIVO_PONTEIRO))
+    except OSError:
+        pass
+    return vector_store
+
+def _publicar_indice(pasta_namespace: str, vector_store: FAISS, etiqueta: Union[str, None]) -> str:
+    # Chamado com a trava do namespace adquirida.
+    pasta_versoes = os.path.join(pasta_namespace, "versoes")
+    os.makedirs(pasta_versoes, exist_ok=True)
+    versao = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    pasta_tmp = os.path.join(pasta_versoes, f".{versao}.tmp")
+    salvar_versao_indice(pasta_tmp, vector_store)
+    os.rename(pasta_tmp, os.path.join(pasta_versoes, versao))
+
+    caminho_ponteiro = os.path.join(pasta_namespace, ARQUIVO_PONTEIRO)
+    caminho_ponteiro_tmp = f"{caminho_ponteiro}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(caminho_ponteiro_tmp, "w", encoding="utf-8") as arquivo:
+        json.dump({"versao": versao, "etiqueta": etiqueta, "publicado_em": time.time()}, arquivo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(caminho_ponteiro_tmp, caminho_ponteiro)
+
+    # Versões antigas são mantidas por um tempo para leitores que já resolveram o ponteiro anterior.
+    versoes_antigas = sorted(v for v in os.listdir(pasta_versoes) if not v.startswith("."))
+    for versao_antiga in versoes_antigas[:-INDICE_VERSOES_MANTIDAS]:
+        fechar_versoes_abertas(os.path.join(pasta_versoes, versao_antiga))
+        shutil.rmtree(os.path.join(pasta_versoes, versao_antiga), ignore_errors=True)
+    return versao
+
+def publicar_indice(pasta_namespace: str, vector_store: FAISS, etiqueta: Union[str, None] = None) -> Union[str, None]:
+    """
+    Publica 'vector_store' como nova versão do namespace (sob a trava do namespace).
+
+    Returns:
+        O nome da versão publicada ou None se a gravação falhar.
+    """
+    with trava_arquivo(os.path.join(pasta_namespace, ARQUIVO_TRAVA)) as adquirida:
+        if not adquirida:
+            print(f"[INDICE] Trava de '{pasta_namespace}' indisponível; índice não publicado.")
+            return None
+        try:
+            versao = _publicar_indice(pasta_namespace, vector_store, etiqueta)
+        except OSError as e:
+            print(f"[INDICE] Erro ao publicar índice em '{pasta_namespace}': {e}")
+            return None
+    print(f"[INDICE] Versão '{versao}' publicada em '{pasta_namespace}'.")
+    return versao
+
+def obter_ou_construir_indice(
+    pasta_namespace: str,
+    embeddings_model: Embeddings,
+    construir: Callable[[], Union[FAISS, None]],
+    etiqueta: Union[str, None] = None,
+    recriar: bool = False
+) -> Union[FAISS, None]:
+    """
+    Carrega o índice publicado do namespace ou o constrói e publica de forma atômica.
+
+    A construção acontece sob a trava do namespace: se dois processos pedirem o mesmo índice
+    ao mesmo tempo, o segundo espera e reaproveita a versão publicada pelo primeiro.
+
+    Args:
+        pasta_namespace: Pasta do namespace.
+        embeddings_model: Modelo de embeddings associado ao índice.
+        construir: Função que constrói o vector store (chamada só se necessário).
+        etiqueta: Identifica o conteúdo esperado (ver carregar_indice).
+        recriar: Ignora a versão publicada e constrói uma nova.
+
+    Returns:
+        O vector store FAISS ou None se a construção falhar.
+    """
+    if not recriar:
+        vector_store = carregar_indice(pasta_namespace, embeddings_model, etiqueta)
+        if vector_store is not None:
+            print(f"[INDICE] Índice carregado de '{pasta_namespace}'.")
+            return vector_store
+
+    with trava_arquivo(os.path.join(pasta_namespace, ARQUIVO_TRAVA)) as adquirida:
+        if not adquirida: # Sem a trava não se publica; o índice construído é usado só em memória
+            print(f"[INDICE] Trava de '{pasta_namespace}' indisponível; o índice não será publicado.")
+            return construir()
+        if not recriar: # Outro processo pode ter publicado enquanto esperávamos a trava
+            vector_store = carregar_indice(pasta_namespace, embeddings_model, etiqueta)
+            if vector_store is not None:
+                print(f"[INDICE] Índice publicado por outra sessão carregado de '{pasta_namespace}'.")
+                return vector_store
+        vector_store = construir()
+        if vector_store is None:
+            return None
+        try:
+            versao = _publicar_indice(pasta_namespace, vector_store, etiqueta)
+            print(f"[INDICE] Versão '{versao}' publicada em '{pasta_namespace}'.")
+        except OSError as e:
+            # O índice em memória continua utilizável mesmo se a persistência falhar.
+            print(f"[INDICE] Erro ao publicar índice em '{pasta_namespace}': {e}")
+        return vector_store
+
+def _ultimo_uso(pasta_namespace: str) -> Union[float, None]:
+    caminho_ponteiro = os.path.join(pasta_namespace, ARQUIVO_PONTEIRO)
+    try:
+        return os.path.getmtime(caminho_ponteiro if os.path.exists(caminho_ponteiro) else pasta_namespace)
+    except OSError:
+        return None
+
+def coletar_indices_expirados(ttl_segundos: int = INDICE_CASO_TTL_SEGUNDOS) -> int:
+    """
+    Remove os índices de casos não usados há mais de 'ttl_segundos'.
+    Namespaces com a trava ocupada (em construção) são ignorados nesta passada.
+
+    Sob a trava, o namespace é renomeado para uma lápide (nome com TERMO_LAPIDE, que nenhum
+    namespace usa) e só ela é apagada depois: quem obtiver a trava em seguida já encontra a pasta
+    livre e cria um namespace novo, sem ter seu trabalho apagado. Lápides de passadas interrompidas
+    são apagadas na passada seguinte.
+
+    Returns:
+        Quantidade de namespaces removidos.
+    """
+    if not os.path.isdir(PASTA_CASOS):
+        return 0
+    limite = time.time() - ttl_segundos
+    lapides, removidos = [], 0
+    for nome in os.listdir(PASTA_CASOS):
+        pasta_namespace = os.path.join(PASTA_CASOS, nome)
+        if not os.path.isdir(pasta_namespace):
+            continue
+        if TERMO_LAPIDE in nome:
+            lapides.append(pasta_namespace)
+            continue
+        ultimo_uso = _ultimo_uso(pasta_namespace)
+        if ultimo_uso is None or ultimo_uso >= limite:
+            continue
+        with trava_arquivo(os.path.join(pasta_namespace, ARQUIVO_TRAVA), bloquear=False) as adquirida:
+            if not adquirida:
+                continue
+            ultimo_uso = _ultimo_uso(pasta_namespace) # Pode ter sido usado antes de obtermos a trava
+            if ultimo_uso is None or ultimo_uso >= limite:
+                continue
+            fechar_versoes_abertas(pasta_namespace)
+            lapide = os.path.join(PASTA_CASOS, f"{nome}{TERMO_LAPIDE}{uuid.uuid4().hex[:8]}")
+            try:
+                os.rename(pasta_namespace, lapide)
+            except OSError as e: # Ex: no Windows, com arquivos do índice abertos
+                print(f"[INDICE] Não foi possível remover '{pasta_namespace}': {e}")
+                continue
+            lapides.append(lapide)
+            removidos += 1
+    for lapide in lapides:
+        shutil.rmtree(lapide, ignore_errors=True)
+    if removidos:
+        print(f"[INDICE] {removidos} índice(s) de casos expirados removidos (TTL {ttl_segundos}s).")
+    return removidos
+
+
+if __name__ == '__main__':
+    print("--- Testando Index Storage ---")
+    print(f"Namespace de modelos: {caminho_namespace_modelos()}")
+    print(f"Namespace do caso 'caso/01 teste': {caminho_namespace_caso('caso/01 teste')}")
+    with trava_arquivo(os.path.join(PASTA_CASOS, "_teste_trava", ARQUIVO_TRAVA)) as adquirida:
+        print(f"  Trava adquirida: {adquirida}")
+    shutil.rmtree(os.path.join(PASTA_CASOS, "_teste_trava"), ignore_errors=True)
+
+    # Fechamento dos arquivos de chunks: close() explícito, reabertura sob demanda e coleta por pasta.
+    pasta_teste = os.path.join(PASTA_CASOS, "_teste_docstore", "versoes", "v1")
+    os.makedirs(pasta_teste, exist_ok=True)
+    registro = json.dumps({"id": "c0", "page_content": "texto", "metadata": {}}).encode("utf-8") + b"\n"
+    with open(os.path.join(pasta_teste, "chunks.jsonl"), "wb") as arquivo:
+        arquivo.write(registro)
+    np.save(os.path.join(pasta_teste, "offsets.npy"), np.array([0, len(registro)], dtype=np.int64))
+    with DocstoreMapeado(pasta_teste, ["c0"]) as docstore:
+        assert docstore.search("c0").page_content == "texto"
+    assert docstore._arquivo is None and docstore._mapa is None, "close() não liberou o arquivo"
+    assert docstore.search("c0").page_content == "texto", "reabertura sob demanda falhou"
+    assert fechar_versoes_abertas(os.path.join(PASTA_CASOS, "_teste_docstore")) >= 1
+    assert docstore._arquivo is None
+    print("  DocstoreMapeado: fechamento e reabertura OK")
+    shutil.rmtree(os.path.join(PASTA_CASOS, "_teste_docstore"), ignore_errors=True)
+    print(f"Índices expirados removidos: {coletar_indices_expirados()}")
+    print("--- Fim dos Testes Index Storage ---")
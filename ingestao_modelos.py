@@ -0,0 +1,151 @@
+# ingestao_modelos.py
+#
+# Ingestão em lote dos modelos (.docx) fora do app: percorre as pastas de modelos, extrai e divide
+# os arquivos em um pool de processos (a extração do docx2txt é limitada pela CPU/GIL, então threads
+# não escalam), envia os chunks em fluxo ao agendador de embeddings e publica uma nova versão do
+# índice de modelos. Com INDICE_MODELOS_SOMENTE_CARREGAR = True o app apenas carrega essa versão.
+#
+# Uso:
+#   python ingestao_modelos.py                          # pastas de settings.py, um processo por núcleo
+#   python ingestao_modelos.py --processos 8 --lote 512
+#   EMBEDDING_BACKEND=local python ingestao_modelos.py  # sem rede (o app deve usar o mesmo backend)
+#   python ingestao_modelos.py --pacote pacote_indice_modelos  # pacote com manifesto (ex: para a imagem do container)
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from settings import (
+    PATH_MODELOS_PETICOES,
+    PATH_MODELOS_JUIZ,
+    EMBEDDING_BACKEND,
+    INGESTAO_PROCESSOS,
+    INGESTAO_LOTE_CHUNKS
+)
+from compressao_vetorial import anexar_indice_comprimido
+from embeddings_utils import obter_modelo_embeddings
+from index_storage import caminho_namespace_modelos, publicar_indice, salvar_pacote_indice
+from rag_utils import (
+    listar_modelos_docx,
+    carregar_modelo_docx,
+    dividir_em_chunks,
+    impressoes_modelos,
+    etiqueta_indice_modelos,
+    manifesto_indice_modelos
+)
+
+
+def _extrair_e_dividir(tarefa: Tuple[str, str]) -> Tuple[str, List[Document], Union[str, None]]:
+    """Roda nos processos do pool: extrai o texto de um .docx e o divide em chunks."""
+    caminho_docx, tipo_fonte = tarefa
+    try:
+        return caminho_docx, dividir_em_chunks([carregar_modelo_docx(caminho_docx, tipo_fonte)]), None
+    except Exception as e: # Erros em arquivos individuais não param a ingestão
+        return caminho_docx, [], str(e)
+
+
+def ingerir_modelos(
+    pastas_por_tipo: Dict[str, str],
+    embeddings_model: Embeddings,
+    processos: int = INGESTAO_PROCESSOS,
+    lote_chunks: int = INGESTAO_LOTE_CHUNKS
+) -> Tuple[Union[FAISS, None], Dict[str, Any]]:
+    """
+    Constrói o índice FAISS dos modelos com extração paralela e embeddings em fluxo.
+
+    Os arquivos são processados em ordem pelo pool; assim que 'lote_chunks' chunks ficam prontos,
+    eles são embedados e adicionados ao índice enquanto os processos seguem extraindo os próximos.
+
+    Args:
+        pastas_por_tipo: Tipo de fonte ('modelo_peticao', 'modelo_juiz') -> pasta de modelos.
+        embeddings_model: Modelo de embeddings (o agendador/cache do backend configurado).
+        processos: Tamanho do pool (0 = um por núcleo).
+        lote_chunks: Chunks por envio ao modelo de embeddings.
+
+    Returns:
+        O vector store (ou None se nenhum chunk foi gerado) e as métricas da ingestão.
+    """
+    tarefas = [(caminho, tipo_fonte) for tipo_fonte, pasta in pastas_por_tipo.items() for caminho in listar_modelos_docx(pasta)]
+    processos = min(processos or os.cpu_count() or 1, max(1, len(tarefas)))
+    metricas: Dict[str, Any] = {"arquivos": len(tarefas), "processos": processos, "chunks": 0, "erros": 0, "segundos_embeddings": 0.0}
+    vector_store: Union[FAISS, None] = None
+    pendentes: List[Document] = []
+
+    def adicionar_lote(chunks: List[Document]) -> None:
+        nonlocal vector_store
+        textos = [chunk.page_content for chunk in chunks]
+        inicio_lote = time.perf_counter()
+        vetores = embeddings_model.embed_documents(textos)
+        metricas["segundos_embeddings"] += time.perf_counter() - inicio_lote
+        pares = list(zip(textos, vetores))
+        metadados = [chunk.metadata for chunk in chunks]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(pares, embeddings_model, metadatas=metadados)
+        else:
+            vector_store.add_embeddings(pares, metadatas=metadados)
+        metricas["chunks"] += len(chunks)
+
+    inicio = time.perf_counter()
+    print(f"[INGESTAO] {len(tarefas)} modelo(s) encontrados; extraindo com {processos} processo(s)...")
+    # 'spawn': os processos não herdam conexões SQLite (caches) nem threads abertas no processo principal.
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) as executor:
+        tamanho_bloco = max(1, len(tarefas) // (processos * 8))
+        for caminho_docx, chunks, erro in executor.map(_extrair_e_dividir, tarefas, chunksize=tamanho_bloco):
+            if erro:
+                metricas["erros"] += 1
+                print(f"Erro ao carregar modelo {caminho_docx}: {erro}")
+                continue
+            pendentes.extend(chunks)
+            while len(pendentes) >= lote_chunks:
+                adicionar_lote(pendentes[:lote_chunks])
+                del pendentes[:lote_chunks]
+    if pendentes:
+        adicionar_lote(pendentes)
+
+    duracao = time.perf_counter() - inicio
+    metricas["segundos_embeddings"] = round(metricas["segundos_embeddings"], 3)
+    metricas["segundos"] = round(duracao, 3)
+    metricas["arquivos_por_segundo"] = round(len(tarefas) / duracao, 1) if duracao > 0 else None
+    return vector_store, metricas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestão em lote dos modelos e publicação do índice de modelos.")
+    parser.add_argument("--pasta-peticoes", default=PATH_MODELOS_PETICOES, help="Pasta dos modelos de petições")
+    parser.add_argument("--pasta-juiz", default=PATH_MODELOS_JUIZ, help="Pasta dos modelos do juiz")
+    parser.add_argument("--processos", type=int, default=INGESTAO_PROCESSOS, help="Processos de extração (0 = um por núcleo)")
+    parser.add_argument("--lote", type=int, default=INGESTAO_LOTE_CHUNKS, help="Chunks por envio ao modelo de embeddings")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, help="Backend de embeddings (deve ser o mesmo do app)")
+    parser.add_argument("--destino", default=caminho_namespace_modelos(), help="Namespace onde a versão é publicada")
+    parser.add_argument("--pacote", help="Grava um pacote com manifesto nesta pasta em vez de publicar no namespace")
+    args = parser.parse_args()
+
+    embeddings_model = obter_modelo_embeddings(args.backend)
+    if embeddings_model is None:
+        sys.exit(1)
+    pastas_por_tipo = {"modelo_peticao": args.pasta_peticoes, "modelo_juiz": args.pasta_juiz}
+    fontes = impressoes_modelos(pastas_por_tipo) # Antes da ingestão: um .docx alterado durante ela deixa o índice desatualizado
+    vector_store, metricas = ingerir_modelos(
+        pastas_por_tipo,
+        embeddings_model,
+        processos=args.processos,
+        lote_chunks=args.lote
+    )
+    print(f"[INGESTAO] {metricas}")
+    if vector_store is None:
+        print("ERRO INGESTAO: Nenhum chunk de modelo gerado. Verifique as pastas de modelos.")
+        sys.exit(1)
+    anexar_indice_comprimido(vector_store) # INDICE_MODELOS_TIPO (settings.py)
+    if args.pacote:
+        salvar_pacote_indice(args.pacote, vector_store, manifesto_indice_modelos(embeddings_model, fontes))
+        print(f"[INGESTAO] Pacote gravado em '{args.pacote}' ({len(fontes)} modelo(s) no manifesto).")
+    elif publicar_indice(args.destino, vector_store, etiqueta=etiqueta_indice_modelos(embeddings_model, fontes)) is None:
+        sys.exit(1)
@@ -0,0 +1,442 @@
+# limites_api.py
+#
+# Controle das chamadas às APIs externas (Gemini, Google Search), compartilhado por todas as
+# sessões do processo: limite de requisições e de tokens por minuto (baldes de fichas), novas
+# tentativas com backoff exponencial + jitter para erros transitórios (429, 5xx, timeouts) e um
+# disjuntor (circuit breaker) que, após falhas seguidas, recusa chamadas de imediato por um tempo.
+# As instâncias usadas pelo app ficam em llm_models.py.
+
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Union
+
+import httpx
+import requests
+from google.api_core import exceptions as google_exceptions
+from google.auth import exceptions as google_auth_exceptions
+
+
+class BaldeDeTokens:
+    """Limitador de taxa (token bucket): 'taxa_por_segundo' fichas repostas, até 'capacidade'."""
+
+    def __init__(self, taxa_por_segundo: float, capacidade: float):
+        self.taxa_por_segundo = taxa_por_segundo
+        self.capacidade = capacidade
+        self._fichas = capacidade
+        self._ultima_reposicao = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _tentar_consumir(self, quantidade: float) -> float:
+        """Consome e retorna 0 se houver fichas; senão, retorna quantos segundos esperar."""
+        quantidade = min(quantidade, self.capacidade) # Pedidos maiores que o balde passam quando ele enche
+        with self._lock:
+            agora = time.monotonic()
+            self._fichas = min(self.capacidade, self._fichas + (agora - self._ultima_reposicao) * self.taxa_por_segundo)
+            self._ultima_reposicao = agora
+            if self._fichas >= quantidade:
+                self._fichas -= quantidade
+                return 0.0
+            return (quantidade - self._fichas) / self.taxa_por_segundo
+
+    def consumir(self, quantidade: float = 1.0) -> float:
+        """Bloqueia até haver 'quantidade' fichas disponíveis e as consome. Retorna o tempo esperado."""
+        esperado = 0.0
+        while True:
+            espera = self._tentar_consumir(quantidade)
+            if not espera:
+                return esperado
+            time.sleep(espera)
+            esperado += espera
+
+    async def aconsumir(self, quantidade: float = 1.0) -> float:
+        """Como consumir(), sem bloquear o event loop."""
+        esperado = 0.0
+        while True:
+            espera = self._tentar_consumir(quantidade)
+            if not espera:
+                return esperado
+            await asyncio.sleep(espera)
+            esperado += espera
+
+    def debitar(self, quantidade: float) -> None:
+        """Desconta fichas sem esperar (o saldo pode ficar negativo), ex: tokens além da estimativa."""
+        with self._lock:
+            self._fichas -= quantidade
+
+
+class CircuitoAbertoError(RuntimeError):
+    """Chamada recusada sem tentar: o disjuntor do serviço está aberto após falhas seguidas."""
+
+
+class DisjuntorCircuito:
+    """
+    Circuit breaker: 'fechado' deixa as chamadas passarem; após 'falhas_para_abrir' falhas
+    transitórias seguidas fica 'aberto' e recusa tudo por 'segundos_aberto'; depois, 'meio_aberto'
+    deixa passar uma única chamada de teste, que fecha (sucesso) ou reabre (falha) o circuito.
+    """
+
+    def __init__(self, nome: str, falhas_para_abrir: int, segundos_aberto: float):
+        self.nome = nome
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado_sem_lock()
+
+    def _estado_sem_lock(self) -> str:
+        if self._falhas_seguidas < self.falhas_para_abrir:
+            return "fechado"
+        return "aberto" if time.monotonic() < self._aberto_ate else "meio_aberto"
+
+    def verificar(self) -> bool:
+        """
+        Levanta CircuitoAbertoError se a chamada não deve ser tentada agora.
+
+        Returns:
+            True se esta chamada é o teste do estado 'meio_aberto': quem chama deve registrar o
+            resultado ou, se a chamada for interrompida (cancelamento, fluxo abandonado), liberar_teste().
+        """
+        with self._lock:
+            estado = self._estado_sem_lock()
+            if estado == "fechado":
+                return False
+            if estado == "meio_aberto" and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            restante = max(0.0, self._aberto_ate - time.monotonic())
+        raise CircuitoAbertoError(
+            f"Serviço '{self.nome}' temporariamente indisponível após {self.falhas_para_abrir} falhas seguidas "
+            f"(nova tentativa liberada em {restante:.0f}s)."
+        )
+
+    def registrar_sucesso(self) -> None:
+        with self._lock:
+            self._falhas_seguidas = 0
+            self._teste_em_andamento = False
+
+    def liberar_teste(self) -> None:
+        """Libera o teste do 'meio_aberto' sem resultado; a próxima chamada faz um novo teste."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def registrar_falha(self) -> None:
+        with self._lock:
+            self._falhas_seguidas += 1
+            self._teste_em_andamento = False
+            if self._falhas_seguidas >= self.falhas_para_abrir:
+                if self._falhas_seguidas == self.falhas_para_abrir:
+                    print(f"[LIMITES] Disjuntor de '{self.nome}' aberto por {self.segundos_aberto:.0f}s.")
+                self._aberto_ate = time.monotonic() + self.segundos_aberto
+
+    def descrever(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "estado": self._estado_sem_lock(),
+                "falhas_seguidas": self._falhas_seguidas,
+                "segundos_para_reabrir": round(max(0.0, self._aberto_ate - time.monotonic()), 1),
+            }
+
+
+# Erros transitórios (vale tentar de novo): cota/limite, sobrecarga ou falha do servidor, rede e timeouts.
+CODIGOS_HTTP_TRANSITORIOS = frozenset({408, 429, 500, 502, 503, 504})
+_TIPOS_ERRO_TRANSITORIO = (
+    TimeoutError, # Inclui asyncio.TimeoutError
+    ConnectionError,
+    google_exceptions.ResourceExhausted, # 429
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_auth_exceptions.TransportError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    httpx.TransportError, # Conexão, timeouts e erros de rede do httpx
+)
+_CODIGO_NO_INICIO_DA_MENSAGEM = re.compile(r"^\s*(\d{3})\b")
+
+def _codigo_http(erro: BaseException) -> Union[int, None]:
+    """Status HTTP do erro: .code (api_core), .status_code (googleapiclient) ou .response.status_code (requests/httpx)."""
+    for codigo in (
+        getattr(erro, "code", None),
+        getattr(erro, "status_code", None),
+        getattr(getattr(erro, "response", None), "status_code", None),
+    ):
+        if isinstance(codigo, int) and not isinstance(codigo, bool):
+            return codigo
+    return None
+
+def erro_transitorio(erro: BaseException) -> bool:
+    """
+    True para erros de cota, sobrecarga ou rede; False para erros de requisição (ex: prompt inválido).
+
+    Classifica pelo tipo da exceção e, depois, pelo status HTTP que ela carrega. Só na falta de ambos
+    usa o status no início da mensagem (ex: "503 Service Unavailable"), nunca palavras soltas do texto.
+    """
+    if isinstance(erro, _TIPOS_ERRO_TRANSITORIO):
+        return True
+    codigo = _codigo_http(erro)
+    if codigo is None:
+        encontrado = _CODIGO_NO_INICIO_DA_MENSAGEM.match(str(erro))
+        codigo = int(encontrado.group(1)) if encontrado else None
+    return codigo in CODIGOS_HTTP_TRANSITORIOS
+
+
+class ProtecaoChamadasAPI:
+    """
+    Limites por minuto, novas tentativas e disjuntor para um serviço externo.
+
+    Cada chamada espera sua vez nos baldes (requisições e, se configurado, tokens), o que enfileira
+    as sessões em vez de estourar a cota. Erros transitórios são repetidos até 'max_tentativas'
+    vezes, com backoff exponencial + jitter; cada falha transitória conta para o disjuntor. Erros
+    não transitórios sobem na hora, sem nova tentativa.
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        requisicoes_por_minuto: float,
+        tokens_por_minuto: Union[float, None] = None,
+        max_tentativas: int = 5,
+        falhas_para_abrir: int = 5,
+        segundos_aberto: float = 60.0,
+        espera_maxima_segundos: float = 60.0
+    ):
+        self.nome = nome
+        self.max_tentativas = max_tentativas
+        self.espera_maxima_segundos = espera_maxima_segundos
+        self.balde_requisicoes = BaldeDeTokens(requisicoes_por_minuto / 60.0, capacidade=max(1.0, requisicoes_por_minuto / 60.0))
+        self.balde_tokens = BaldeDeTokens(tokens_por_minuto / 60.0, capacidade=tokens_por_minuto) if tokens_por_minuto else None
+        self.disjuntor = DisjuntorCircuito(nome, falhas_para_abrir, segundos_aberto)
+        self._contadores = {"chamadas": 0, "sucessos": 0, "falhas": 0, "novas_tentativas": 0, "recusadas": 0, "segundos_em_fila": 0.0}
+        self._lock = threading.Lock()
+
+    def _contar(self, **incrementos: float) -> None:
+        with self._lock:
+            for chave, valor in incrementos.items():
+                self._contadores[chave] += valor
+
+    def _espera_backoff(self, tentativa: int) -> float:
+        return min(self.espera_maxima_segundos, 2 ** (tentativa - 1)) * (0.5 + random.random())
+
+    def _antes_da_tentativa(self) -> bool:
+        """Verifica o disjuntor; True se a tentativa é o teste do 'meio_aberto'."""
+        try:
+            return self.disjuntor.verificar()
+        except CircuitoAbertoError:
+            self._contar(recusadas=1)
+            raise
+
+    def _apos_falha(self, erro: Exception, tentativa: int) -> Union[float, None]:
+        """Registra a falha; retorna a espera até a próxima tentativa, ou None se o erro deve subir."""
+        if not erro_transitorio(erro):
+            self.disjuntor.registrar_sucesso() # O serviço respondeu: não é indisponibilidade
+            self._contar(falhas=1)
+            return None
+        self.disjuntor.registrar_falha()
+        if tentativa >= self.max_tentativas or self.disjuntor.estado == "aberto":
+            self._contar(falhas=1)
+            return None
+        espera = self._espera_backoff(tentativa)
+        print(f"[LIMITES] Falha transitória em '{self.nome}' (tentativa {tentativa}/{self.max_tentativas}): {erro}. Nova tentativa em {espera:.1f}s.")
+        self._contar(novas_tentativas=1)
+        return espera
+
+    def _apos_sucesso(self, tokens_reservados: float, tokens_usados: Union[float, None]) -> None:
+        self.disjuntor.registrar_sucesso()
+        self._contar(sucessos=1)
+        if self.balde_tokens is not None and tokens_usados is not None and tokens_usados > tokens_reservados:
+            self.balde_tokens.debitar(tokens_usados - tokens_reservados)
+
+    def executar(
+        self,
+        funcao: Callable[[], Any],
+        tokens_estimados: float = 0.0,
+        tokens_usados: Union[Callable[[Any], Union[float, None]], None] = None
+    ) -> Any:
+        """
+        Executa 'funcao' dentro dos limites, repetindo em erros transitórios.
+
+        Args:
+            funcao: Chamada à API (sem argumentos).
+            tokens_estimados: Tokens reservados no balde de tokens antes da chamada.
+            tokens_usados: Extrai do resultado os tokens realmente usados (o excedente é debitado).
+
+        Raises:
+            CircuitoAbertoError: Se o disjuntor estiver aberto.
+        """
+        self._contar(chamadas=1)
+        for tentativa in range(1, self.max_tentativas + 1):
+            teste = self._antes_da_tentativa()
+            try:
+                espera = self.balde_requisicoes.consumir()
+                if self.balde_tokens is not None and tokens_estimados:
+                    espera += self.balde_tokens.consumir(tokens_estimados)
+                self._contar(segundos_em_fila=espera)
+                try:
+                    resultado = funcao()
+                except Exception as e:
+                    espera_nova_tentativa = self._apos_falha(e, tentativa)
+                    if espera_nova_tentativa is None:
+                        raise
+                    time.sleep(espera_nova_tentativa)
+                    continue
+                self._apos_sucesso(tokens_estimados, tokens_usados(resultado) if tokens_usados else None)
+                return resultado
+            finally:
+                if teste: # Teste interrompido sem resultado (ex: CancelledError, GeneratorExit)
+                    self.disjuntor.liberar_teste()
+
+    async def aexecutar(
+        self,
+        funcao: Callable[[], Awaitable[Any]],
+        tokens_estimados: float = 0.0,
+        tokens_usados: Union[Callable[[Any], Union[float, None]], None] = None
+    ) -> Any:
+        """Versão assíncrona de executar() ('funcao' retorna uma corrotina)."""
+        self._contar(chamadas=1)
+        for tentativa in range(1, self.max_tentativas + 1):
+            teste = self._antes_da_tentativa()
+            try:
+                espera = await self.balde_requisicoes.aconsumir()
+                if self.balde_tokens is not None and tokens_estimados:
+                    espera += await self.balde_tokens.aconsumir(tokens_estimados)
+                self._contar(segundos_em_fila=espera)
+                try:
+                    resultado = await funcao()
+                except Exception as e:
+                    espera_nova_tentativa = self._apos_falha(e, tentativa)
+                    if espera_nova_tentativa is None:
+                        raise
+                    await asyncio.sleep(espera_nova_tentativa)
+                    continue
+                self._apos_sucesso(tokens_estimados, tokens_usados(resultado) if tokens_usados else None)
+                return resultado
+            finally:
+                if teste: # Teste interrompido sem resultado (ex: CancelledError, GeneratorExit)
+                    self.disjuntor.liberar_teste()
+
+    def executar_fluxo(self, funcao: Callable[[], Iterator[Any]], tokens_estimados: float = 0.0) -> Iterator[Any]:
+        """Como executar(), para respostas em fluxo: só repete se a falha vier antes do primeiro trecho."""
+        self._contar(chamadas=1)
+        for tentativa in range(1, self.max_tentativas + 1):
+            teste = self._antes_da_tentativa()
+            try:
+                espera = self.balde_requisicoes.consumir()
+                if self.balde_tokens is not None and tokens_estimados:
+                    espera += self.balde_tokens.consumir(tokens_estimados)
+                self._contar(segundos_em_fila=espera)
+                recebeu_trecho = False
+                try:
+                    for trecho in funcao():
+                        recebeu_trecho = True
+                        yield trecho
+                except Exception as e:
+                    espera_nova_tentativa = self._apos_falha(e, tentativa)
+                    if espera_nova_tentativa is None or recebeu_trecho:
+                        raise
+                    time.sleep(espera_nova_tentativa)
+                    continue
+                self._apos_sucesso(tokens_estimados, None)
+                return
+            finally:
+                if teste: # Teste interrompido sem resultado (ex: CancelledError, GeneratorExit)
+                    self.disjuntor.liberar_teste()
+
+    async def aexecutar_fluxo(self, funcao: Callable[[], AsyncIterator[Any]], tokens_estimados: float = 0.0) -> AsyncIterator[Any]:
+        """Versão assíncrona de executar_fluxo()."""
+        self._contar(chamadas=1)
+        for tentativa in range(1, self.max_tentativas + 1):
+            teste = self._antes_da_tentativa()
+            try:
+                espera = await self.balde_requisicoes.aconsumir()
+                if self.balde_tokens is not None and tokens_estimados:
+                    espera += await self.balde_tokens.aconsumir(tokens_estimados)
+                self._contar(segundos_em_fila=espera)
+                recebeu_trecho = False
+                try:
+                    async for trecho in funcao():
+                        recebeu_trecho = True
+                        yield trecho
+                except Exception as e:
+                    espera_nova_tentativa = self._apos_falha(e, tentativa)
+                    if espera_nova_tentativa is None or recebeu_trecho:
+                        raise
+                    await asyncio.sleep(espera_nova_tentativa)
+                    continue
+                self._apos_sucesso(tokens_estimados, None)
+                return
+            finally:
+                if teste: # Teste interrompido sem resultado (ex: CancelledError, GeneratorExit)
+                    self.disjuntor.liberar_teste()
+
+    def estado(self) -> Dict[str, Any]:
+        """Contadores, estado do disjuntor e fichas disponíveis (para exibir na interface ou em logs)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+        contadores["segundos_em_fila"] = round(contadores["segundos_em_fila"], 2)
+        return {"servico": self.nome, **contadores, "disjuntor": self.disjuntor.descrever()}
+
+
+if __name__ == '__main__':
+    print("--- Testando Limites de API ---")
+    assert erro_transitorio(google_exceptions.ResourceExhausted("quota")) and erro_transitorio(requests.exceptions.ReadTimeout())
+    assert erro_transitorio(RuntimeError("503 Service Unavailable")) and not erro_transitorio(RuntimeError("id 500 inválido"))
+    assert not erro_transitorio(google_exceptions.InvalidArgument("campo 'connection' inválido (timeout)"))
+    protecao = ProtecaoChamadasAPI("teste", requisicoes_por_minuto=600, max_tentativas=3, falhas_para_abrir=3, segundos_aberto=0.5, espera_maxima_segundos=0.05)
+    tentativas = []
+
+    def instavel():
+        tentativas.append(1)
+        if len(tentativas) < 3:
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+        return "ok"
+    assert protecao.executar(instavel) == "ok" and len(tentativas) == 3
+    try:
+        protecao.executar(lambda: (_ for _ in ()).throw(ValueError("400 prompt inválido")))
+    except ValueError:
+        pass
+    for _ in range(3):
+        try:
+            protecao.executar(lambda: (_ for _ in ()).throw(RuntimeError("503 Service Unavailable")))
+        except (RuntimeError, CircuitoAbertoError):
+            pass
+    print(f"  Após falhas seguidas: {protecao.estado()}")
+    assert protecao.disjuntor.estado == "aberto"
+    time.sleep(0.6)
+    assert protecao.executar(lambda: "ok") == "ok" and protecao.disjuntor.estado == "fechado"
+    print(f"  Após o teste do meio-aberto: {protecao.estado()['disjuntor']}")
+
+    def abrir_e_esperar_meio_aberto():
+        for _ in range(3):
+            protecao.disjuntor.registrar_falha()
+        time.sleep(0.6)
+        assert protecao.disjuntor.estado == "meio_aberto"
+
+    async def teste_cancelado():
+        tarefa = asyncio.ensure_future(protecao.aexecutar(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.05)
+        tarefa.cancel()
+        try:
+            await tarefa
+        except asyncio.CancelledError:
+            pass
+    abrir_e_esperar_meio_aberto()
+    asyncio.run(teste_cancelado())
+    assert protecao.executar(lambda: "ok") == "ok" # O teste cancelado não prende o meio-aberto
+    abrir_e_esperar_meio_aberto()
+    fluxo = protecao.executar_fluxo(lambda: iter(["a", "b", "c"]))
+    assert next(fluxo) == "a"
+    fluxo.close() # Leitor abandona o fluxo (GeneratorExit)
+    assert protecao.executar(lambda: "ok") == "ok" and protecao.disjuntor.estado == "fechado"
+    print("  Testes do meio-aberto interrompidos (cancelamento e fluxo abandonado) liberados.")
+    print("--- Fim dos Testes Limites de API ---")
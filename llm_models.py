@@ -1,30 +1,165 @@
 import os
 import traceback # For detailed error logging if search tool setup fails
+from typing import Any, AsyncIterator, Iterator, List, Tuple, Union
 
 # LangChain & Google imports
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai.chat_models import _response_to_result # Resposta do cliente -> ChatResult
 from langchain_google_community import GoogleSearchAPIWrapper # Correct import
 from langchain_google_community.search import GoogleSearchRun # Correct import
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from limites_api import ProtecaoChamadasAPI, CircuitoAbertoError # Limites por minuto, novas tentativas e disjuntor
 
 # Import necessary settings
 from settings import (
     GOOGLE_API_KEY,
     GEMINI_MODEL_NAME,
     GOOGLE_API_KEY_SEARCH,
-    GOOGLE_CSE_ID
+    GOOGLE_CSE_ID,
+    GEMINI_REQUISICOES_POR_MINUTO,
+    GEMINI_TOKENS_POR_MINUTO,
+    GEMINI_TOKENS_SAIDA_ESTIMADOS,
+    BUSCA_REQUISICOES_POR_MINUTO,
+    API_MAX_TENTATIVAS,
+    API_FALHAS_PARA_ABRIR_CIRCUITO,
+    API_SEGUNDOS_CIRCUITO_ABERTO,
+    API_TIMEOUT_SEGUNDOS
+)
+
+# --- Process-wide API protection (shared by every Streamlit session and thread) ---
+protecao_gemini = ProtecaoChamadasAPI(
+    "gemini",
+    requisicoes_por_minuto=GEMINI_REQUISICOES_POR_MINUTO,
+    tokens_por_minuto=GEMINI_TOKENS_POR_MINUTO,
+    max_tentativas=API_MAX_TENTATIVAS,
+    falhas_para_abrir=API_FALHAS_PARA_ABRIR_CIRCUITO,
+    segundos_aberto=API_SEGUNDOS_CIRCUITO_ABERTO
 )
+protecao_busca = ProtecaoChamadasAPI(
+    "google_search",
+    requisicoes_por_minuto=BUSCA_REQUISICOES_POR_MINUTO,
+    max_tentativas=API_MAX_TENTATIVAS,
+    falhas_para_abrir=API_FALHAS_PARA_ABRIR_CIRCUITO,
+    segundos_aberto=API_SEGUNDOS_CIRCUITO_ABERTO
+)
+
+def estimar_tokens_mensagens(mensagens: List[BaseMessage]) -> int:
+    """Rough token estimate for the rate limiter (~4 characters per token) plus the expected output."""
+    caracteres = sum(len(m.content) if isinstance(m.content, str) else len(str(m.content)) for m in mensagens)
+    return caracteres // 4 + GEMINI_TOKENS_SAIDA_ESTIMADOS
+
+def _tokens_do_resultado(resultado: ChatResult) -> Union[int, None]:
+    uso = getattr(resultado.generations[0].message, "usage_metadata", None) if resultado.generations else None
+    return uso.get("total_tokens") if uso else None
+
+# Request fields handled by ChatGoogleGenerativeAI._prepare_request; other kwargs go to the client call.
+_CAMPOS_REQUISICAO_GEMINI = ("tools", "functions", "safety_settings", "tool_config", "generation_config", "cached_content", "tool_choice")
+
+def _trecho_do_fluxo(resposta: Any, uso_anterior: Union[UsageMetadata, None]) -> Tuple[ChatGenerationChunk, Union[UsageMetadata, None]]:
+    """One stream_generate_content response as a chunk, plus the usage accumulated so far (as ChatGoogleGenerativeAI does)."""
+    trecho = _response_to_result(resposta, stream=True, prev_usage=uso_anterior).generations[0]
+    uso = trecho.message.usage_metadata or {}
+    if uso_anterior is None:
+        return trecho, trecho.message.usage_metadata
+    return trecho, UsageMetadata(
+        **{campo: uso_anterior.get(campo, 0) + uso.get(campo, 0) for campo in ("input_tokens", "output_tokens", "total_tokens")}
+    )
+
+def _trechos_em_fluxo(respostas: Iterator[Any]) -> Iterator[ChatGenerationChunk]:
+    uso = None
+    for resposta in respostas:
+        trecho, uso = _trecho_do_fluxo(resposta, uso)
+        yield trecho
+
+class ChatGeminiProtegido(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI whose API calls go through protecao_gemini (limits, retries, circuit breaker).
+
+    The generative client is called directly: ChatGoogleGenerativeAI wraps it in its own tenacity retry
+    (_chat_with_retry, 2 attempts on any GoogleAPIError) and api_core adds another retry by default. Both
+    would make requests the rate limiter never sees, stacked under protecao_gemini's retries. Here each
+    attempt is exactly one request, with no client-side retry and a per-attempt timeout.
+    """
+
+    def _requisicao(self, messages: List[BaseMessage], stop: Union[List[str], None], kwargs: dict) -> Tuple[Any, dict]:
+        campos = {campo: kwargs.pop(campo) for campo in _CAMPOS_REQUISICAO_GEMINI if campo in kwargs}
+        campos["cached_content"] = campos.get("cached_content") or self.cached_content
+        requisicao = self._prepare_request(messages, stop=stop, **campos)
+        return requisicao, {"metadata": self.default_metadata, "retry": None, "timeout": API_TIMEOUT_SEGUNDOS, **kwargs}
+
+    def _generate(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        requisicao, opcoes = self._requisicao(messages, stop, kwargs)
+        return protecao_gemini.executar(
+            lambda: _response_to_result(self.client.generate_content(request=requisicao, **opcoes)),
+            tokens_estimados=estimar_tokens_mensagens(messages),
+            tokens_usados=_tokens_do_resultado
+        )
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if not self.async_client: # No async client: BaseChatModel runs _generate in an executor
+            return await super(ChatGoogleGenerativeAI, self)._agenerate(messages, stop, run_manager, **kwargs)
+        requisicao, opcoes = self._requisicao(messages, stop, kwargs)
+
+        async def gerar() -> ChatResult:
+            return _response_to_result(await self.async_client.generate_content(request=requisicao, **opcoes))
+        return await protecao_gemini.aexecutar(
+            gerar,
+            tokens_estimados=estimar_tokens_mensagens(messages),
+            tokens_usados=_tokens_do_resultado
+        )
+
+    def _stream(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        requisicao, opcoes = self._requisicao(messages, stop, kwargs)
+        for trecho in protecao_gemini.executar_fluxo(
+            lambda: _trechos_em_fluxo(self.client.stream_generate_content(request=requisicao, **opcoes)),
+            tokens_estimados=estimar_tokens_mensagens(messages)
+        ):
+            if run_manager:
+                run_manager.on_llm_new_token(trecho.text)
+            yield trecho
+
+    async def _astream(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if not self.async_client:
+            async for trecho in super(ChatGoogleGenerativeAI, self)._astream(messages, stop, run_manager, **kwargs):
+                yield trecho
+            return
+        requisicao, opcoes = self._requisicao(messages, stop, kwargs)
+
+        async def trechos() -> AsyncIterator[ChatGenerationChunk]:
+            uso = None
+            async for resposta in await self.async_client.stream_generate_content(request=requisicao, **opcoes):
+                trecho, uso = _trecho_do_fluxo(resposta, uso)
+                yield trecho
+        async for trecho in protecao_gemini.aexecutar_fluxo(trechos, tokens_estimados=estimar_tokens_mensagens(messages)):
+            if run_manager:
+                await run_manager.on_llm_new_token(trecho.text)
+            yield trecho
+
+class GoogleSearchRunProtegido(GoogleSearchRun):
+    """GoogleSearchRun whose queries go through protecao_busca."""
+
+    def _run(self, query: str, *args: Any, **kwargs: Any) -> str:
+        return protecao_busca.executar(lambda: super(GoogleSearchRunProtegido, self)._run(query, *args, **kwargs))
+
+def estado_protecao_apis() -> dict:
+    """Queue/retry counters and circuit-breaker state of each external API (for the UI and logs)."""
+    return {"gemini": protecao_gemini.estado(), "google_search": protecao_busca.estado()}
 
 # --- LLM Initialization (Gemini) ---
 llm = None
 if GOOGLE_API_KEY:
     try:
-        llm = ChatGoogleGenerativeAI(
+        llm = ChatGeminiProtegido(
             model=GEMINI_MODEL_NAME,
             temperature=0.6, # As per original script
             convert_system_message_to_human=True,
             google_api_key=GOOGLE_API_KEY
         )
-        print(f"[LLM] ChatGoogleGenerativeAI model '{GEMINI_MODEL_NAME}' initialized successfully.")
+        print(f"[LLM] ChatGoogleGenerativeAI model '{GEMINI_MODEL_NAME}' initialized successfully "
+              f"(limits: {GEMINI_REQUISICOES_POR_MINUTO} RPM, {GEMINI_TOKENS_POR_MINUTO} TPM).")
     except Exception as e:
         print(f"[LLM_ERROR] Failed to initialize ChatGoogleGenerativeAI: {e}")
         llm = None # Ensure llm is None if initialization fails
@@ -39,7 +174,7 @@ if GOOGLE_API_KEY_SEARCH and GOOGLE_CSE_ID:
             google_api_key=GOOGLE_API_KEY_SEARCH,
             google_cse_id=GOOGLE_CSE_ID
         )
-        search_tool = GoogleSearchRun( # This is the GoogleSearchRun tool instance
+        search_tool = GoogleSearchRunProtegido( # GoogleSearchRun behind the shared search limiter
             api_wrapper=search_api_wrapper_instance
             # description="Uma ferramenta para buscar informações atuais na web usando o Google Search. Útil para encontrar jurisprudência recente ou notícias."
         )
@@ -64,4 +199,5 @@ if __name__ == '__main__':
 
     else:
         print("Ferramenta Google Search (search_tool) não está configurada (verifique chaves de API e logs).")
+    print(f"Estado da proteção das APIs: {estado_protecao_apis()}")
     print("--- Fim dos Testes ---")
\ No newline at end of file
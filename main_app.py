@@ -12,6 +12,12 @@ from settings import (
     FORM_STEPS # Necessário para a lógica de navegação dos formulários
 )
 
+# Estado dos limites/disjuntores das APIs do Google
+from llm_models import estado_protecao_apis
+
+# Reindexação incremental dos modelos
+from template_watcher import iniciar_indexador_modelos
+
 # Importar componentes da UI e lógica de estado
 from ui_components import (
     inicializar_estado_formulario,
@@ -38,6 +44,9 @@ if __name__ == "__main__":
         st.error("🔴 ERRO CRÍTICO: A variável de ambiente GOOGLE_API_KEY não foi definida. A aplicação não pode funcionar sem ela.")
         st.stop() # Impede a execução do restante da aplicação
 
+    # Mantém o índice de modelos em dia com as pastas de modelos (uma vez por processo)
+    iniciar_indexador_modelos()
+
     # Inicializa o estado da sessão para formulários e simulação
     inicializar_estado_formulario()
 
@@ -74,6 +83,10 @@ if __name__ == "__main__":
         "ℹ️ Preencha os formulários sequenciais para definir os parâmetros do caso. "
         "A IA pode auxiliar no preenchimento com dados fictícios ou sugestões jurídicas contextuais."
     )
+    with st.sidebar.expander("📶 Uso das APIs (fila, novas tentativas, disjuntor)"):
+        for servico, estado_servico in estado_protecao_apis().items():
+            st.markdown(f"**{servico}**: disjuntor `{estado_servico['disjuntor']['estado']}`")
+            st.json(estado_servico, expanded=False)
     st.sidebar.markdown("---")
     st.sidebar.markdown("#### 🚀 Funcionalidades Planejadas:")
     st.sidebar.button("💾 Salvar Simulação *", disabled=True, use_container_width=True,
@@ -0,0 +1,288 @@
+# prompts.py
+#
+# Registro dos prompts dos agentes (agents.py) e das funcionalidades judiciais (judicial_features.py).
+# Cada texto é compilado uma única vez, na importação, em um ChatPromptTemplate; os dados do caso
+# entram como variáveis no invoke() (ver agent_helpers.obter_chain). Assim, chaves '{' e '}' em
+# textos digitados pelo usuário ou gerados pelo LLM são tratadas como texto, e não como variáveis.
+
+from typing import Dict
+
+from langchain_core.prompts import ChatPromptTemplate
+
+# Identificadores dos prompts
+PROMPT_PETICAO_INICIAL = "peticao_inicial"
+PROMPT_SENTIMENTO_PETICAO_INICIAL = "sentimento_peticao_inicial"
+PROMPT_MANIFESTACAO_SEM_PROVAS_AUTOR = "manifestacao_sem_provas_autor"
+PROMPT_DESPACHO_RECEBENDO_INICIAL = "despacho_recebendo_inicial"
+PROMPT_DECISAO_SANEAMENTO = "decisao_saneamento"
+PROMPT_SENTENCA = "sentenca"
+PROMPT_CONTESTACAO = "contestacao"
+PROMPT_DOCUMENTOS_REU = "documentos_reu"
+PROMPT_SENTIMENTO_CONTESTACAO = "sentimento_contestacao"
+PROMPT_MANIFESTACAO_SEM_PROVAS_REU = "manifestacao_sem_provas_reu"
+PROMPT_EMENTA_CNJ = "ementa_cnj"
+PROMPT_EXTRACAO_TESES = "extracao_teses"
+PROMPT_ANALISE_JURISPRUDENCIA = "analise_jurisprudencia"
+
+TEXTOS_PROMPTS: Dict[str, str] = {
+    PROMPT_PETICAO_INICIAL: """
+Você é um Advogado do Autor experiente e está elaborando uma Petição Inicial completa, formal e persuasiva.
+**Processo ID:** {id_processo}
+**Dados Base Fornecidos para a Petição:**
+Qualificação do Autor: {qualificacao_autor}
+Qualificação do Réu: {qualificacao_reu}
+Natureza da Ação: {natureza_acao}
+Dos Fatos: {fatos}
+Do Direito (Fundamentação Jurídica): {fundamentacao_juridica}
+Dos Pedidos: {pedidos}
+{documentos_autor}
+**Modelo/Guia Estrutural de Petição Inicial (RAG - use para formatação, completude e referências legais, mas priorize os dados fornecidos acima para o conteúdo do caso):**
+{modelo_texto_guia}
+**Instruções Adicionais:**
+1. Redija a Petição Inicial completa e bem formatada, seguindo a praxe forense.
+2. Certifique-se de que todos os elementos dos DADOS BASE (fatos, direito, pedidos, qualificações, natureza da ação) estejam integralmente e corretamente incorporados.
+3. No corpo da petição (especialmente na narração dos fatos ou antes dos pedidos), faça menção aos principais documentos listados em "Documentos que acompanham esta petição (Autor)", indicando sua relevância para comprovar as alegações.
+4. Conclua com os requerimentos de praxe (data, assinatura do advogado).
+Petição Inicial:
+""",
+
+    PROMPT_SENTIMENTO_PETICAO_INICIAL: """
+Analise o tom e o sentimento predominante do seguinte texto jurídico (Petição Inicial).
+Responda com uma única palavra ou expressão curta que melhor descreva o sentimento (ex: Assertivo, Conciliatório, Agressivo, Neutro, Persuasivo, Formal, Emocional, Confiante, Defensivo, Indignado, Colaborativo).
+Seja conciso.
+Texto da Petição Inicial:
+{texto}
+Sentimento Predominante:""",
+
+    PROMPT_MANIFESTACAO_SEM_PROVAS_AUTOR: """
+Você é o Advogado do Autor. O Juiz proferiu a Decisão de Saneamento e intimou as partes para especificarem as provas que pretendem produzir, ou manifestarem desinteresse na produção de mais provas.
+Seu cliente (Autor) informou que não possui mais provas a produzir e deseja o julgamento antecipado da lide, se o Réu também não tiver provas.
+**Processo ID:** {id_processo}
+**Decisão de Saneamento Recebida do Juiz:**
+{decisao_saneamento}
+**Pontos Controvertidos Fixados na Decisão de Saneamento:**
+{pontos_controvertidos}
+**Histórico Processual Anterior (resumo dos atos, para contexto):**
+{historico}
+**Instruções:**
+1. Redija uma petição de "Manifestação Sobre Provas (Autor)".
+2. Na petição, declare que o Autor não tem outras provas a produzir, além daquelas já constantes nos autos (documentais).
+3. Requeira o julgamento do processo no estado em que se encontra (julgamento antecipado do mérito), caso o Réu também não especifique provas a produzir ou se as provas especificadas por ele forem apenas documentais já apresentadas ou impertinentes.
+4. Mantenha a formalidade e praxe forense. Conclua com data e assinatura do advogado.
+Manifestação Sobre Provas (Autor):
+""",
+
+    PROMPT_DESPACHO_RECEBENDO_INICIAL: """
+Você é um Juiz de Direito. Analise a Petição Inicial apresentada e, se estiver em ordem, profira um despacho inicial determinando a citação do réu.
+Considere os documentos que acompanham a inicial, conforme nela mencionados.
+**Processo ID:** {id_processo}
+**Petição Inicial apresentada pelo Autor (pode incluir menção a documentos anexos):**
+{peticao_inicial}
+**Modelo/Guia de Despacho (use como referência para estrutura e formalidades):**
+{modelo_texto_guia}
+**Histórico Processual (resumo dos atos, se houver):**
+{historico}
+---
+Redija o Despacho Inicial. Se a petição estiver apta, defira a inicial e ordene a citação do réu para apresentar contestação no prazo legal.
+Mencione brevemente o recebimento da inicial e dos documentos que a instruem, se relevante.
+Despacho Inicial:
+""",
+
+    PROMPT_DECISAO_SANEAMENTO: """
+Você é um Juiz de Direito. O processo está na fase de saneamento após a apresentação da contestação.
+Analise a Petição Inicial (no histórico), a Contestação e os documentos juntados por ambas as partes.
+**Processo ID:** {id_processo}
+**Petição Inicial e Documentos do Autor (resumo/menção - conteúdo completo no histórico):**
+{documentos_autor}
+**Contestação do Réu e Documentos do Réu (para análise):**
+{contestacao}
+{documentos_reu}
+**Modelo/Guia de Decisão de Saneamento (use como referência):**
+{modelo_texto_guia}
+**Histórico Processual Anterior (resumo dos atos):**
+{historico}
+---
+Tarefa: Redija a Decisão de Saneamento e Organização do Processo.
+1. Verifique preliminares e condições da ação.
+2. Delimite as questões de fato sobre as quais recairá a atividade probatória (PONTOS CONTROVERTIDOS).
+3. Especifique os meios de prova admitidos.
+4. Defina as questões de direito relevantes para a decisão do mérito.
+5. Intime as partes para especificarem as provas que pretendem produzir, advertindo que audiência não está prevista neste MVP.
+Certifique-se de que a decisão seja clara e objetiva.
+Decisão de Saneamento:
+""",
+
+    PROMPT_SENTENCA: """
+Você é um Juiz de Direito e deve proferir a Sentença neste processo.
+As partes (Autor e Réu) manifestaram desinteresse na produção de outras provas, requerendo o julgamento antecipado da lide.
+**Processo ID:** {id_processo}
+**Peças Processuais Principais (na íntegra, para sua análise):**
+Petição Inicial: {peticao_inicial}
+--- Documentos do Autor (listados na inicial ou formulário): {documentos_autor}
+Contestação: {contestacao}
+--- Documentos do Réu (listados na contestação ou gerados): {documentos_reu}
+Decisão de Saneamento (contém os pontos controvertidos): {decisao_saneamento}
+Manifestação do Autor sobre Provas: {manifestacao_autor}
+Manifestação do Réu sobre Provas: {manifestacao_reu}
+**Modelo/Guia de Sentença (use como referência para estrutura e formalidades):**
+{modelo_texto_guia}
+**Demais Atos do Processo (resumo, se necessário):**
+{historico}
+---
+**Instruções para a Sentença:**
+1. Elabore um relatório conciso.
+2. Apresente a fundamentação, analisando as questões de fato e de direito, examinando as provas (documentais) em relação aos pontos controvertidos.
+3. Profira o dispositivo (procedente, parcialmente procedente ou improcedente).
+4. Condene a parte vencida em custas e honorários (ex: 10%).
+Sentença:
+""",
+
+    PROMPT_CONTESTACAO: """
+Você é um Advogado do Réu experiente. Sua tarefa é elaborar uma Contestação completa e robusta.
+**Processo ID:** {id_processo}
+**Despacho Judicial Recebido (determinando a citação/contestação):**
+{despacho}
+**Petição Inicial do Autor (que originou esta contestação e pode mencionar documentos juntados pelo Autor):**
+{peticao_inicial}
+**Modelo/Guia de Contestação (RAG - use para estrutura, formalidades e teses defensivas comuns):**
+{modelo_texto_guia}
+**Histórico Processual Anterior (resumo dos atos):**
+{historico}
+---
+Instruções para a Contestação:
+1. Analise cuidadosamente a Petição Inicial do Autor.
+2. Apresente as defesas processuais (preliminares), se houver (ex: incompetência, inépcia da inicial).
+3. No mérito, impugne especificamente os fatos narrados pelo Autor e os fundamentos jurídicos apresentados.
+4. Apresente a versão dos fatos sob a ótica do Réu e a fundamentação jurídica que ampara sua defesa.
+5. Formule os pedidos da contestação (ex: acolhimento das preliminares, improcedência dos pedidos do autor, condenação em custas e honorários).
+6. A contestação deve ser bem estruturada.
+Contestação:
+""",
+
+    PROMPT_DOCUMENTOS_REU: """
+Com base na Petição Inicial do Autor, na Contestação do Réu recém-elaborada, e nos fatos gerais do caso, você deve listar de 2 a 4 documentos principais que o Réu provavelmente juntaria para dar suporte à sua defesa.
+Para cada documento, forneça o tipo e uma descrição MUITO SUCINTA (1 frase, máximo 20 palavras).
+Petição Inicial do Autor (Resumo): {peticao_inicial_resumo}
+Contestação do Réu (Completa - elaborada para este caso): {contestacao}
+Fatos Gerais do Caso (fornecidos no início da simulação): {fatos}
+Sua resposta DEVE SER uma lista de strings, onde cada string representa um documento no formato: "Tipo do Documento: Descrição sucinta."
+Exemplo:
+Documento de Identidade do Réu: RG e CPF para qualificação.
+Contrato de Locação: Cópia do contrato que estabelece obrigações.
+Liste os documentos do Réu:
+""",
+
+    PROMPT_SENTIMENTO_CONTESTACAO: """
+Analise o tom e o sentimento predominante do seguinte texto jurídico (Contestação).
+Responda com uma única palavra ou expressão curta (ex: Assertivo, Conciliatório, Agressivo, Neutro).
+Texto da Contestação:
+{texto}
+Sentimento Predominante:""",
+
+    PROMPT_MANIFESTACAO_SEM_PROVAS_REU: """
+Você é o Advogado do Réu. O Juiz proferiu a Decisão de Saneamento e o Autor já se manifestou informando não ter mais provas a produzir.
+Seu cliente (Réu) também informou que não possui mais provas a produzir e deseja o julgamento antecipado da lide.
+**Processo ID:** {id_processo}
+**Decisão de Saneamento do Juiz (para referência):**
+{decisao_saneamento}
+**Manifestação do Autor Recebida:**
+{manifestacao_autor}
+**Pontos Controvertidos Fixados na Decisão de Saneamento:**
+{pontos_controvertidos}
+**Histórico Processual Anterior (resumo dos atos, para contexto):**
+{historico}
+**Instruções:**
+1. Redija uma petição de "Manifestação Sobre Provas (Réu)".
+2. Na petição, declare que o Réu também não tem outras provas a produzir.
+3. Requeira o julgamento do processo no estado em que se encontra.
+Manifestação Sobre Provas (Réu):
+""",
+
+    PROMPT_EMENTA_CNJ: """
+Você é um especialista em direito e Diretor de Secretaria experiente, encarregado de gerar uma ementa para a seguinte sentença, seguindo RIGOROSAMENTE o padrão da Recomendação CNJ 154/2024 (EMENTA-PADRÃO).
+
+**SENTENÇA COMPLETA:**
+{texto_sentenca}
+
+**PADRÃO DA EMENTA (Recomendação CNJ 154/2024) A SER SEGUIDO:**
+Ementa: [Ramo do Direito]. [Classe processual]. [Frase ou palavras que indiquem o assunto principal]. [Conclusão].
+
+I. Caso em exame
+1. Apresentação do caso, com a indicação dos fatos relevantes, do pedido principal da ação ou do recurso e, se for o caso, da decisão recorrida.
+
+II. Questão em discussão
+2. A questão em discussão consiste em (...). / Há duas questões em discussão: (i) saber se (...); e (ii) saber se (...). (incluir todas as questões, com os seus respectivos fatos e fundamentos, utilizando-se de numeração em romano, letras minúsculas e entre parênteses).
+
+III. Razões de decidir
+3. Exposição do fundamento de maneira resumida (cada fundamento deve integrar um item).
+4. Exposição de outro fundamento de maneira resumida. (Adicionar mais itens conforme necessário, seguindo a numeração)
+
+IV. Dispositivo e tese
+5. Ex: Pedido procedente/improcedente. Recurso provido/desprovido.
+Tese de julgamento: frases objetivas das conclusões da decisão, ordenadas por numerais cardinais entre aspas e sem itálico. “1. [texto da tese]. 2. [texto da tese]” (quando houver tese).
+_________
+Dispositivos relevantes citados: ex.: CF/1988, art. 1º, III e IV; CC, arts. 1.641, II, e 1.639, § 2º.
+Jurisprudência relevante citada: ex.: STF, ADPF nº 130, Rel. Min. Ayres Britto, Plenário, j. 30.04.2009.
+
+**INSTRUÇÕES CRÍTICAS:**
+- Extraia as informações DIRETAMENTE da sentença fornecida para o Processo ID: {id_processo}. NÃO INVENTE informações.
+- Preencha TODAS as seções do padrão da ementa conforme especificado.
+- Seja fiel ao conteúdo e à terminologia da sentença.
+- Para "Ramo do Direito" e "Classe Processual", infira da sentença ou, se não explícito, deduza com base no conteúdo (ex: Direito Civil, Ação de Indenização por Danos Morais).
+- Mantenha a formatação EXATA, incluindo numeração, marcadores (I, II, III, IV), letras minúsculas entre parênteses para sub-itens de questões, e a linha "_________" antes dos dispositivos/jurisprudência citados.
+- Se uma seção não tiver conteúdo direto na sentença (ex: ausência de tese explícita), indique "Não consta expressamente na sentença." ou similar, mas tente ao máximo extrair ou inferir.
+
+Responda APENAS com a ementa formatada.
+
+**EMENTA GERADA (no padrão CNJ):**
+""",
+
+    PROMPT_EXTRACAO_TESES: """
+Dada a seguinte sentença, extraia 2-3 teses jurídicas centrais ou os principais pontos de direito decididos.
+Formate cada tese como uma frase curta e objetiva, ideal para uma busca de jurisprudência.
+Se a sentença for complexa, foque nos pontos que seriam mais controversos ou relevantes para pesquisa jurisprudencial.
+Responda com cada tese em uma nova linha.
+
+Sentença (trecho inicial para identificação, o conteúdo completo foi analisado internamente):
+{trecho_sentenca}
+
+Teses/Palavras-chave para Busca (uma por linha):
+""",
+
+    PROMPT_ANALISE_JURISPRUDENCIA: """
+Você é um jurista sênior analisando uma sentença judicial à luz da jurisprudência encontrada.
+
+**SENTENÇA ORIGINAL (Teses principais extraídas):**
+{teses}
+(Fim das teses da sentença)
+
+**JURISPRUDÊNCIA ENCONTRADA (Snippets e Resumos de Buscas):**
+{jurisprudencia}
+
+**Tarefa:**
+Com base EXCLUSIVAMENTE na jurisprudência fornecida acima, avalie se as teses principais da sentença original parecem estar, em termos gerais, alinhadas ou desalinhadas com essa jurisprudência.
+Seja cauteloso e objetivo. Se a jurisprudência não for clara, suficiente ou diretamente aplicável, afirme isso.
+
+**Formato da Resposta:**
+1.  **Avaliação Geral:** (Ex: "Alinhada com a jurisprudência apresentada.", "Aparentemente desalinhada em relação a X.", "Parcialmente alinhada.", "Jurisprudência insuficiente para uma conclusão definitiva.")
+2.  **Justificativa Sucinta:** (Explique brevemente, apontando pontos de convergência ou divergência com base nos trechos da jurisprudência, ou a dificuldade de comparação.)
+3.  **Observação:** Lembre-se que esta é uma análise preliminar baseada em snippets de busca.
+
+**Análise da Sentença vs. Jurisprudência:**
+""",
+}
+
+# Compilados uma única vez; as variáveis de cada prompt ficam em PROMPTS[id].input_variables.
+PROMPTS: Dict[str, ChatPromptTemplate] = {
+    id_prompt: ChatPromptTemplate.from_template(texto) for id_prompt, texto in TEXTOS_PROMPTS.items()
+}
+
+
+if __name__ == '__main__':
+    print("--- Testando Registro de Prompts ---")
+    for id_prompt, prompt in PROMPTS.items():
+        print(f"  {id_prompt}: {sorted(prompt.input_variables)}")
+    texto_com_chaves = 'Contrato {"cláusula": 5} e valor {R$ 1.000}'
+    mensagens = PROMPTS[PROMPT_SENTIMENTO_CONTESTACAO].format_messages(texto=texto_com_chaves)
+    assert texto_com_chaves in mensagens[0].content
+    print("--- Fim dos Testes Registro de Prompts ---")
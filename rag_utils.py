@@ -1,29 +1,124 @@
+import glob
+import hashlib
+import json
 import os
-import shutil # Para limpar a pasta FAISS se necessário
-from typing import List, Union, Any
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple, Union
+
+import faiss
+import numpy as np
+from pydantic import ConfigDict
 
 # LangChain imports
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import Docx2txtLoader, DirectoryLoader
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.document_loaders import Docx2txtLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
 # Importar constantes do settings.py
 from settings import (
-    FAISS_INDEX_PATH,
     PATH_PROCESSO_EM_SI,
     PATH_MODELOS_PETICOES,
     PATH_MODELOS_JUIZ,
-    EMBEDDING_MODEL_NAME,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
+    CHUNKING_POR_SECOES,
+    CHUNK_SECAO_MAX_CARACTERES,
+    CHUNK_SECAO_MIN_CARACTERES,
     RETRIEVER_SEARCH_K,
     RETRIEVER_FETCH_K,
-    GOOGLE_API_KEY # Necessário para GoogleGenerativeAIEmbeddings
+    RETRIEVER_HIBRIDO,
+    RETRIEVER_USAR_MMR,
+    RETRIEVER_MMR_LAMBDA,
+    INDICE_MODELOS_SOMENTE_CARREGAR,
+    INDICE_MODELOS_PACOTE_PATH,
+    INDICE_NUMPY_MAX_CHUNKS,
+    CONSULTAS_MODELOS_RAG,
+    MODELOS_POR_ETAPA,
+    MAX_RESULTADOS_MEMORIZADOS,
+    DOCX_CACHE_PATH,
+    DOCX_CACHE_MAX_BYTES,
+    EMBEDDING_BACKEND, # Usada apenas no teste do __main__
+    GOOGLE_API_KEY # Usada apenas no teste do __main__
+)
+from cache_utils import ArmazenamentoLRU
+from busca_lexical import IndiceBM25, fundir_por_rrf # Busca lexical (BM25) da recuperação híbrida
+from divisor_secoes import DivisorSecoesJuridicas # Chunks alinhados às seções processuais
+from embeddings_utils import obter_modelo_embeddings, identificador_embeddings # Backend configurado em settings.py
+from compressao_vetorial import anexar_indice_comprimido, buscar_com_rerank, indice_comprimido_de # Acervos grandes
+from index_storage import ( # Armazenamento versionado, com trava e publicação atômica
+    caminho_namespace_modelos,
+    caminho_namespace_caso,
+    carregar_indice,
+    abrir_versao_indice,
+    ler_manifesto_pacote,
+    obter_ou_construir_indice,
+    publicar_indice,
+    copiar_indice,
+    fechar_indice,
+    coletar_indices_expirados
 )
 
 
+# Cache do texto extraído dos .docx (arquivo único, comprimido). Cada entrada guarda o
+# mtime e o tamanho do arquivo: se qualquer um mudar, o .docx é lido de novo e a entrada
+# antiga é sobrescrita. Com o cache quente, carregar os modelos custa um stat() por arquivo.
+_cache_textos_docx: Union[ArmazenamentoLRU, None] = None
+_lock_cache_textos = threading.Lock()
+
+def _obter_cache_textos_docx() -> ArmazenamentoLRU:
+    global _cache_textos_docx
+    with _lock_cache_textos:
+        if _cache_textos_docx is None:
+            _cache_textos_docx = ArmazenamentoLRU(DOCX_CACHE_PATH, DOCX_CACHE_MAX_BYTES, comprimir=True)
+        return _cache_textos_docx
+
+def extrair_texto_docx(caminho_docx: str) -> str:
+    """
+    Retorna o texto de um .docx, usando o cache de textos extraídos quando o arquivo não mudou.
+
+    Args:
+        caminho_docx: Caminho do arquivo .docx.
+
+    Returns:
+        O texto extraído (mesmo resultado do Docx2txtLoader).
+    """
+    info = os.stat(caminho_docx)
+    cache = _obter_cache_textos_docx()
+    chave = os.path.abspath(caminho_docx)
+    valor = cache.obter(chave)
+    if valor is not None:
+        entrada = json.loads(valor)
+        if entrada["mtime_ns"] == info.st_mtime_ns and entrada["tamanho"] == info.st_size:
+            return entrada["texto"]
+
+    texto = "\n".join(doc.page_content for doc in Docx2txtLoader(caminho_docx).load())
+    cache.gravar(chave, json.dumps(
+        {"mtime_ns": info.st_mtime_ns, "tamanho": info.st_size, "texto": texto},
+        ensure_ascii=False
+    ).encode("utf-8"))
+    return texto
+
+def listar_modelos_docx(pasta: str) -> List[str]:
+    """Caminhos dos .docx da pasta e subpastas, em ordem (ignora os arquivos de trava '~$' do Word)."""
+    caminhos = glob.glob(os.path.join(pasta, "**", "*.docx"), recursive=True)
+    return sorted(caminho for caminho in caminhos if not os.path.basename(caminho).startswith("~$"))
+
+def carregar_modelo_docx(caminho_docx: str, tipo_fonte: str) -> Document:
+    """Document de um modelo (.docx), com os metadados usados na busca e na atualização incremental."""
+    return Document(
+        page_content=extrair_texto_docx(caminho_docx),
+        metadata={
+            "source": caminho_docx,
+            "file_name": os.path.basename(caminho_docx),
+            "source_type": tipo_fonte
+        }
+    )
+
 def carregar_documentos_docx(
     caminho_pasta_ou_arquivo: str,
     tipo_fonte: str,
@@ -49,15 +144,15 @@ def carregar_documentos_docx(
     if tipo_fonte == "processo_atual_arquivo" and id_processo_especifico and os.path.isfile(caminho_pasta_ou_arquivo):
         if caminho_pasta_ou_arquivo.endswith(".docx"):
             try:
-                loader = Docx2txtLoader(caminho_pasta_ou_arquivo)
-                docs_carregados = loader.load()
-                for doc in docs_carregados:
-                    doc.metadata = {
+                texto = extrair_texto_docx(caminho_pasta_ou_arquivo)
+                documentos.append(Document(
+                    page_content=texto,
+                    metadata={
                         "source_type": tipo_fonte,
                         "file_name": os.path.basename(caminho_pasta_ou_arquivo),
                         "process_id": id_processo_especifico
                     }
-                documentos.extend(docs_carregados)
+                ))
                 print(f"[RAG] Carregado processo de ARQUIVO '{os.path.basename(caminho_pasta_ou_arquivo)}' para ID '{id_processo_especifico}'.")
             except Exception as e:
                 print(f"Erro ao carregar {caminho_pasta_ou_arquivo}: {e}")
@@ -66,139 +161,747 @@ def carregar_documentos_docx(
 
     # Carregar todos os .docx de uma pasta (modelos)
     elif tipo_fonte in ["modelo_peticao", "modelo_juiz"] and os.path.isdir(caminho_pasta_ou_arquivo):
-        try:
-            loader = DirectoryLoader(
-                caminho_pasta_ou_arquivo,
-                glob="**/*.docx",
-                loader_cls=Docx2txtLoader,
-                show_progress=False, # Geralmente não é ideal em logs de backend
-                use_multithreading=True,
-                silent_errors=True # Erros em arquivos individuais não param tudo
-            )
-            docs_carregados = loader.load()
-            for doc in docs_carregados:
-                # Garante que file_name e source_type estejam nos metadados
-                doc.metadata["file_name"] = os.path.basename(doc.metadata.get("source", "unknown.docx"))
-                doc.metadata["source_type"] = tipo_fonte
-            documentos.extend(docs_carregados)
-            print(f"[RAG] Carregados {len(docs_carregados)} documentos da pasta de modelos '{os.path.basename(caminho_pasta_ou_arquivo)}'.")
-        except Exception as e:
-            print(f"Erro ao carregar modelos de {caminho_pasta_ou_arquivo}: {e}")
-            
+        for caminho_docx in listar_modelos_docx(caminho_pasta_ou_arquivo):
+            try:
+                documentos.append(carregar_modelo_docx(caminho_docx, tipo_fonte))
+            except Exception as e: # Erros em arquivos individuais não param tudo
+                print(f"Erro ao carregar modelo {caminho_docx}: {e}")
+        print(f"[RAG] Carregados {len(documentos)} documentos da pasta de modelos '{os.path.basename(caminho_pasta_ou_arquivo)}'.")
+
     return documentos
 
-def criar_ou_carregar_retriever(
-    id_processo: str,
-    documento_caso_atual: Union[str, Document, None] = None,
-    recriar_indice: bool = False
-) -> Union[Any, None]: # Any é para o tipo 'VectorStoreRetriever'
+# Pastas de modelos e o 'source_type' dos seus chunks.
+PASTAS_MODELOS_POR_TIPO = {"modelo_peticao": PATH_MODELOS_PETICOES, "modelo_juiz": PATH_MODELOS_JUIZ}
+
+def dividir_em_chunks(documentos: List[Document]) -> List[Document]:
+    """Divide os documentos por seção processual (CHUNKING_POR_SECOES) ou conforme CHUNK_SIZE/CHUNK_OVERLAP."""
+    if CHUNKING_POR_SECOES:
+        return DivisorSecoesJuridicas().split_documents(documentos)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(documentos)
+
+def parametros_chunking() -> Dict[str, Union[str, int]]:
+    """Estratégia e parâmetros de divisão em chunks em vigor (registrados nos manifestos dos índices)."""
+    if CHUNKING_POR_SECOES:
+        return {"estrategia": "secoes", "max_caracteres": CHUNK_SECAO_MAX_CARACTERES, "min_caracteres": CHUNK_SECAO_MIN_CARACTERES}
+    return {"estrategia": "caracteres", "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+def etiqueta_chunking(embeddings_model: Embeddings) -> str:
+    """Modelo de embeddings + parâmetros de chunking: mudar qualquer um invalida os índices publicados."""
+    chunking = "-".join(str(valor) for valor in parametros_chunking().values())
+    return f"{identificador_embeddings(embeddings_model)}|{chunking}"
+
+def impressoes_modelos(pastas_por_tipo: Union[Dict[str, str], None] = None) -> Dict[str, str]:
+    """
+    sha256 do conteúdo de cada modelo, por '<tipo_fonte>/<caminho relativo à pasta>'.
+    Os caminhos são relativos para que um pacote construído em outra máquina continue válido.
+    """
+    impressoes: Dict[str, str] = {}
+    for tipo_fonte, pasta in (pastas_por_tipo or PASTAS_MODELOS_POR_TIPO).items():
+        for caminho_docx in listar_modelos_docx(pasta):
+            with open(caminho_docx, "rb") as arquivo:
+                conteudo = arquivo.read()
+            caminho_relativo = os.path.relpath(caminho_docx, pasta).replace(os.sep, "/")
+            impressoes[f"{tipo_fonte}/{caminho_relativo}"] = hashlib.sha256(conteudo).hexdigest()
+    return impressoes
+
+def etiqueta_indice_modelos(embeddings_model: Embeddings, fontes: Union[Dict[str, str], None] = None) -> str:
+    """etiqueta_chunking + resumo dos modelos: criar, alterar ou remover um .docx também invalida o índice."""
+    if fontes is None:
+        fontes = impressoes_modelos()
+    resumo_fontes = hashlib.sha256(json.dumps(fontes, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{etiqueta_chunking(embeddings_model)}|fontes-{resumo_fontes}"
+
+def manifesto_indice_modelos(embeddings_model: Embeddings, fontes: Union[Dict[str, str], None] = None) -> dict:
+    """Manifesto de um pacote do índice de modelos: com o quê e a partir de quais arquivos foi construído."""
+    return {
+        "embeddings": identificador_embeddings(embeddings_model),
+        "chunking": parametros_chunking(),
+        "fontes": impressoes_modelos() if fontes is None else fontes,
+        "criado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def verificar_manifesto_modelos(
+    manifesto: dict,
+    embeddings_model: Embeddings,
+    fontes: Union[Dict[str, str], None] = None
+) -> List[str]:
+    """
+    Compara o manifesto de um pacote com a configuração e os modelos atuais.
+
+    Returns:
+        As divergências encontradas (lista vazia = pacote válido).
+    """
+    if fontes is None:
+        fontes = impressoes_modelos()
+    problemas = []
+    if manifesto.get("embeddings") != identificador_embeddings(embeddings_model):
+        problemas.append(f"embeddings '{manifesto.get('embeddings')}' != '{identificador_embeddings(embeddings_model)}'")
+    if manifesto.get("chunking") != parametros_chunking():
+        problemas.append(f"chunking {manifesto.get('chunking')} != {parametros_chunking()}")
+    fontes_pacote = manifesto.get("fontes", {})
+    novos = fontes.keys() - fontes_pacote.keys()
+    removidos = fontes_pacote.keys() - fontes.keys()
+    alterados = [nome for nome in fontes.keys() & fontes_pacote.keys() if fontes[nome] != fontes_pacote[nome]]
+    if novos or removidos or alterados:
+        problemas.append(f"modelos: {len(novos)} novo(s), {len(removidos)} removido(s), {len(alterados)} alterado(s)")
+    return problemas
+
+class IndiceVetorialNumPy:
+    """
+    Vector store em memória para corpora pequenos (ex: o documento de um caso): uma matriz (n, d)
+    de vetores normalizados e a lista de Documents. A busca é um único produto matriz-vetor
+    (similaridade de cosseno), sem construir índice FAISS e sem gravar nada em disco.
+
+    As distâncias retornadas são 2 - 2*cos, que para vetores unitários é a distância L2 ao
+    quadrado do FAISS: resultados desta camada e de uma camada FAISS podem ser comparados.
+    """
+
+    def __init__(self, documentos: List[Document], vetores: np.ndarray):
+        self.documentos = documentos
+        vetores = np.asarray(vetores, dtype=np.float32)
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        self.vetores = vetores / np.where(normas == 0, 1, normas)
+
+    @classmethod
+    def de_documentos(cls, documentos: List[Document], embeddings_model: Embeddings) -> "IndiceVetorialNumPy":
+        vetores = embeddings_model.embed_documents([doc.page_content for doc in documentos])
+        return cls(documentos, np.asarray(vetores, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.documentos)
+
+    def buscar(
+        self,
+        vetor_consulta: List[float],
+        k: int,
+        linhas: Union[np.ndarray, None] = None
+    ) -> List[Tuple[int, float]]:
+        """Retorna até k pares (linha, distância), considerando só 'linhas' se informado."""
+        consulta = np.asarray(vetor_consulta, dtype=np.float32)
+        consulta = consulta / (np.linalg.norm(consulta) or 1)
+        candidatos = np.arange(len(self.documentos)) if linhas is None else linhas
+        if len(candidatos) == 0 or k <= 0:
+            return []
+        distancias = 2 - 2 * (self.vetores[candidatos] @ consulta)
+        k = min(k, len(candidatos))
+        melhores = np.argpartition(distancias, k - 1)[:k]
+        melhores = melhores[np.argsort(distancias[melhores])]
+        return [(int(candidatos[posicao]), float(distancias[posicao])) for posicao in melhores]
+
+
+class CamadaBusca:
+    """
+    Um índice FAISS e o índice BM25 dos mesmos chunks, endereçados pela linha no índice FAISS.
+
+    Guarda o 'source_type' de cada linha para pré-filtrar as buscas (ex: só 'modelo_juiz'),
+    tanto a vetorial (seletor de ids do FAISS) quanto a lexical. Buscas retornam apenas linhas e
+    pontuações; o chunk só é lido do docstore (documento()) se for de fato retornado.
+    Também aceita um IndiceVetorialNumPy no lugar do FAISS (corpora pequenos, só em memória).
+    """
+
+    def __init__(self, vector_store: Union[FAISS, IndiceVetorialNumPy], indice_lexical: Union[IndiceBM25, None] = None):
+        self.vector_store = vector_store
+        if isinstance(vector_store, IndiceVetorialNumPy):
+            self._ids = [str(linha) for linha in range(len(vector_store))]
+        else:
+            self._ids = [vector_store.index_to_docstore_id[linha] for linha in range(vector_store.index.ntotal)]
+        self._linha_por_id = {id_chunk: linha for linha, id_chunk in enumerate(self._ids)}
+        tipos_fonte: List[str] = []
+
+        def percorrer_chunks() -> Iterable[Tuple[str, str]]:
+            # Uma única passada pelo docstore coleta os tipos de fonte e alimenta o BM25.
+            for linha, id_chunk in enumerate(self._ids):
+                doc = self.documento(linha)
+                tipos_fonte.append(doc.metadata.get("source_type", ""))
+                yield id_chunk, doc.page_content
+
+        if indice_lexical is None:
+            indice_lexical = IndiceBM25()
+            indice_lexical.adicionar(percorrer_chunks())
+        else:
+            for _ in percorrer_chunks():
+                pass
+        self.indice_lexical = indice_lexical
+        self._tipo_por_linha = tipos_fonte
+        self._linhas_por_tipo: Dict[str, np.ndarray] = {
+            tipo: np.array([linha for linha, t in enumerate(tipos_fonte) if t == tipo], dtype=np.int64)
+            for tipo in set(tipos_fonte)
+        }
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _linhas_permitidas(self, tipos_fonte: Union[Tuple[str, ...], None]) -> Union[np.ndarray, None]:
+        """None = sem filtro; senão, as linhas dos tipos pedidos (possivelmente vazio)."""
+        if not tipos_fonte or set(self._linhas_por_tipo).issubset(tipos_fonte):
+            return None
+        partes = [self._linhas_por_tipo[tipo] for tipo in tipos_fonte if tipo in self._linhas_por_tipo]
+        return np.sort(np.concatenate(partes)) if partes else np.array([], dtype=np.int64)
+
+    def buscar_vetorial(
+        self,
+        vetor_consulta: List[float],
+        k: int,
+        tipos_fonte: Union[Tuple[str, ...], None] = None
+    ) -> List[Tuple[int, float]]:
+        """Retorna até k pares (linha, distância L2), filtrando por tipo de fonte antes da busca."""
+        linhas = self._linhas_permitidas(tipos_fonte)
+        total = len(self._ids) if linhas is None else len(linhas)
+        if total == 0 or k <= 0:
+            return []
+        if isinstance(self.vector_store, IndiceVetorialNumPy):
+            return self.vector_store.buscar(vetor_consulta, k, linhas)
+        consulta = np.asarray([vetor_consulta], dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(consulta)
+        indice_comprimido = indice_comprimido_de(self.vector_store)
+        if indice_comprimido is not None: # Candidatos do índice comprimido, re-rankeados pela distância exata
+            distancias, indices = buscar_com_rerank(indice_comprimido, self.vector_store.index, consulta, min(k, total), linhas=linhas)
+        else:
+            parametros = None if linhas is None else faiss.SearchParameters(sel=faiss.IDSelectorBatch(linhas))
+            distancias, indices = self.vector_store.index.search(consulta, min(k, total), params=parametros)
+        return [(int(linha), float(distancia)) for linha, distancia in zip(indices[0], distancias[0]) if linha >= 0]
+
+    def buscar_lexical(
+        self,
+        consulta: str,
+        k: int,
+        tipos_fonte: Union[Tuple[str, ...], None] = None
+    ) -> List[Tuple[int, float]]:
+        """Retorna até k pares (linha, pontuação BM25), filtrando por tipo de fonte."""
+        filtro = None
+        if tipos_fonte:
+            filtro = lambda id_chunk: self._tipo_por_linha[self._linha_por_id[id_chunk]] in tipos_fonte
+        return [(self._linha_por_id[id_chunk], pontuacao) for id_chunk, pontuacao in self.indice_lexical.buscar(consulta, k, filtro)]
+
+    def documento(self, linha: int) -> Document:
+        if isinstance(self.vector_store, IndiceVetorialNumPy):
+            return self.vector_store.documentos[linha]
+        return self.vector_store.docstore.search(self._ids[linha])
+
+    def vetores(self, linhas: List[int]) -> np.ndarray:
+        if isinstance(self.vector_store, IndiceVetorialNumPy):
+            return self.vector_store.vetores[np.asarray(linhas, dtype=np.int64)]
+        return self.vector_store.index.reconstruct_batch(np.asarray(linhas, dtype=np.int64))
+
+
+def _selecionar_mmr(
+    vetor_consulta: List[float],
+    vetores: np.ndarray,
+    k: int,
+    lambda_mult: float,
+    relevancias: Union[np.ndarray, None] = None
+) -> List[int]:
     """
-    Cria um novo índice FAISS ou carrega um existente.
-    O índice incluirá os modelos (comuns) e o documento específico do processo atual (se fornecido).
+    Maximal Marginal Relevance vetorizado: escolhe k posições equilibrando relevância e diversidade.
+    Sem 'relevancias', usa a similaridade de cosseno de cada candidato com a consulta.
+    """
+    if len(vetores) == 0:
+        return []
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    vetores_norm = vetores / np.where(normas == 0, 1, normas)
+    if relevancias is None:
+        consulta = np.asarray(vetor_consulta, dtype=np.float32)
+        relevancias = vetores_norm @ (consulta / (np.linalg.norm(consulta) or 1))
+    similaridades = vetores_norm @ vetores_norm.T
+    selecionados = [int(np.argmax(relevancias))]
+    maior_similaridade = similaridades[selecionados[0]].copy() # Com o conjunto já selecionado
+    while len(selecionados) < min(k, len(vetores)):
+        pontuacoes = lambda_mult * relevancias - (1 - lambda_mult) * maior_similaridade
+        pontuacoes[selecionados] = -np.inf
+        escolhido = int(np.argmax(pontuacoes))
+        selecionados.append(escolhido)
+        maior_similaridade = np.maximum(maior_similaridade, similaridades[escolhido])
+    return selecionados
+
+# --- Camada 1: índice de modelos compartilhado pelo processo ---
+# Os modelos (petições e decisões) são comuns a todos os casos, então o índice é construído
+# (ou carregado do disco) uma única vez e reaproveitado por todas as sessões do Streamlit.
+_indice_modelos_compartilhado: Union[FAISS, None] = None
+_camada_modelos: Union[CamadaBusca, None] = None # FAISS + BM25 + tipos de fonte do índice acima
+_embeddings_indice_modelos: Union[str, None] = None # Identificador do modelo de embeddings do índice carregado
+_versao_indice_modelos = 0 # Incrementada a cada (re)carga ou atualização; invalida os resultados memorizados
+_lock_indice_modelos = threading.Lock()
+
+# Resultados (linha, distância) de buscas no índice de modelos, por (consulta, versão do índice,
+# k, tipos de fonte). As consultas dos agentes são fixas, então a partir da segunda simulação
+# a camada de modelos é uma leitura em memória.
+_resultados_memorizados: Dict[Tuple[str, int, int, Union[Tuple[str, ...], None]], List[Tuple[int, float]]] = {}
+_lock_resultados = threading.Lock()
+
+def _construir_indice_modelos(embeddings_model: Embeddings) -> Union[FAISS, None]:
+    print("[RAG] Criando novo índice FAISS de modelos...")
+    documentos_modelos: List[Document] = []
+    for tipo_fonte, pasta in PASTAS_MODELOS_POR_TIPO.items():
+        documentos_modelos.extend(carregar_documentos_docx(pasta, tipo_fonte))
+    docs_divididos = dividir_em_chunks(documentos_modelos)
+    if not docs_divididos:
+        print("ERRO RAG: Nenhum chunk de modelo gerado. Verifique as pastas de modelos.")
+        return None
+    print(f"[RAG] Modelos divididos em {len(docs_divididos)} chunks.")
+    try:
+        vector_store = FAISS.from_documents(docs_divididos, embeddings_model)
+    except Exception as e:
+        print(f"Erro fatal ao criar FAISS de modelos: {e}")
+        return None
+    anexar_indice_comprimido(vector_store) # Antes de publicar: a versão gravada já leva o índice comprimido
+    return vector_store
+
+def obter_indice_modelos(embeddings_model: Embeddings, recriar_indice: bool = False) -> Union[FAISS, None]:
+    """
+    Retorna o índice FAISS (imutável) dos modelos de petições e de juiz, compartilhado pelo processo.
+
+    Na primeira chamada, usa o pacote pré-construído (INDICE_MODELOS_PACOTE_PATH) se o manifesto
+    conferir com o modelo de embeddings, o chunking e os .docx atuais; senão, carrega a versão
+    publicada no namespace de modelos ou, se não existir, constrói a partir das pastas de modelos
+    e a publica (ver index_storage). As chamadas seguintes retornam a instância já carregada em
+    memória. Com INDICE_MODELOS_SOMENTE_CARREGAR, o índice nunca é construído aqui: ele deve ter
+    sido publicado ou empacotado por ingestao_modelos.py.
 
     Args:
-        id_processo: Identificador do processo.
-        documento_caso_atual: Pode ser um objeto Document (gerado por formulários)
-                                ou uma string com o nome do arquivo .docx (para fallback).
-        recriar_indice: Força a recriação do índice.
+        embeddings_model: Modelo de embeddings usado para construir/carregar o índice.
+        recriar_indice: Reconstrói o índice a partir dos modelos e publica uma nova versão.
 
     Returns:
-        Uma instância de FAISS retriever ou None em caso de falha crítica.
+        O vector store FAISS dos modelos ou None em caso de falha.
     """
-    if not GOOGLE_API_KEY:
-        print("ERRO RAG: GOOGLE_API_KEY não configurada. Não é possível criar embeddings.")
+    identificador = identificador_embeddings(embeddings_model)
+    with _lock_indice_modelos:
+        if _indice_modelos_compartilhado is not None and not recriar_indice and _embeddings_indice_modelos == identificador:
+            return _indice_modelos_compartilhado
+        fontes = impressoes_modelos()
+        if not recriar_indice:
+            vector_store = _carregar_pacote_modelos(embeddings_model, fontes)
+            if vector_store is not None:
+                _definir_indice_modelos(vector_store, embeddings_model)
+                return vector_store
+        # A etiqueta inclui o modelo de embeddings, o chunking e os modelos: nada incompatível ou desatualizado é carregado.
+        etiqueta = etiqueta_indice_modelos(embeddings_model, fontes)
+        if INDICE_MODELOS_SOMENTE_CARREGAR:
+            vector_store = carregar_indice(caminho_namespace_modelos(), embeddings_model, etiqueta)
+            if vector_store is None:
+                print("ERRO RAG: Nenhum índice de modelos compatível publicado. Execute 'python ingestao_modelos.py' "
+                      "(ou desative INDICE_MODELOS_SOMENTE_CARREGAR).")
+                return None
+            print(f"[INDICE] Índice carregado de '{caminho_namespace_modelos()}'.")
+            _definir_indice_modelos(vector_store, embeddings_model)
+            return vector_store
+        vector_store = obter_ou_construir_indice(
+            caminho_namespace_modelos(),
+            embeddings_model,
+            lambda: _construir_indice_modelos(embeddings_model),
+            etiqueta=etiqueta,
+            recriar=recriar_indice
+        )
+        if vector_store is not None:
+            _definir_indice_modelos(vector_store, embeddings_model)
+        return vector_store
+
+def _carregar_pacote_modelos(embeddings_model: Embeddings, fontes: Dict[str, str]) -> Union[FAISS, None]:
+    """Abre o pacote pré-construído se existir e o manifesto conferir; pacotes desatualizados são recusados."""
+    manifesto = ler_manifesto_pacote(INDICE_MODELOS_PACOTE_PATH)
+    if manifesto is None:
         return None
-        
-    embeddings_model = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL_NAME,
-        task_type="retrieval_document",
-        google_api_key=GOOGLE_API_KEY
-    )
+    problemas = verificar_manifesto_modelos(manifesto, embeddings_model, fontes)
+    if problemas:
+        print(f"[INDICE] Pacote '{INDICE_MODELOS_PACOTE_PATH}' recusado (desatualizado): {'; '.join(problemas)}.")
+        return None
+    try:
+        vector_store = abrir_versao_indice(INDICE_MODELOS_PACOTE_PATH, embeddings_model)
+    except Exception as e:
+        print(f"[INDICE] Falha ao abrir o pacote '{INDICE_MODELOS_PACOTE_PATH}': {e}")
+        return None
+    print(f"[INDICE] Pacote pré-construído carregado de '{INDICE_MODELOS_PACOTE_PATH}' "
+          f"({vector_store.index.ntotal} chunks, criado em {manifesto.get('criado_em')}).")
+    return vector_store
+
+def _definir_indice_modelos(
+    vector_store: FAISS,
+    embeddings_model: Embeddings,
+    indice_lexical: Union[IndiceBM25, None] = None
+) -> None:
+    """Troca o índice de modelos compartilhado (chamado com _lock_indice_modelos adquirido)."""
+    global _indice_modelos_compartilhado, _camada_modelos, _embeddings_indice_modelos, _versao_indice_modelos
+    # Versões publicadas antes de mudar INDICE_MODELOS_TIPO são comprimidas aqui (só em memória).
+    anexar_indice_comprimido(vector_store)
+    if _indice_modelos_compartilhado is not vector_store:
+        # Retrievers que ainda usam a versão anterior reabrem os chunks sob demanda.
+        fechar_indice(_indice_modelos_compartilhado)
+    _indice_modelos_compartilhado = vector_store
+    _embeddings_indice_modelos = identificador_embeddings(embeddings_model)
+    _camada_modelos = CamadaBusca(vector_store, indice_lexical)
+    _versao_indice_modelos += 1
+    with _lock_resultados:
+        _resultados_memorizados.clear()
+    try:
+        # Pré-computa (uma vez por modelo de embeddings) os vetores das consultas fixas.
+        embeddings_model.pre_computar_consultas(list(CONSULTAS_MODELOS_RAG.values()))
+    except Exception as e:
+        print(f"[RAG] Aviso: falha ao pré-computar consultas fixas: {e}")
+
+def tipo_fonte_do_modelo(caminho_docx: str) -> Union[str, None]:
+    """Retorna 'modelo_peticao'/'modelo_juiz' conforme a pasta de modelos que contém o arquivo."""
+    caminho_abs = os.path.abspath(caminho_docx)
+    for tipo_fonte, pasta in PASTAS_MODELOS_POR_TIPO.items():
+        if caminho_abs.startswith(os.path.abspath(pasta) + os.sep):
+            return tipo_fonte
+    return None
+
+_lock_atualizacao_modelos = threading.Lock()
+
+def atualizar_modelos_incrementalmente(caminhos_alterados: List[str]) -> bool:
+    """
+    Aplica ao índice de modelos apenas as mudanças dos .docx informados (criados, alterados ou
+    removidos), sem reconstruir o índice inteiro.
+
+    A atualização é feita em uma cópia do índice: os chunks antigos dos arquivos são removidos,
+    os novos são adicionados (só textos novos vão para a API de embeddings) e a cópia é
+    publicada como nova versão. Retrievers em uso continuam lendo a versão anterior.
+
+    Args:
+        caminhos_alterados: Caminhos dos .docx que mudaram (arquivos inexistentes são tratados como removidos).
+
+    Returns:
+        True se uma nova versão foi publicada.
+    """
+    embeddings_model = obter_modelo_embeddings()
+    if embeddings_model is None:
+        return False
+    with _lock_atualizacao_modelos:
+        indice_atual = obter_indice_modelos(embeddings_model)
+        if indice_atual is None:
+            return False
+
+        novo_indice = copiar_indice(indice_atual, embeddings_model) # O índice publicado é somente leitura (mmap)
+        indice_comprimido_anterior = indice_comprimido_de(indice_atual)
+        indice_lexical = _camada_modelos.indice_lexical.copiar() if _camada_modelos is not None else None
+        caminhos_abs = {os.path.abspath(caminho) for caminho in caminhos_alterados}
+        ids_remover = []
+        for id_doc in novo_indice.index_to_docstore_id.values():
+            doc = novo_indice.docstore.search(id_doc)
+            if isinstance(doc, Document) and os.path.abspath(doc.metadata.get("source", "")) in caminhos_abs:
+                ids_remover.append(id_doc)
+        if ids_remover:
+            novo_indice.delete(ids_remover)
+            if indice_lexical is not None:
+                indice_lexical.remover(ids_remover)
+
+        documentos_novos: List[Document] = []
+        for caminho in caminhos_alterados:
+            tipo_fonte = tipo_fonte_do_modelo(caminho)
+            if tipo_fonte is None or not os.path.isfile(caminho):
+                continue
+            try:
+                documentos_novos.append(carregar_modelo_docx(caminho, tipo_fonte))
+            except Exception as e:
+                print(f"Erro ao carregar modelo {caminho}: {e}")
+        chunks_novos = dividir_em_chunks(documentos_novos)
+        if chunks_novos:
+            ids_novos = novo_indice.add_documents(chunks_novos)
+            if indice_lexical is not None:
+                indice_lexical.adicionar(zip(ids_novos, (chunk.page_content for chunk in chunks_novos)))
+
+        anexar_indice_comprimido(novo_indice, indice_anterior=indice_comprimido_anterior) # Reaproveita o treino
+        publicar_indice(caminho_namespace_modelos(), novo_indice, etiqueta=etiqueta_indice_modelos(embeddings_model))
+        with _lock_indice_modelos:
+            _definir_indice_modelos(novo_indice, embeddings_model, indice_lexical)
+    print(f"[RAG] Índice de modelos atualizado: {len(ids_remover)} chunk(s) removidos, {len(chunks_novos)} adicionados "
+          f"({len(caminhos_alterados)} arquivo(s) alterado(s)).")
+    return True
+
+def _buscar_modelos_memorizado(
+    camada_modelos: CamadaBusca,
+    versao_indice: int,
+    consulta: str,
+    vetor_consulta: List[float],
+    k: int,
+    tipos_fonte: Union[Tuple[str, ...], None] = None
+) -> List[Tuple[int, float]]:
+    """Busca no índice de modelos, reaproveitando o resultado de buscas idênticas anteriores."""
+    chave = (consulta, versao_indice, k, tipos_fonte)
+    with _lock_resultados:
+        resultado = _resultados_memorizados.get(chave)
+    if resultado is None:
+        resultado = camada_modelos.buscar_vetorial(vetor_consulta, k, tipos_fonte)
+        with _lock_resultados:
+            if len(_resultados_memorizados) >= MAX_RESULTADOS_MEMORIZADOS:
+                _resultados_memorizados.pop(next(iter(_resultados_memorizados)))
+            _resultados_memorizados[chave] = resultado
+    return list(resultado)
 
-    if recriar_indice and os.path.exists(FAISS_INDEX_PATH):
-        print(f"[RAG] Removendo índice FAISS antigo de '{FAISS_INDEX_PATH}' devido à flag recriar_indice.")
+# --- Modelos completos por etapa (sem busca) ---
+# Caminho do .docx -> (mtime_ns, tamanho, texto). Cada consulta custa um stat(): um modelo
+# editado é relido na próxima etapa que o usar, sem esperar o observador de modelos.
+_modelos_por_etapa: Dict[str, Tuple[int, int, str]] = {}
+_lock_modelos_por_etapa = threading.Lock()
+
+def _texto_modelo_mapeado(caminho_docx: str) -> str:
+    info = os.stat(caminho_docx)
+    with _lock_modelos_por_etapa:
+        entrada = _modelos_por_etapa.get(caminho_docx)
+    if entrada is not None and entrada[:2] == (info.st_mtime_ns, info.st_size):
+        return entrada[2]
+    texto = extrair_texto_docx(caminho_docx)
+    with _lock_modelos_por_etapa:
+        _modelos_por_etapa[caminho_docx] = (info.st_mtime_ns, info.st_size, texto)
+    return texto
+
+def obter_modelo_da_etapa(
+    etapa: str,
+    retriever: Union[BaseRetriever, None] = None,
+    tipos_fonte: Union[List[str], None] = None
+) -> Union[str, None]:
+    """
+    Retorna o texto completo do modelo da etapa, conforme MODELOS_POR_ETAPA (settings.py).
+
+    Etapas mapeadas não passam pelo retriever (nenhuma chamada de embeddings) e recebem o modelo
+    inteiro, não só o primeiro chunk. Para etapas sem mapeamento, ou se o arquivo não existir,
+    busca o chunk mais relevante com a consulta fixa da etapa (CONSULTAS_MODELOS_RAG).
+
+    Args:
+        etapa: Constante ETAPA_* da etapa em execução.
+        retriever: Retriever usado no fallback (pode ser None).
+        tipos_fonte: Tipos de modelo ('source_type') aceitos no fallback.
+
+    Returns:
+        O texto do modelo, ou None se nenhum foi encontrado.
+    """
+    caminho_docx = MODELOS_POR_ETAPA.get(etapa)
+    if caminho_docx:
         try:
-            shutil.rmtree(FAISS_INDEX_PATH)
+            texto = _texto_modelo_mapeado(caminho_docx)
+            if texto.strip():
+                return texto
+            print(f"[RAG] Aviso: modelo da etapa {etapa} ('{caminho_docx}') está vazio; usando a busca.")
         except OSError as e:
-            print(f"Erro ao remover diretório FAISS antigo: {e}. Continuando com a recriação...")
+            print(f"[RAG] Aviso: modelo da etapa {etapa} indisponível ({e}); usando a busca.")
+    consulta = CONSULTAS_MODELOS_RAG.get(etapa)
+    if consulta is None or retriever is None:
+        print(f"[RAG] Aviso: nenhum modelo para a etapa {etapa} ({'sem consulta fixa' if retriever else 'retriever não disponível'}).")
+        return None
+    try:
+        documentos = retriever.invoke(consulta, k=1, tipos_fonte=tipos_fonte)
+    except Exception as e:
+        print(f"[RAG] Erro ao buscar o modelo da etapa {etapa}: {e}")
+        return None
+    return documentos[0].page_content if documentos else None
 
+# --- Camada 2: índice do caso (namespace próprio por id_processo) ---
+def criar_indice_caso(
+    id_processo: str,
+    documento_caso_atual: Union[str, Document, None],
+    embeddings_model: Embeddings
+) -> Union[FAISS, IndiceVetorialNumPy, None]:
+    """
+    Obtém o pequeno índice com apenas o documento do caso atual.
 
-    if os.path.exists(FAISS_INDEX_PATH) and not recriar_indice:
-        try:
-            print(f"[RAG] Tentando carregar índice FAISS existente de '{FAISS_INDEX_PATH}'.")
-            vector_store = FAISS.load_local(
-                FAISS_INDEX_PATH,
-                embeddings_model,
-                allow_dangerous_deserialization=True # Necessário para FAISS com pickle
-            )
-            print("[RAG] Índice FAISS carregado com sucesso.")
-
-            if documento_caso_atual:
-                print("[RAG] Documento do caso atual fornecido e índice existente. Recriando para garantir inclusão.")
-                # Chamada recursiva para recriar
-                return criar_ou_carregar_retriever(id_processo, documento_caso_atual, recriar_indice=True)
-            return vector_store.as_retriever(
-                search_kwargs={'k': RETRIEVER_SEARCH_K, 'fetch_k': RETRIEVER_FETCH_K}
-            )
-        except Exception as e:
-            print(f"[RAG] Erro ao carregar índice FAISS: {e}. Recriando...")
-            if os.path.exists(FAISS_INDEX_PATH):
-                try:
-                    shutil.rmtree(FAISS_INDEX_PATH)
-                except OSError as e_rem:
-                    print(f"Erro ao remover diretório FAISS durante tentativa de recriação: {e_rem}. Falha pode ocorrer.")
-
-
-    print("[RAG] Criando novo índice FAISS...")
-    todos_documentos: List[Document] = []
+    Casos com até INDICE_NUMPY_MAX_CHUNKS chunks ficam em um IndiceVetorialNumPy, só em memória
+    (os vetores vêm do cache de embeddings se o caso já foi simulado). Casos maiores usam um
+    índice FAISS no namespace do processo, etiquetado com o hash do conteúdo do caso (e do modelo
+    de embeddings): se o mesmo caso for simulado de novo (nesta ou em outra sessão), a versão
+    publicada é reaproveitada; se os dados do formulário mudarem, um novo índice é construído.
 
+    Args:
+        id_processo: Identificador do processo (gravado nos metadados dos chunks).
+        documento_caso_atual: Document gerado pelo formulário ou nome de um .docx em PATH_PROCESSO_EM_SI.
+        embeddings_model: Modelo de embeddings (o mesmo do índice de modelos, para scores comparáveis).
+
+    Returns:
+        O índice do caso ou None se não houver documento do caso.
+    """
+    documentos_caso: List[Document] = []
     if isinstance(documento_caso_atual, Document):
         # Garante que os metadados essenciais estejam presentes
         doc_metadata = documento_caso_atual.metadata or {}
         doc_metadata.update({"source_type": "processo_atual_formulario", "process_id": id_processo})
         documento_caso_atual.metadata = doc_metadata
-        todos_documentos.append(documento_caso_atual)
+        documentos_caso.append(documento_caso_atual)
         print(f"[RAG] Adicionado documento do caso atual (gerado por formulário) para ID '{id_processo}'.")
     elif isinstance(documento_caso_atual, str): # É um nome de arquivo .docx
         # Assume que o nome do arquivo é apenas o basename e precisa ser juntado com PATH_PROCESSO_EM_SI
         caminho_completo_processo = os.path.join(PATH_PROCESSO_EM_SI, documento_caso_atual)
-        todos_documentos.extend(
+        documentos_caso.extend(
             carregar_documentos_docx(caminho_completo_processo, "processo_atual_arquivo", id_processo_especifico=id_processo)
         )
-    
-    # Carrega modelos de petições e de juiz
-    todos_documentos.extend(carregar_documentos_docx(PATH_MODELOS_PETICOES, "modelo_peticao"))
-    todos_documentos.extend(carregar_documentos_docx(PATH_MODELOS_JUIZ, "modelo_juiz"))
-
-    if not todos_documentos:
-        msg = "ERRO RAG: Nenhum documento foi carregado para o índice. Verifique os modelos e o caso atual."
-        print(msg)
-        # raise ValueError(msg) # Ou retornar None e deixar o chamador decidir
-        return None
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    docs_divididos = text_splitter.split_documents(todos_documentos)
-    
+    docs_divididos = dividir_em_chunks(documentos_caso)
     if not docs_divididos:
-        msg = "ERRO RAG: Nenhum chunk gerado após a divisão dos documentos."
-        print(msg)
-        # raise ValueError(msg)
         return None
+    print(f"[RAG] Documento do caso '{id_processo}' dividido em {len(docs_divididos)} chunks.")
+    if len(docs_divididos) <= INDICE_NUMPY_MAX_CHUNKS:
+        return IndiceVetorialNumPy.de_documentos(docs_divididos, embeddings_model)
 
-    print(f"[RAG] Documentos divididos em {len(docs_divididos)} chunks.")
-    
+    hash_conteudo = hashlib.sha256(etiqueta_chunking(embeddings_model).encode("utf-8"))
+    for doc in docs_divididos:
+        hash_conteudo.update(doc.page_content.encode("utf-8"))
+    return obter_ou_construir_indice(
+        caminho_namespace_caso(id_processo),
+        embeddings_model,
+        lambda: FAISS.from_documents(docs_divididos, embeddings_model),
+        etiqueta=hash_conteudo.hexdigest()
+    )
+
+class RetrieverDuasCamadas(BaseRetriever):
+    """
+    Retriever que consulta o índice compartilhado de modelos e o índice em memória do caso.
+
+    Em cada camada são feitas duas buscas: vetorial (FAISS, mesmo modelo de embeddings nas duas
+    camadas, então as distâncias são comparáveis) e lexical (BM25, sem chamada de embeddings).
+    Os dois rankings são fundidos por Reciprocal Rank Fusion, o que favorece chunks com os termos
+    exatos da consulta ("saneamento", "art. 355"). A consulta é embedada uma única vez e o resultado
+    vetorial da camada de modelos é memorizado por (consulta, versão do índice, k, tipos de fonte).
+
+    Cada chamada pode pedir exatamente quantos chunks vai usar, restringir os tipos de fonte
+    (ex: o juiz só recebe 'modelo_juiz') e ligar o re-ranking MMR:
+        retriever.invoke(consulta, k=1, tipos_fonte=["modelo_juiz"], mmr=False)
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    camada_modelos: CamadaBusca
+    versao_indice_modelos: int = 0
+    camada_caso: Union[CamadaBusca, None] = None
+    embeddings_model: Embeddings
+    k: int = RETRIEVER_SEARCH_K
+    fetch_k: int = RETRIEVER_FETCH_K
+    hibrido: bool = RETRIEVER_HIBRIDO
+    mmr: bool = RETRIEVER_USAR_MMR
+    lambda_mmr: float = RETRIEVER_MMR_LAMBDA
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        k: Union[int, None] = None,
+        tipos_fonte: Union[List[str], None] = None,
+        mmr: Union[bool, None] = None
+    ) -> List[Document]:
+        return self.buscar(query, k=k, tipos_fonte=tipos_fonte, mmr=mmr)
+
+    def buscar(
+        self,
+        consulta: str,
+        k: Union[int, None] = None,
+        tipos_fonte: Union[List[str], None] = None,
+        mmr: Union[bool, None] = None
+    ) -> List[Document]:
+        """
+        Args:
+            consulta: Texto da consulta.
+            k: Quantidade de chunks retornados (padrão: self.k).
+            tipos_fonte: Se informado, só chunks com esses 'source_type' (filtro aplicado antes da busca).
+            mmr: Liga/desliga o re-ranking MMR nesta chamada (padrão: self.mmr).
+
+        Returns:
+            Até k Documents, do mais para o menos relevante.
+        """
+        k = k or self.k
+        usar_mmr = self.mmr if mmr is None else mmr
+        tipos = tuple(sorted(tipos_fonte)) if tipos_fonte else None
+        k_candidatos = max(k, self.fetch_k) if (self.hibrido or usar_mmr) else k
+        camadas = {"modelos": self.camada_modelos}
+        if self.camada_caso is not None:
+            camadas["caso"] = self.camada_caso
+
+        # Para as consultas fixas dos agentes, o vetor já está em memória (pré-computado).
+        vetor_consulta = self.embeddings_model.embed_query(consulta)
+        candidatos_vetoriais: List[Tuple[float, str, int]] = []
+        for nome_camada, camada in camadas.items():
+            if nome_camada == "modelos":
+                pares = _buscar_modelos_memorizado(camada, self.versao_indice_modelos, consulta, vetor_consulta, k_candidatos, tipos)
+            else:
+                pares = camada.buscar_vetorial(vetor_consulta, k_candidatos, tipos)
+            candidatos_vetoriais.extend((distancia, nome_camada, linha) for linha, distancia in pares)
+        # Distância L2: quanto menor, mais relevante. Chaves (camada, linha): linhas só são únicas por índice.
+        candidatos_vetoriais.sort(key=lambda item: item[0])
+        ranking = [(nome_camada, linha) for _, nome_camada, linha in candidatos_vetoriais]
+        relevancias = None
+
+        if self.hibrido:
+            candidatos_lexicais: List[Tuple[Tuple[str, int], float]] = []
+            for nome_camada, camada in camadas.items():
+                pares = camada.buscar_lexical(consulta, k_candidatos, tipos)
+                if not pares:
+                    continue
+                # BM25 depende das estatísticas de cada índice; normaliza pela maior pontuação da camada.
+                maior_pontuacao = pares[0][1] or 1.0
+                candidatos_lexicais.extend(((nome_camada, linha), pontuacao / maior_pontuacao) for linha, pontuacao in pares)
+            candidatos_lexicais.sort(key=lambda par: par[1], reverse=True)
+            fundidos = fundir_por_rrf([ranking, [chave for chave, _ in candidatos_lexicais]])
+            ranking = [chave for chave, _ in fundidos]
+            relevancias = np.array([pontuacao for _, pontuacao in fundidos])
+
+        if usar_mmr and len(ranking) > k:
+            ranking = ranking[:k_candidatos]
+            vetores = np.vstack([camadas[nome_camada].vetores([linha]) for nome_camada, linha in ranking])
+            if relevancias is not None:
+                relevancias = relevancias[:len(ranking)] / relevancias[0]
+            posicoes = _selecionar_mmr(vetor_consulta, vetores, k, self.lambda_mmr, relevancias)
+            ranking = [ranking[posicao] for posicao in posicoes]
+
+        # Só os chunks efetivamente retornados são lidos do docstore.
+        return [camadas[nome_camada].documento(linha) for nome_camada, linha in ranking[:k]]
+
+_ultima_coleta_indices = 0.0
+
+def _coletar_indices_expirados_periodicamente(intervalo_segundos: int = 600) -> None:
+    """Remove índices de casos expirados, no máximo uma vez a cada 'intervalo_segundos'."""
+    global _ultima_coleta_indices
+    if time.time() - _ultima_coleta_indices < intervalo_segundos:
+        return
+    _ultima_coleta_indices = time.time()
     try:
-        print(f"[RAG] Criando e salvando vector store FAISS em '{FAISS_INDEX_PATH}'.")
-        vector_store = FAISS.from_documents(docs_divididos, embeddings_model)
-        vector_store.save_local(FAISS_INDEX_PATH)
+        coletar_indices_expirados()
+    except OSError as e:
+        print(f"[RAG] Erro ao coletar índices expirados: {e}")
+
+def criar_ou_carregar_retriever(
+    id_processo: str,
+    documento_caso_atual: Union[str, Document, None] = None,
+    recriar_indice: bool = False
+) -> Union[RetrieverDuasCamadas, None]:
+    """
+    Monta o retriever de duas camadas para o processo.
+    O índice de modelos (comuns) é compartilhado pelo processo; o documento específico do
+    processo atual (se fornecido) vai para um índice pequeno em memória, só deste caso.
+
+    Args:
+        id_processo: Identificador do processo.
+        documento_caso_atual: Pode ser um objeto Document (gerado por formulários)
+                                ou uma string com o nome do arquivo .docx (para fallback).
+        recriar_indice: Força a recriação do índice de modelos compartilhado.
+
+    Returns:
+        Uma instância de RetrieverDuasCamadas ou None em caso de falha crítica.
+    """
+    # Chunks já embedados (modelos que não mudaram) vêm do cache em disco, sem chamada à API.
+    embeddings_model = obter_modelo_embeddings()
+    if embeddings_model is None:
+        print("ERRO RAG: Modelo de embeddings indisponível. Não é possível criar o índice.")
+        return None
+
+    _coletar_indices_expirados_periodicamente()
+
+    if obter_indice_modelos(embeddings_model, recriar_indice=recriar_indice) is None:
+        print("ERRO RAG: Índice de modelos indisponível. Verifique os modelos e os logs acima.")
+        return None
+    with _lock_indice_modelos: # Camada e versão da mesma publicação
+        camada_modelos, versao_indice_modelos = _camada_modelos, _versao_indice_modelos
+
+    try:
+        indice_caso = criar_indice_caso(id_processo, documento_caso_atual, embeddings_model)
     except Exception as e:
-        print(f"Erro fatal ao criar ou salvar FAISS: {e}")
-        # raise e # Ou retornar None
+        print(f"Erro ao criar índice do caso '{id_processo}': {e}")
         return None
 
-    print("[RAG] Retriever criado e índice salvo com sucesso!")
-    return vector_store.as_retriever(
-        search_kwargs={'k': RETRIEVER_SEARCH_K, 'fetch_k': RETRIEVER_FETCH_K}
+    print("[RAG] Retriever de duas camadas (modelos + caso) pronto!")
+    return RetrieverDuasCamadas(
+        camada_modelos=camada_modelos,
+        versao_indice_modelos=versao_indice_modelos,
+        camada_caso=CamadaBusca(indice_caso) if indice_caso is not None else None,
+        embeddings_model=embeddings_model,
+        k=RETRIEVER_SEARCH_K
     )
 
 if __name__ == '__main__':
@@ -225,9 +928,9 @@ if __name__ == '__main__':
         metadata={"source_type": "processo_formulario_streamlit", "file_name": "teste_form.txt"}
     )
     
-    print("\nTentando criar retriever (pode precisar da GOOGLE_API_KEY no .env)...")
-    # Certifique-se que GOOGLE_API_KEY está no seu .env para este teste funcionar
-    if GOOGLE_API_KEY:
+    print("\nTentando criar retriever (com EMBEDDING_BACKEND=google, precisa da GOOGLE_API_KEY no .env)...")
+    # Certifique-se que GOOGLE_API_KEY está no seu .env (ou use EMBEDDING_BACKEND=local) para este teste funcionar
+    if GOOGLE_API_KEY or EMBEDDING_BACKEND != "google":
         retriever = criar_ou_carregar_retriever(
             id_processo="teste_rag_utils_001",
             documento_caso_atual=documento_teste_formulario,
@@ -237,8 +940,10 @@ if __name__ == '__main__':
             print("Retriever criado com sucesso!")
             # Teste de busca (opcional)
             try:
-                relevant_docs = retriever.get_relevant_documents("qual o procedimento para petição inicial?")
+                relevant_docs = retriever.invoke("qual o procedimento para petição inicial?")
                 print(f"Busca por 'petição inicial' retornou {len(relevant_docs)} documentos.")
+                docs_juiz = retriever.invoke("decisão de saneamento", k=1, tipos_fonte=["modelo_juiz"], mmr=True)
+                print(f"Busca filtrada (modelo_juiz, k=1, MMR) retornou {len(docs_juiz)} documento(s).")
                 # for i, doc_ret in enumerate(relevant_docs):
                 # print(f"  Doc {i+1} (Fonte: {doc_ret.metadata.get('source_type', 'N/A')}, Arquivo: {doc_ret.metadata.get('file_name', 'N/A')})")
             except Exception as e_search:
@@ -246,6 +951,6 @@ if __name__ == '__main__':
         else:
             print("Falha ao criar o retriever.")
     else:
-        print("Pulando teste de criação de retriever pois GOOGLE_API_KEY não foi encontrada.")
+        print("Pulando teste de criação de retriever pois GOOGLE_API_KEY não foi encontrada (defina EMBEDDING_BACKEND=local para testar sem rede).")
 
     print("\n--- Fim dos Testes RAG Utils ---")
\ No newline at end of file
@@ -44,7 +44,7 @@ DATA_PATH = "simulacao_juridica_data"
 PATH_PROCESSO_EM_SI = os.path.join(DATA_PATH, "processo_em_si")
 PATH_MODELOS_PETICOES = os.path.join(DATA_PATH, "modelos_peticoes")
 PATH_MODELOS_JUIZ = os.path.join(DATA_PATH, "modelos_juiz")
-FAISS_INDEX_PATH = "faiss_index_juridico" # Pasta para salvar o índice FAISS
+FAISS_INDEX_PATH = "faiss_index_juridico" # Pasta raiz dos índices FAISS (um namespace para modelos e um por caso)
 
 # Nomes dos Nós do Grafo (Atores)
 ADVOGADO_AUTOR = "advogado_autor"
@@ -64,12 +64,125 @@ ETAPA_FIM_PROCESSO = "_FIM_PROCESSO_" # Etapa final especial
 # Modelos LLM
 GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
 EMBEDDING_MODEL_NAME = "models/embedding-001"
+# Backend de embeddings: "google" (API do Gemini) ou "local" (vetores de n-gramas com hash, sem rede;
+# determinístico, para rodar sem GOOGLE_API_KEY, em ambientes isolados e em testes de carga).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+EMBEDDING_LOCAL_DIMENSAO = 512
+EMBEDDING_LOCAL_NGRAMAS = (3, 5) # Tamanhos (mín., máx.) dos n-gramas de caracteres de cada palavra
 
 # Configurações de RAG
 CHUNK_SIZE = 2000
 CHUNK_OVERLAP = 300
-RETRIEVER_SEARCH_K = 5
-RETRIEVER_FETCH_K = 10
+CHUNKING_POR_SECOES = True # Um chunk por seção processual (DOS FATOS, RELATÓRIO...), ver divisor_secoes.py
+CHUNK_SECAO_MAX_CARACTERES = 6000 # Seções maiores são subdivididas em parágrafos
+CHUNK_SECAO_MIN_CARACTERES = 300 # Seções menores são unidas à anterior
+RETRIEVER_SEARCH_K = 3 # Com a busca híbrida, menos chunks bastam para trazer o trecho certo
+RETRIEVER_FETCH_K = 8 # Candidatos de cada busca (vetorial e lexical) antes da fusão
+RETRIEVER_HIBRIDO = True # Combina a busca vetorial (FAISS) com a lexical (BM25, ver busca_lexical.py)
+RETRIEVER_USAR_MMR = False # Re-rankeia os candidatos por MMR (diversidade); pode ser ligado por chamada
+RETRIEVER_MMR_LAMBDA = 0.5 # 1.0 = só relevância, 0.0 = só diversidade
+BM25_K1 = 1.5 # Saturação da frequência do termo
+BM25_B = 0.75 # Normalização pelo tamanho do chunk
+RRF_K = 60 # Constante da Reciprocal Rank Fusion (valores maiores suavizam o peso das primeiras posições)
+
+# Modelo completo de cada etapa (carregado inteiro e mantido em memória, sem busca vetorial).
+# Etapas fora deste mapa (ou com o arquivo ausente) recorrem à busca por CONSULTAS_MODELOS_RAG.
+MODELOS_POR_ETAPA = {
+    ETAPA_PETICAO_INICIAL: os.path.join(PATH_MODELOS_PETICOES, "modelo_peticao_inicial.docx"),
+    ETAPA_DESPACHO_RECEBENDO_INICIAL: os.path.join(PATH_MODELOS_JUIZ, "modelo_despacho_recebendo_inicial.docx"),
+    ETAPA_CONTESTACAO: os.path.join(PATH_MODELOS_PETICOES, "modelo_contestacao.docx"),
+    ETAPA_DECISAO_SANEAMENTO: os.path.join(PATH_MODELOS_JUIZ, "modelo_decisao_saneamento.docx"),
+    ETAPA_MANIFESTACAO_SEM_PROVAS_AUTOR: os.path.join(PATH_MODELOS_PETICOES, "modelo_manifestacao_sem_provas.docx"),
+    ETAPA_MANIFESTACAO_SEM_PROVAS_REU: os.path.join(PATH_MODELOS_PETICOES, "modelo_manifestacao_sem_provas.docx"),
+    ETAPA_SENTENCA: os.path.join(PATH_MODELOS_JUIZ, "modelo_sentenca.docx"),
+}
+
+# Consultas fixas usadas para buscar o modelo das etapas sem entrada em MODELOS_POR_ETAPA.
+# Como nunca mudam, seus vetores são pré-computados e os resultados memorizados (ver rag_utils.py).
+CONSULTAS_MODELOS_RAG = {
+    ETAPA_PETICAO_INICIAL: "modelo de petição inicial cível completa e bem estruturada",
+    ETAPA_DESPACHO_RECEBENDO_INICIAL: "modelo de despacho judicial cível recebendo petição inicial e determinando citação",
+    ETAPA_CONTESTACAO: "modelo de contestação cível completa e bem fundamentada",
+    ETAPA_DECISAO_SANEAMENTO: "modelo de decisão de saneamento e organização do processo cível",
+    ETAPA_SENTENCA: "modelo de sentença cível completa de mérito",
+}
+# Tipos de fonte (metadado 'source_type') que cada ator consulta: o juiz só recebe modelos de juiz.
+TIPOS_FONTE_POR_ATOR = {
+    ADVOGADO_AUTOR: ["modelo_peticao"],
+    ADVOGADO_REU: ["modelo_peticao"],
+    JUIZ: ["modelo_juiz"],
+}
+MAX_RESULTADOS_MEMORIZADOS = 256 # Buscas (consulta, versão do índice, k, filtro) memorizadas no índice de modelos
+
+# Cache persistente de embeddings (chave: hash do texto do chunk + nome do modelo)
+CACHE_DIR = ".cache_simulacao" # Pasta local para caches em disco
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024 # Acima disso, os vetores menos usados são despejados (LRU)
+
+# Agendador de embeddings (lotes, concorrência e limite de taxa nas chamadas à API)
+EMBEDDING_LOTE_MAX_TEXTOS = 100 # Limite de textos por requisição da API de embeddings do Gemini
+EMBEDDING_LOTE_MAX_CARACTERES = 200_000
+EMBEDDING_MAX_CONCORRENCIA = 4 # Lotes enviados em paralelo
+EMBEDDING_REQUISICOES_POR_MINUTO = 120
+EMBEDDING_MAX_TENTATIVAS = 5 # Por lote, com backoff exponencial entre as tentativas
+
+# Cache do texto extraído dos .docx (invalidado automaticamente por mtime/tamanho do arquivo)
+DOCX_CACHE_PATH = os.path.join(CACHE_DIR, "textos_docx.sqlite3")
+DOCX_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Tamanho comprimido
+
+# Cache de respostas do LLM (opt-in; chave: modelo + temperatura + hash do prompt renderizado).
+# Útil para repetir cenários conhecidos (demonstrações, retomadas após erro): a mesma entrada
+# devolve a mesma resposta, sem chamar a API. Desligado, cada chamada gera um texto novo.
+LLM_CACHE_ATIVO = os.getenv("LLM_CACHE_ATIVO", "false").lower() in ("1", "true", "sim")
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "respostas_llm.sqlite3")
+LLM_CACHE_MAX_BYTES = 128 * 1024 * 1024 # Tamanho comprimido
+
+# Limites das APIs do Google, compartilhados por todas as sessões do processo (ver limites_api.py).
+# Acima dos limites, as chamadas esperam na fila; erros transitórios (429, 5xx) são repetidos e,
+# após falhas seguidas, o disjuntor recusa chamadas por um tempo em vez de insistir.
+GEMINI_REQUISICOES_POR_MINUTO = int(os.getenv("GEMINI_REQUISICOES_POR_MINUTO", "15"))
+GEMINI_TOKENS_POR_MINUTO = int(os.getenv("GEMINI_TOKENS_POR_MINUTO", "1000000")) # Entrada + saída
+GEMINI_TOKENS_SAIDA_ESTIMADOS = 2048 # Reservados por chamada além do prompt (o excedente real é descontado depois)
+BUSCA_REQUISICOES_POR_MINUTO = int(os.getenv("BUSCA_REQUISICOES_POR_MINUTO", "60"))
+API_MAX_TENTATIVAS = 5 # Por chamada, com backoff exponencial + jitter
+API_FALHAS_PARA_ABRIR_CIRCUITO = 5 # Falhas transitórias seguidas até o disjuntor abrir
+API_SEGUNDOS_CIRCUITO_ABERTO = 60 # Tempo recusando chamadas antes da chamada de teste
+API_TIMEOUT_SEGUNDOS = float(os.getenv("API_TIMEOUT_SEGUNDOS", "90")) # Por tentativa; sem ele uma chamada presa na rede segura a sessão indefinidamente
+
+# Análises secundárias do LLM (ex: sentimento das peças), executadas em segundo plano enquanto
+# o grafo segue; os resultados são colhidos no fim da simulação (ver agent_helpers.py).
+LLM_ANALISES_TIMEOUT_SEGUNDOS = 120 # Espera máxima por análise ao colher os resultados
+
+# Histórico do processo nos prompts (ver historico_processual.py): cada ato guarda um resumo extrativo
+# limitado; os prompts recebem esses resumos (até o orçamento abaixo) e a íntegra só das peças que usam.
+RESUMO_ATO_MAX_CARACTERES = 800 # Por ato, calculado uma vez quando o ato é produzido
+HISTORICO_PROMPT_MAX_CARACTERES = 6000 # Resumos por prompt; atos mais antigos além disso ficam só com etapa e ator
+
+# Contabilidade de tokens das chamadas ao LLM (ver contabilidade_tokens.py)
+TOKENS_CODIFICACAO_TIKTOKEN = "cl100k_base" # Contagem quando a API não informa o uso (ex: respostas do cache)
+ORCAMENTO_TOKENS_POR_SIMULACAO = int(os.getenv("ORCAMENTO_TOKENS_POR_SIMULACAO", "0")) # Entrada + saída; 0 = sem limite
+
+# Armazenamento dos índices em disco (ver index_storage.py)
+INDICE_CASO_TTL_SEGUNDOS = 24 * 60 * 60 # Índices de casos não usados há mais tempo que isso são removidos
+INDICE_VERSOES_MANTIDAS = 2 # Versões publicadas mantidas por namespace (leitores da versão anterior não quebram)
+
+# Reindexação incremental dos modelos (ver template_watcher.py)
+INDEXADOR_MODELOS_ATIVO = True # Observa as pastas de modelos e atualiza o índice quando um .docx muda
+INDEXADOR_DEBOUNCE_SEGUNDOS = 2.0 # Agrupa eventos em rajada (ex: salvar no Word gera vários eventos)
+INDICE_MODELOS_SOMENTE_CARREGAR = False # True: o app só carrega o índice publicado por ingestao_modelos.py (nunca o constrói)
+INDICE_MODELOS_PACOTE_PATH = "pacote_indice_modelos" # Pacote pré-construído (ingestao_modelos.py --pacote), usado se o manifesto conferir
+INGESTAO_PROCESSOS = 0 # Processos que extraem e dividem os .docx na ingestão em lote (0 = um por núcleo)
+INGESTAO_LOTE_CHUNKS = 256 # Chunks enviados ao agendador de embeddings por vez durante a ingestão
+
+# Compressão do índice de modelos para acervos grandes (ver compressao_vetorial.py). O índice exato
+# continua em disco (aberto por mmap) e só é lido para re-rankear os candidatos do índice comprimido.
+INDICE_MODELOS_TIPO = "flat" # "flat" (só o exato), "sq8" (8 bits por dimensão, ~4x menor) ou "ivfpq" (IVF + PQ, ~8-32x menor)
+INDICE_COMPRIMIDO_MIN_CHUNKS = 10_000 # Abaixo disso não comprime (treino precisa de amostra grande e o ganho é irrelevante)
+INDICE_TREINO_AMOSTRA = 50_000 # Vetores sorteados para treinar o quantizador
+INDICE_IVF_NPROBE = 16 # Listas do IVF visitadas por busca (mais listas = mais recall, mais latência)
+INDICE_PQ_BYTES = 64 # Subquantizadores do PQ (bytes por vetor); se não dividir a dimensão, usa o mdc
+INDICE_RERANK_FATOR = 4 # k * fator candidatos re-rankeados com os vetores exatos (0 = sem re-ranking)
+INDICE_NUMPY_MAX_CHUNKS = 2_000 # Casos com até esse número de chunks usam busca exata em NumPy, só em memória (sem FAISS nem disco)
 
 # Configurações de UI (podem ser movidas para um ui_settings.py se crescerem muito)
 FORM_STEPS = [
@@ -0,0 +1,139 @@
+# template_watcher.py
+
+import os
+import threading
+from typing import List, Set, Union
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from settings import (
+    PATH_MODELOS_PETICOES,
+    PATH_MODELOS_JUIZ,
+    INDEXADOR_MODELOS_ATIVO,
+    INDEXADOR_DEBOUNCE_SEGUNDOS,
+    INDICE_MODELOS_SOMENTE_CARREGAR
+)
+from rag_utils import atualizar_modelos_incrementalmente
+
+
+def _eh_modelo_docx(caminho: str) -> bool:
+    nome = os.path.basename(caminho)
+    # "~$arquivo.docx" são os arquivos de trava que o Word cria enquanto o documento está aberto.
+    return nome.lower().endswith(".docx") and not nome.startswith("~$")
+
+
+class _TratadorEventosModelos(FileSystemEventHandler):
+    def __init__(self, indexador: "IndexadorModelos"):
+        super().__init__()
+        self.indexador = indexador
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.is_directory or event.event_type in ("opened", "closed_no_write"):
+            return
+        for caminho in (event.src_path, getattr(event, "dest_path", "")):
+            if caminho and _eh_modelo_docx(caminho):
+                self.indexador.agendar(caminho)
+
+
+class IndexadorModelos:
+    """
+    Observa as pastas de modelos e aplica ao índice apenas os .docx criados, alterados,
+    movidos ou removidos (ver rag_utils.atualizar_modelos_incrementalmente).
+
+    Eventos em rajada são agrupados: a atualização roda 'debounce_segundos' depois do último
+    evento, em uma thread própria, sem bloquear as simulações em andamento.
+    """
+
+    def __init__(self, pastas: List[str], debounce_segundos: float = INDEXADOR_DEBOUNCE_SEGUNDOS):
+        self.pastas = pastas
+        self.debounce_segundos = debounce_segundos
+        self._pendentes: Set[str] = set()
+        self._lock = threading.Lock()
+        self._timer: Union[threading.Timer, None] = None
+        self._observer: Union[Observer, None] = None
+
+    def agendar(self, caminho: str) -> None:
+        with self._lock:
+            self._pendentes.add(os.path.abspath(caminho))
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_segundos, self._processar)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _processar(self) -> None:
+        with self._lock:
+            caminhos = sorted(self._pendentes)
+            self._pendentes.clear()
+            self._timer = None
+        if not caminhos:
+            return
+        print(f"[INDEXADOR] {len(caminhos)} modelo(s) alterado(s): {[os.path.basename(c) for c in caminhos]}")
+        try:
+            atualizar_modelos_incrementalmente(caminhos)
+        except Exception as e:
+            print(f"[INDEXADOR] Erro ao atualizar o índice de modelos: {e}")
+
+    def iniciar(self) -> None:
+        if self._observer is not None:
+            return
+        tratador = _TratadorEventosModelos(self)
+        observer = Observer()
+        observer.daemon = True
+        for pasta in self.pastas:
+            if os.path.isdir(pasta):
+                observer.schedule(tratador, pasta, recursive=True)
+            else:
+                print(f"[INDEXADOR] Aviso: pasta de modelos '{pasta}' não encontrada; não será observada.")
+        observer.start()
+        self._observer = observer
+        print(f"[INDEXADOR] Observando pastas de modelos: {self.pastas}")
+
+    def parar(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+
+_indexador_modelos: Union[IndexadorModelos, None] = None
+_lock_indexador = threading.Lock()
+
+def iniciar_indexador_modelos() -> Union[IndexadorModelos, None]:
+    """
+    Inicia (uma vez por processo) o indexador das pastas de modelos, se habilitado em settings.py.
+    Com INDICE_MODELOS_SOMENTE_CARREGAR o índice é mantido por ingestao_modelos.py e o indexador não roda.
+    """
+    global _indexador_modelos
+    if not INDEXADOR_MODELOS_ATIVO or INDICE_MODELOS_SOMENTE_CARREGAR:
+        return None
+    with _lock_indexador:
+        if _indexador_modelos is None:
+            indexador = IndexadorModelos([PATH_MODELOS_PETICOES, PATH_MODELOS_JUIZ])
+            try:
+                indexador.iniciar()
+            except Exception as e:
+                print(f"[INDEXADOR] Não foi possível iniciar o observador de modelos: {e}")
+                return None
+            _indexador_modelos = indexador
+        return _indexador_modelos
+
+
+if __name__ == '__main__':
+    import time
+
+    print("--- Testando Template Watcher ---")
+    indexador = iniciar_indexador_modelos()
+    if indexador:
+        print("Altere, crie ou remova um .docx nas pastas de modelos (Ctrl+C para sair).")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            indexador.parar()
+    print("--- Fim dos Testes Template Watcher ---")
@@ -1,13 +1,12 @@
 # ui_components.py
 
 import streamlit as st
+import json
 import time
 from typing import  Union
 
 # LangChain Core (para gerar_conteudo_com_ia e rodar_simulacao_principal)
 from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import END
 
 # Nossos Módulos
@@ -20,10 +19,12 @@ from settings import (
     ETAPA_MANIFESTACAO_SEM_PROVAS_REU, ETAPA_SENTENCA, ETAPA_FIM_PROCESSO,
     # Adicione outras constantes de etapa se usadas diretamente aqui
 )
-from llm_models import llm # Para gerar_conteudo_com_ia e judicial_features
+from llm_models import llm, CircuitoAbertoError # Para gerar_conteudo_com_ia, judicial_features e rodar_simulacao_principal
+from agent_helpers import criar_prompt_e_chain, coletar_analises_em_segundo_plano, descartar_analises_em_segundo_plano # Para gerar_conteudo_com_ia e rodar_simulacao_principal
 from rag_utils import criar_ou_carregar_retriever # Para rodar_simulacao_principal
 from graph_definition import app, EstadoProcessual # Para rodar_simulacao_principal
 from judicial_features import gerar_ementa_cnj_padrao, verificar_sentenca_com_jurisprudencia
+from contabilidade_tokens import consumo_do_processo, consumo_em_csv, reiniciar_consumo, OrcamentoTokensExcedidoError
 
 # --- Funções da UI Streamlit ---
 
@@ -97,10 +98,8 @@ def gerar_conteudo_com_ia(
         return
     try:
         with st.spinner(f"Gerando conteúdo para '{campo_formulario_display}' com IA..."):
-            # Reutiliza a lógica de criar_prompt_e_chain, que já tem o LLM
-            # Se criar_prompt_e_chain não estivesse em agent_helpers, seria definida aqui.
-            prompt = ChatPromptTemplate.from_template(prompt_template_str)
-            chain = prompt | llm | StrOutputParser() # llm importado de llm_models
+            # Mesma cadeia dos agentes (inclui o cache de respostas, se ativo)
+            chain = criar_prompt_e_chain(prompt_template_str)
             conteudo_gerado = chain.invoke(campos_prompt)
 
             if sub_chave_lista is not None and indice_lista is not None and chave_estado_form_data == "documentos_autor":
@@ -518,12 +517,12 @@ Dos Pedidos:\n{dados_coletados.get('pedidos')}
     retriever_do_caso = None
     placeholder_rag = st.empty() 
     with placeholder_rag.status("⚙️ Inicializando sistema RAG...", expanded=True):
-        st.write("Carregando modelos e criando índice vetorial com dados do caso...")
+        st.write("Carregando índice de modelos e indexando os dados do caso...")
         try:
+            # O índice de modelos é compartilhado (já aquecido); só o documento do caso é indexado aqui.
             retriever_do_caso = criar_ou_carregar_retriever(
                 dados_coletados.get('id_processo',''), 
-                documento_caso_atual=documento_do_caso_atual, 
-                recriar_indice=True # Sempre recria para garantir que os dados do formulário atual sejam usados
+                documento_caso_atual=documento_do_caso_atual
             )
             if retriever_do_caso:
                 st.write("✅ Retriever RAG pronto!")
@@ -546,6 +545,8 @@ Dos Pedidos:\n{dados_coletados.get('pedidos')}
     time.sleep(1.5) 
     placeholder_rag.empty()
 
+    # Nova execução do mesmo caso: consumo (e orçamento de tokens) contados do zero
+    reiniciar_consumo(dados_coletados.get('id_processo',''))
     estado_inicial = EstadoProcessual(
         id_processo=dados_coletados.get('id_processo',''),
         retriever=retriever_do_caso,
@@ -557,7 +558,8 @@ Dos Pedidos:\n{dados_coletados.get('pedidos')}
         dados_formulario_entrada=dados_coletados,
         documentos_juntados_pelo_reu=None,
         sentimento_peticao_inicial=None,
-        sentimento_contestacao=None
+        sentimento_contestacao=None,
+        consumo_llm=None
     )
 
     st.subheader("⏳ Acompanhamento da Simulação:")
@@ -577,11 +579,35 @@ Dos Pedidos:\n{dados_coletados.get('pedidos')}
     passo_atual_simulacao = 0
     estado_final_simulacao = None
 
+    # Peça sendo redigida pelo nó atual: os trechos do LLM (eventos "custom" publicados por
+    # gerar_documento_em_fluxo) aparecem aqui antes do nó terminar e dão lugar ao passo concluído.
+    peca_em_andamento = None # (ator, etapa)
+    texto_em_andamento = ""
+    placeholder_em_andamento = None
+
     try:
-        for s_idx, s_event in enumerate(app.stream(input=estado_inicial, config={"recursion_limit": max_passos_simulacao})):
+        for modo_evento, s_event in app.stream(
+            input=estado_inicial,
+            config={"recursion_limit": max_passos_simulacao},
+            stream_mode=["updates", "custom"]
+        ):
+            if modo_evento == "custom":
+                chave_peca = (s_event.get("ator"), s_event.get("etapa"))
+                if chave_peca != peca_em_andamento:
+                    peca_em_andamento, texto_em_andamento = chave_peca, ""
+                    placeholder_em_andamento = steps_container.empty()
+                texto_em_andamento += s_event.get("trecho", "")
+                with placeholder_em_andamento.container(height=300, border=True):
+                    st.markdown(f"✍️ **{chave_peca[0]}** redigindo **{chave_peca[1]}**...")
+                    st.text(texto_em_andamento)
+                continue
+            if placeholder_em_andamento is not None:
+                placeholder_em_andamento.empty()
+                peca_em_andamento, placeholder_em_andamento = None, None
+
             passo_atual_simulacao += 1
             if not s_event or not isinstance(s_event, dict) or not list(s_event.keys()):
-                print(f"AVISO: Evento de stream inesperado ou vazio no passo {s_idx}: {s_event}")
+                print(f"AVISO: Evento de stream inesperado ou vazio no passo {passo_atual_simulacao}: {s_event}")
                 continue
 
             nome_do_no_executado = list(s_event.keys())[0]
@@ -633,17 +659,26 @@ Dos Pedidos:\n{dados_coletados.get('pedidos')}
         
         progress_bar_placeholder.progress(1.0, text="Simulação Concluída!")
         if estado_final_simulacao:
+            # Análises em segundo plano ainda não colhidas (ex: simulação interrompida antes da sentença)
+            estado_final_simulacao.update(coletar_analises_em_segundo_plano(dados_coletados.get('id_processo','')))
+            estado_final_simulacao["consumo_llm"] = consumo_do_processo(dados_coletados.get('id_processo',''))
             st.session_state.simulation_results[dados_coletados.get('id_processo','')] = estado_final_simulacao
             exibir_resultados_simulacao(estado_final_simulacao) # Chama a função de exibição
         else:
             st.warning("A simulação terminou, mas não foi possível obter o estado final completo.")
 
+    except CircuitoAbertoError as e_circuito:
+        st.warning(f"⏸️ Simulação interrompida: {e_circuito} Aguarde e tente novamente.")
+    except OrcamentoTokensExcedidoError as e_orcamento:
+        st.warning(f"💰 Simulação interrompida: {e_orcamento} Ajuste ORCAMENTO_TOKENS_POR_SIMULACAO se necessário.")
     except Exception as e_sim:
         st.error(f"ERRO INESPERADO DURANTE A EXECUÇÃO DA SIMULAÇÃO: {e_sim}")
         import traceback
         st.text_area("Stack Trace do Erro:", traceback.format_exc(), height=300)
     finally:
         progress_bar_placeholder.empty()
+        # Análises não colhidas (simulação interrompida por erro) não ficam presas no módulo
+        descartar_analises_em_segundo_plano(dados_coletados.get('id_processo',''))
 
 def exibir_resultados_simulacao(estado_final_simulacao: dict):
     """Exibe os resultados detalhados da simulação, incluindo linha do tempo e funcionalidades adicionais."""
@@ -670,6 +705,31 @@ def exibir_resultados_simulacao(estado_final_simulacao: dict):
             cols_sent[1].markdown("**Contestação:** Sentimento não analisado.")
         st.markdown("---")
 
+    # Consumo do LLM (inclui ementa/verificação da sentença geradas depois da simulação)
+    id_processo_consumo = estado_final_simulacao.get("id_processo", "")
+    consumo_llm = consumo_do_processo(id_processo_consumo) if id_processo_consumo else None
+    if not consumo_llm or not consumo_llm["totais"]["chamadas"]:
+        consumo_llm = estado_final_simulacao.get("consumo_llm")
+    if consumo_llm and consumo_llm["totais"]["chamadas"]:
+        totais = consumo_llm["totais"]
+        with st.expander(f"💰 Consumo do LLM: {totais['tokens_entrada'] + totais['tokens_saida']} tokens em {totais['chamadas']} chamada(s)"):
+            cols_consumo = st.columns(4)
+            cols_consumo[0].metric("Tokens de entrada", totais["tokens_entrada"])
+            cols_consumo[1].metric("Tokens de saída", totais["tokens_saida"])
+            cols_consumo[2].metric("Tempo no LLM (s)", totais["segundos"])
+            cols_consumo[3].metric("Respostas do cache", totais["respostas_do_cache"])
+            st.caption("Por nó e etapa (maior consumo primeiro):")
+            st.dataframe(consumo_llm["por_no_etapa"], use_container_width=True)
+            cols_exportar = st.columns(2)
+            cols_exportar[0].download_button(
+                "⬇️ Exportar chamadas (CSV)", consumo_em_csv(consumo_llm),
+                file_name=f"consumo_llm_{id_processo_consumo}.csv", mime="text/csv", key="ui_dl_consumo_csv"
+            )
+            cols_exportar[1].download_button(
+                "⬇️ Exportar consumo (JSON)", json.dumps(consumo_llm, ensure_ascii=False, indent=2),
+                file_name=f"consumo_llm_{id_processo_consumo}.json", mime="application/json", key="ui_dl_consumo_json"
+            )
+
     # Linha do Tempo Interativa
     if estado_final_simulacao and estado_final_simulacao.get("historico_completo"):
         st.markdown("#### Linha do Tempo Interativa do Processo")
@@ -785,7 +845,7 @@ def exibir_resultados_simulacao(estado_final_simulacao: dict):
             # Se o resultado ainda não foi calculado (primeiro rerun após clicar no botão)
             if st.session_state.verificacao_sentenca_resultado == "Processando verificação..." and sentenca_texto_completo:
                  with st.spinner("Buscando e analisando jurisprudência... Isso pode levar alguns instantes."):
-                    st.session_state.verificacao_sentenca_resultado = verificar_sentenca_com_jurisprudencia(sentenca_texto_completo)
+                    st.session_state.verificacao_sentenca_resultado = verificar_sentenca_com_jurisprudencia(sentenca_texto_completo, estado_final_simulacao.get("id_processo", "desconhecido"))
                     st.rerun() # Re-run para exibir o resultado calculado
             
             if st.session_state.verificacao_sentenca_resultado and st.session_state.verificacao_sentenca_resultado != "Processando verificação...":